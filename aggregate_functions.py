@@ -0,0 +1,230 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+
+# Marcos acompanhados: nome -> quantidade de doses aplicadas (1ª + 2ª dose)
+MARCOS = {
+    'doses_50M': 50000000,
+}
+# Janela (dias) das médias móveis
+JANELA = 7
+# Colunas de df_br que entram no hash de validação do histórico
+COLS_HASH = ['newDeaths', 'newCases', 'vaccinated', 'vaccinated_second']
+
+
+# --------------------------------------------------------------------------------------------
+# Funções de cálculo dos agregados
+# --------------------------------------------------------------------------------------------
+def _diario(df) -> 'DataFrame':
+    '''
+    Indexa os registros diários pela data e acrescenta as colunas derivadas (doses totais e médias móveis)
+    :param df: DataFrame df_br (transform_dfbr), contendo os dias a serem calculados e os JANELA - 1 dias anteriores
+    :return: Pandas DataFrame indexado pela data
+    '''
+
+    _df = df.copy()
+    _df.index = pd.DatetimeIndex(_df['date'], name=None)
+    _df['doses'] = _df['vaccinated'] + _df['vaccinated_second']
+    _df['1_dose_7d'] = _df['newVaccinated'].rolling(JANELA).mean()
+    _df['2_dose_7d'] = _df['newVaccinated_second'].rolling(JANELA).mean()
+
+    return _df
+
+
+def _periodo(diario, freq: str) -> 'DataFrame':
+    '''
+    Soma os casos e óbitos novos por período
+    :param diario: DataFrame diário (ver _diario)
+    :param freq: frequência do período: 'M' (mês) ou 'W-SAT' (semana epidemiológica)
+    :return: Pandas DataFrame indexado pelo início do período
+    '''
+
+    return diario.groupby(diario['date'].dt.to_period(freq)).agg({
+        'newDeaths': 'sum',
+        'newCases': 'sum'}).to_timestamp()
+
+
+def _historico(df_br, hwm) -> tuple:
+    '''
+    Resumo do histórico diário até a hwm, usado para verificar se os dias já agregados foram alterados: quantidade de
+    dias e hash (sha256) das datas e das colunas COLS_HASH de todos esses dias, na ordem em que aparecem. Com as datas
+    em ordem, o limite é obtido por busca binária
+    :param df_br: DataFrame df_br (transform_dfbr)
+    :param hwm: data mais recente já agregada
+    :return: (quantidade de dias até a hwm, hash do histórico)
+    '''
+
+    datas = df_br['date']
+    if datas.is_monotonic_increasing:
+        historico = df_br.iloc[:datas.searchsorted(hwm, side='right')]
+    else:
+        historico = df_br[datas <= hwm]
+
+    valores = historico[COLS_HASH].astype(float).assign(date=historico['date'])
+    h = hashlib.sha256(pd.util.hash_pandas_object(valores, index=False).values.tobytes())
+
+    return len(historico), h.hexdigest()
+
+
+def _marcos(diario, marcos: dict, anteriores: dict = None) -> dict:
+    '''
+    Procura a primeira data em que cada marco foi alcançado. Marcos já alcançados não são procurados novamente.
+    Também registra a data de início da vacinação ('inicio_vacinacao')
+    :param diario: DataFrame diário (ver _diario) com os dias a serem pesquisados
+    :param marcos: dicionário nome -> quantidade de doses
+    :param anteriores: marcos já encontrados
+    :return: dicionário nome -> data (AAAA-MM-DD) ou None, se ainda não alcançado
+    '''
+
+    encontrados = dict(anteriores or {})
+
+    if encontrados.get('inicio_vacinacao') is None:
+        vacinacao = diario.index[diario['vaccinated'].notna()]
+        encontrados['inicio_vacinacao'] = str(vacinacao[0].date()) if len(vacinacao) else None
+
+    for nome, valor in marcos.items():
+        if encontrados.get(nome) is None:
+            alcancado = diario.index[diario['doses'] >= valor]
+            encontrados[nome] = str(alcancado[0].date()) if len(alcancado) else None
+
+    return encontrados
+
+
+def build_aggregates(df_br, marcos: dict = MARCOS) -> dict:
+    '''
+    Calcula todos os agregados a partir do histórico completo
+    :param df_br: DataFrame df_br (transform_dfbr)
+    :param marcos: dicionário nome -> quantidade de doses (ver MARCOS)
+    :return: dicionário com 'diario', 'semanal', 'mensal' (DataFrames), 'marcos', 'hwm', 'linhas' e 'hash' (ver
+    _historico)
+    '''
+
+    diario = _diario(df_br)
+    linhas, hash_historico = _historico(df_br, diario.index.max())
+
+    return {
+        'diario': diario,
+        'semanal': _periodo(diario, 'W-SAT'),
+        'mensal': _periodo(diario, 'M'),
+        'marcos': _marcos(diario, marcos),
+        'hwm': str(diario.index.max().date()),
+        'linhas': linhas,
+        'hash': hash_historico,
+    }
+
+
+def update_aggregates(df_br, anterior: dict = None, marcos: dict = MARCOS) -> dict:
+    '''
+    Atualiza os agregados apenas com os dias posteriores aos já calculados. Se os dias já calculados tiverem sido
+    alterados (quantidade de dias ou hash do histórico - ver _historico), ou não houver agregados anteriores,
+    recalcula todo o histórico
+    :param df_br: DataFrame df_br (transform_dfbr)
+    :param anterior: agregados calculados anteriormente (ver build_aggregates)
+    :param marcos: dicionário nome -> quantidade de doses (ver MARCOS)
+    :return: dicionário com os agregados atualizados
+    '''
+
+    if anterior is None:
+        return build_aggregates(df_br, marcos)
+
+    hwm = pd.Timestamp(anterior['hwm'])
+    if _historico(df_br, hwm) != (anterior.get('linhas'), anterior['hash']):
+        return build_aggregates(df_br, marcos)
+
+    novos = df_br[df_br['date'] > hwm]
+    if len(novos) == 0 and set(marcos) <= set(anterior['marcos']):
+        return anterior
+
+    # as médias móveis dos novos dias precisam dos JANELA - 1 dias anteriores
+    base = pd.concat([anterior['diario'][df_br.columns].tail(JANELA - 1), novos])
+    diario = pd.concat([anterior['diario'], _diario(base).iloc[len(base) - len(novos):]])
+
+    # apenas o último período já agregado e os seguintes são recalculados
+    agregados = {'diario': diario}
+    for chave, freq in (('semanal', 'W-SAT'), ('mensal', 'M')):
+        inicio = anterior[chave].index.max()
+        agregados[chave] = pd.concat([anterior[chave][anterior[chave].index < inicio],
+                                      _periodo(diario[diario['date'] >= inicio], freq)])
+
+    agregados['marcos'] = _marcos(diario if len(novos) == 0 else diario.loc[hwm:], marcos, anterior['marcos'])
+    agregados['hwm'] = str(diario.index.max().date())
+    agregados['linhas'], agregados['hash'] = _historico(df_br, diario.index.max())
+
+    return agregados
+
+
+# --------------------------------------------------------------------------------------------
+# Armazenamento local dos agregados
+# --------------------------------------------------------------------------------------------
+def load_aggregates(dir_agregados: str) -> dict:
+    '''
+    Carrega os agregados armazenados
+    :param dir_agregados: diretório dos agregados
+    :return: dicionário com os agregados, ou None caso não existam
+    '''
+
+    try:
+        with open(os.path.join(dir_agregados, 'agregados.json')) as f:
+            agregados = json.load(f)
+        for chave in ('diario', 'semanal', 'mensal'):
+            agregados[chave] = pd.read_parquet(os.path.join(dir_agregados, f'{chave}.parquet'))
+    except (OSError, ValueError, ImportError):
+        return None
+
+    return agregados
+
+
+def save_aggregates(agregados: dict, dir_agregados: str):
+    '''
+    Grava os agregados em parquet, junto com um json contendo os marcos, a hwm e o resumo do histórico. O json é gravado
+    por último, de forma que uma gravação interrompida invalida os agregados
+    :param agregados: dicionário com os agregados (ver build_aggregates)
+    :param dir_agregados: diretório dos agregados
+    '''
+
+    os.makedirs(dir_agregados, exist_ok=True)
+    caminho_json = os.path.join(dir_agregados, 'agregados.json')
+    if os.path.exists(caminho_json):
+        os.remove(caminho_json)
+
+    for chave in ('diario', 'semanal', 'mensal'):
+        agregados[chave].to_parquet(os.path.join(dir_agregados, f'{chave}.parquet'))
+
+    with open(caminho_json, 'w') as f:
+        json.dump({chave: agregados[chave] for chave in ('marcos', 'hwm', 'linhas', 'hash')}, f)
+
+
+def aggregate_store(df_br, dir_agregados: str = None, logger=None) -> dict:
+    '''
+    Retorna os agregados de df_br, atualizando incrementalmente os armazenados em dir_agregados
+    :param df_br: DataFrame df_br (transform_dfbr)
+    :param dir_agregados: diretório dos agregados. Não sendo informado, calcula todo o histórico sem armazenar
+    :param logger: biblioteca para registrar os passos
+    :return: dicionário com os agregados (ver build_aggregates)
+    '''
+
+    if dir_agregados is None:
+        return build_aggregates(df_br)
+
+    anterior = load_aggregates(dir_agregados)
+    agregados = update_aggregates(df_br, anterior)
+
+    if agregados is not anterior:
+        try:
+            save_aggregates(agregados, dir_agregados)
+        except ImportError:
+            if logger is not None:
+                logger.warning('pyarrow não instalado - agregados não armazenados')
+
+    if logger is not None:
+        logger.info(f'agregados atualizados até {agregados["hwm"]} - marcos: {agregados["marcos"]}')
+
+    return agregados
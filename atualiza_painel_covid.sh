@@ -17,67 +17,48 @@ CAMINHO_ARQS_PAINEL='/var/www/html/sistema8dev/desenvolvedores/halissonsmb/paine
 CAMINHO_SCRIPT_PYTHON='/home/halissonsmb/painel-covid'
 
 # EXECUCAO DO SCRIPT PYTHON QUE GERA OS COMPONENTES DO PAINEL
+# COM --publica, APENAS PUBLICA OS ARQUIVOS JA GERADOS - USADO PELO MODO RESIDENTE DO SCRIPT PYTHON:
+# python graph_updates_covid19.py --residente --ao-atualizar "atualiza_painel_covid.sh --publica"
 ###############################################
-export PYTHON_BUILD_ARIA2_OPTS="-x 10 -k 1M"
-export PATH="/home/halissonsmb/.pyenv/bin:$PATH"
-eval "$(pyenv init --path)"
-eval "$(pyenv virtualenv-init -)"
-source /home/halissonsmb/.pyenv/versions/miniconda3-latest/etc/profile.d/conda.sh
-conda activate covid
-RESULTADO_EXECUCAO=`python $CAMINHO_SCRIPT_PYTHON/graph_updates_covid19.py`
-
-if [ "$RESULTADO_EXECUCAO" != "OK!" ];
+if [ "$1" != "--publica" ];
 then
-	echo -e '\033[41;10;1;4m Ocorreu um erro na execucao do script python \033[m'
-	echo -e '\033[40;40;1;6m favor verificar o arquivo gera_graficos_covid.log para maiores detalhes \033[m'
-	exit 1
+	export PYTHON_BUILD_ARIA2_OPTS="-x 10 -k 1M"
+	export PATH="/home/halissonsmb/.pyenv/bin:$PATH"
+	eval "$(pyenv init --path)"
+	eval "$(pyenv virtualenv-init -)"
+	source /home/halissonsmb/.pyenv/versions/miniconda3-latest/etc/profile.d/conda.sh
+	conda activate covid
+	RESULTADO_EXECUCAO=`python $CAMINHO_SCRIPT_PYTHON/graph_updates_covid19.py`
+
+	if [ "$RESULTADO_EXECUCAO" != "OK!" ];
+	then
+		echo -e '\033[41;10;1;4m Ocorreu um erro na execucao do script python \033[m'
+		echo -e '\033[40;40;1;6m favor verificar o arquivo gera_graficos_covid.log para maiores detalhes \033[m'
+		exit 1
+	fi
 fi
 
 ######################################################################################################
 # COPIA OS ARQUIVOS GERADOS PELO SCRIPT PYTHON PARA O DIRETÓRIO DOS AQUIVOS QUE IRÃO PARA A APLICAÇÃO
+# APENAS OS ARQUIVOS ALTERADOS NESTA EXECUCAO (LISTA GERADA PELO SCRIPT PYTHON EM alterados.txt)
+# OS INDICADORES (graficos/indicadores/kpis.json E OS SVG) JA SAO GERADOS COM OS VALORES ATUALIZADOS
 ######################################################################################################
-cp $CAMINHO_ARQS_SCRIPT/mapa* $CAMINHO_ARQS_PAINEL/graficos/
-cp $CAMINHO_ARQS_SCRIPT/leg-int/* $CAMINHO_ARQS_PAINEL/graficos/leg-int/
-cp $CAMINHO_ARQS_SCRIPT/../dt-atualizacao-painel-covid.json $CAMINHO_ARQS_PAINEL
+cp -n $CAMINHO_ARQS_SCRIPT/plotly-*.min.js $CAMINHO_ARQS_PAINEL/graficos/
+while read ARQUIVO;
+do
+	mkdir -p `dirname $CAMINHO_ARQS_PAINEL/$ARQUIVO`
+	cp $CAMINHO_SCRIPT_PYTHON/$ARQUIVO $CAMINHO_ARQS_PAINEL/$ARQUIVO
+done < $CAMINHO_ARQS_SCRIPT/alterados.txt
 
 ######################################################################################################
-# ATUALIZANDO OS INDICADORES QUE VÃO PARA O PAINEL
+# REMOVE DA APLICAÇÃO OS ARQUIVOS REMOVIDOS NESTA EXECUCAO (BLOCOS DO MAPA DE MUNICIPIOS QUE DEIXARAM DE
+# EXISTIR - LISTA GERADA PELO SCRIPT PYTHON EM removidos.txt)
 ######################################################################################################
-
-# TEMPO DE VACINACAO
-###############################################
-
-# CAPTURA O VALOR ATUALIZADO DA NOVA IMAGEM GERADA
-KPI_TEMPO_VAC="`grep -o '>\([0-9]\{3,\}\)<' $CAMINHO_ARQS_SCRIPT/indicadores/ind-tempo-vacinacao.svg | awk -F">|<" '{print $2}'`"
-
-# SUBSTITUI O VALOR ATUALIZADO NA IMAGEM QUE VAI PRO PAINEL
-sed -i 's/>\([0-9]\{3,\}\)</>'"$KPI_TEMPO_VAC"'</' $CAMINHO_ARQS_PAINEL/graficos/indicadores/ind-tempo-vacinacao.svg
-
-# QTD TOTAL DE VACINAS
-###############################################
-
-# CAPTURA O VALOR ATUALIZADO DA NOVA IMAGEM GERADA
-KPI_QTD_VAC="`grep -o '>\([0-9]\{2,\}\.[0-9]\{1,\}.\)<' $CAMINHO_ARQS_SCRIPT/indicadores/ind-qtd-vacinas.svg | awk -F">|<" '{print $2}'`"
-
-# SUBSTITUI O VALOR ATUALIZADO NA IMAGEM QUE VAI PRO PAINEL
-sed -i 's/>\([0-9]\{2,\}\.[0-9]\{1,\}.\)</>'"$KPI_QTD_VAC"'</' $CAMINHO_ARQS_PAINEL/graficos/indicadores/ind-qtd-vacinas.svg
-
-
-# 1a DOSE
-###############################################
-
-# CAPTURA O VALOR ATUALIZADO DA NOVA IMAGEM GERADA - TOTAL
-KPI_1DOSE=(`grep -oe '>\([0-9]\{2,\}\.[0-9]\{1,\}.\)<' -e '>▲\([0-9]\{1,\}\.[0-9]\{1,\}.\)<' $CAMINHO_ARQS_SCRIPT/indicadores/ind-qtd-1dose.svg | awk -F">|<" '{print $2}'`)
-
-# SUBSTITUI OS VALORES ATUALIZADOS NA IMAGEM QUE VAI PRO PAINEL
-sed -i 's/>\([0-9]\{2,\}\.[0-9]\{1,\}.\)</>'"${KPI_1DOSE[0]}"'</; s/>▲\([0-9]\{1,\}\.[0-9]\{1,\}.\)</>'"${KPI_1DOSE[1]}"'</' $CAMINHO_ARQS_PAINEL/graficos/indicadores/ind-qtd-1dose.svg
-
-
-# 2a DOSE
-###############################################
-
-# CAPTURA O VALOR ATUALIZADO DA NOVA IMAGEM GERADA - TOTAL
-KPI_2DOSE=(`grep -oe '>\([0-9]\{2,\}\.[0-9]\{1,\}.\)<' -e '>▲\([0-9]\{1,\}\.[0-9]\{1,\}.\)<' $CAMINHO_ARQS_SCRIPT/indicadores/ind-qtd-2dose.svg | awk -F">|<" '{print $2}'`)
-
-# SUBSTITUI OS VALORES ATUALIZADOS NA IMAGEM QUE VAI PRO PAINEL
-sed -i 's/>\([0-9]\{2,\}\.[0-9]\{1,\}.\)</>'"${KPI_2DOSE[0]}"'</; s/>▲\([0-9]\{1,\}\.[0-9]\{1,\}.\)</>'"${KPI_2DOSE[1]}"'</' $CAMINHO_ARQS_PAINEL/graficos/indicadores/ind-qtd-2dose.svg
+if [ -f $CAMINHO_ARQS_SCRIPT/removidos.txt ];
+then
+	while read ARQUIVO;
+	do
+		rm -f $CAMINHO_ARQS_PAINEL/$ARQUIVO
+	done < $CAMINHO_ARQS_SCRIPT/removidos.txt
+fi
+cp $CAMINHO_ARQS_SCRIPT/../dt-atualizacao-painel-covid.json $CAMINHO_ARQS_PAINEL
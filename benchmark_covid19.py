@@ -0,0 +1,454 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import plotly
+import data_functions as df_
+import graph_functions as gf
+import series_functions as sf
+import geo_functions as geo
+import kpi_functions as kp
+import memo_functions as memo
+import snapshot_functions as sn
+
+
+# Unidades da Federação: código IBGE, sigla, nome e região
+UFS = [
+    (11, 'RO', 'Rondônia', 'Norte'), (12, 'AC', 'Acre', 'Norte'), (13, 'AM', 'Amazonas', 'Norte'),
+    (14, 'RR', 'Roraima', 'Norte'), (15, 'PA', 'Pará', 'Norte'), (16, 'AP', 'Amapá', 'Norte'),
+    (17, 'TO', 'Tocantins', 'Norte'), (21, 'MA', 'Maranhão', 'Nordeste'), (22, 'PI', 'Piauí', 'Nordeste'),
+    (23, 'CE', 'Ceará', 'Nordeste'), (24, 'RN', 'Rio Grande do Norte', 'Nordeste'), (25, 'PB', 'Paraíba', 'Nordeste'),
+    (26, 'PE', 'Pernambuco', 'Nordeste'), (27, 'AL', 'Alagoas', 'Nordeste'), (28, 'SE', 'Sergipe', 'Nordeste'),
+    (29, 'BA', 'Bahia', 'Nordeste'), (31, 'MG', 'Minas Gerais', 'Sudeste'), (32, 'ES', 'Espírito Santo', 'Sudeste'),
+    (33, 'RJ', 'Rio de Janeiro', 'Sudeste'), (35, 'SP', 'São Paulo', 'Sudeste'), (41, 'PR', 'Paraná', 'Sul'),
+    (42, 'SC', 'Santa Catarina', 'Sul'), (43, 'RS', 'Rio Grande do Sul', 'Sul'),
+    (50, 'MS', 'Mato Grosso do Sul', 'Centro-Oeste'), (51, 'MT', 'Mato Grosso', 'Centro-Oeste'),
+    (52, 'GO', 'Goiás', 'Centro-Oeste'), (53, 'DF', 'Distrito Federal', 'Centro-Oeste'),
+]
+INICIO = '2020-02-25'
+# Fração do período anterior ao início da vacinação (na série real, 2021-01-17 é o 328º de 500 dias) - relativa à
+# quantidade de dias, para que séries curtas também tenham dias de vacinação
+FRACAO_PRE_VACINACAO = 0.65
+# Marca de doses aplicadas destacada no gráfico da evolução da vacinação
+MARCA_DOSES = 50000000
+
+
+# --------------------------------------------------------------------------------------------
+# Geradores de dados sintéticos
+# --------------------------------------------------------------------------------------------
+def gera_municipios(n_municipios: int = 5570, seed: int = 0) -> 'DataFrame':
+    '''
+    Gera a lista de municípios distribuídos entre as UFs, com código IBGE, população e coordenadas
+    :param n_municipios: quantidade de municípios
+    :param seed: semente do gerador de números aleatórios
+    :return: Pandas DataFrame com as colunas cod_uf, UF, ibgeID, nome, populacao, lat e lon
+    '''
+
+    rng = np.random.default_rng(seed)
+    uf = np.arange(n_municipios) % len(UFS)
+    seq = np.arange(n_municipios) // len(UFS)
+    cod_uf = np.array([u[0] for u in UFS])[uf]
+    ibge_id = cod_uf * 100000 + seq * 10 + 1
+
+    return pd.DataFrame({
+        'cod_uf': cod_uf,
+        'UF': np.array([u[1] for u in UFS])[uf],
+        'ibgeID': ibge_id,
+        'nome': [f'Município {i}' for i in ibge_id],
+        'populacao': rng.lognormal(9.5, 1.2, n_municipios).astype(np.int64) + 800,
+        'lat': rng.uniform(-33.7, 5.2, n_municipios),
+        'lon': rng.uniform(-73.9, -34.8, n_municipios),
+    })
+
+
+def gera_cities(municipios, n_dias: int, seed: int = 0) -> 'DataFrame':
+    '''
+    Gera a série temporal por município no layout do arquivo cases-brazil-cities-time.csv.gz (wcota), ordenada por data
+    :param municipios: DataFrame retornado por gera_municipios
+    :param n_dias: quantidade de dias da série
+    :return: Pandas DataFrame
+    '''
+
+    rng = np.random.default_rng(seed)
+    n_munic = len(municipios)
+    datas = pd.date_range(INICIO, periods=n_dias)
+    taxa = (municipios['populacao'].to_numpy() / 5000)[np.newaxis, :]
+
+    novos_casos = rng.poisson(taxa, (n_dias, n_munic))
+    novos_obitos = rng.binomial(novos_casos, 0.02)
+    casos = novos_casos.cumsum(axis=0)
+    obitos = novos_obitos.cumsum(axis=0)
+    pop = np.tile(municipios['populacao'].to_numpy(), n_dias)
+
+    return pd.DataFrame({
+        'epi_week': np.repeat(datas.isocalendar().week.to_numpy(), n_munic),
+        'date': np.repeat(datas.strftime('%Y-%m-%d').to_numpy(), n_munic),
+        'country': 'Brazil',
+        'state': np.tile(municipios['UF'].to_numpy(), n_dias),
+        'city': np.tile((municipios['nome'] + '/' + municipios['UF']).to_numpy(), n_dias),
+        'ibgeID': np.tile(municipios['ibgeID'].to_numpy(), n_dias),
+        'newDeaths': novos_obitos.ravel(),
+        'deaths': obitos.ravel(),
+        'newCases': novos_casos.ravel(),
+        'totalCases': casos.ravel(),
+        'deaths_per_100k_inhabitants': (obitos.ravel() / pop * 100000).round(5),
+        'totalCases_per_100k_inhabitants': (casos.ravel() / pop * 100000).round(5),
+        'deaths_by_totalCases': (obitos.ravel() / np.maximum(casos.ravel(), 1)).round(5),
+    })
+
+
+def gera_states(municipios, n_dias: int, seed: int = 0) -> 'DataFrame':
+    '''
+    Gera a série temporal por UF e para o Brasil (state == 'TOTAL') no layout do arquivo cases-brazil-states.csv (wcota)
+    :param municipios: DataFrame retornado por gera_municipios
+    :param n_dias: quantidade de dias da série
+    :return: Pandas DataFrame
+    '''
+
+    rng = np.random.default_rng(seed + 1)
+    datas = pd.date_range(INICIO, periods=n_dias)
+    siglas = [u[1] for u in UFS]
+    pop_uf = municipios.groupby('UF')['populacao'].sum().reindex(siglas).to_numpy()[np.newaxis, :]
+    n_uf = len(siglas)
+
+    novos_casos = rng.poisson(pop_uf / 5000, (n_dias, n_uf))
+    novos_obitos = rng.binomial(novos_casos, 0.02)
+    vacinando = (np.arange(n_dias) >= int(n_dias * FRACAO_PRE_VACINACAO))[:, np.newaxis]
+    novos_vac = np.where(vacinando, rng.poisson(pop_uf / 60, (n_dias, n_uf)), 0)
+    novos_vac2 = np.where(vacinando, rng.poisson(pop_uf / 150, (n_dias, n_uf)), 0)
+
+    # acrescenta a coluna do Brasil (soma das UFs)
+    def _com_total(m):
+        return np.hstack([m, m.sum(axis=1, keepdims=True)])
+
+    novos_casos, novos_obitos = _com_total(novos_casos), _com_total(novos_obitos)
+    novos_vac, novos_vac2 = _com_total(novos_vac), _com_total(novos_vac2)
+    pop = np.tile(np.append(pop_uf.ravel(), pop_uf.sum()), n_dias)
+    casos, obitos = novos_casos.cumsum(axis=0).ravel(), novos_obitos.cumsum(axis=0).ravel()
+    vac = np.where(np.repeat(vacinando.ravel(), n_uf + 1), novos_vac.cumsum(axis=0).ravel(), np.nan)
+    vac2 = np.where(np.repeat(vacinando.ravel(), n_uf + 1), novos_vac2.cumsum(axis=0).ravel(), np.nan)
+    n = n_uf + 1
+
+    return pd.DataFrame({
+        'epi_week': np.repeat(datas.isocalendar().week.to_numpy(), n),
+        'date': np.repeat(datas.strftime('%Y-%m-%d').to_numpy(), n),
+        'country': 'Brazil',
+        'state': np.tile(siglas + ['TOTAL'], n_dias),
+        'city': 'TOTAL',
+        'newDeaths': novos_obitos.ravel(),
+        'deaths': obitos,
+        'newCases': novos_casos.ravel(),
+        'totalCases': casos,
+        'deathsMS': (obitos * 0.98).astype(np.int64),
+        'totalCasesMS': (casos * 0.97).astype(np.int64),
+        'deaths_per_100k_inhabitants': (obitos / pop * 100000).round(5),
+        'totalCases_per_100k_inhabitants': (casos / pop * 100000).round(5),
+        'deaths_by_totalCases': (obitos / np.maximum(casos, 1)).round(5),
+        'recovered': (casos * 0.9).astype(np.int64),
+        'suspects': 0,
+        'tests': casos * 4,
+        'tests_per_100k_inhabitants': (casos * 4 / pop * 100000).round(5),
+        'vaccinated': vac,
+        'vaccinated_per_100_inhabitants': (vac / pop * 100).round(5),
+        'vaccinated_second': vac2,
+        'vaccinated_second_per_100_inhabitants': (vac2 / pop * 100).round(5),
+    })
+
+
+def gera_gps(municipios) -> 'DataFrame':
+    '''
+    Gera as coordenadas dos municípios no layout do arquivo gps_cities.csv (wcota)
+    '''
+
+    gps = municipios[['ibgeID', 'lat', 'lon']].copy()
+    gps.insert(1, 'id', gps['ibgeID'].astype(str))
+
+    return gps
+
+
+def gera_popmunic(municipios) -> dict:
+    '''
+    Gera o dicionário de DataFrames no layout retornado pelo pd.read_excel para o arquivo populacao_2020.xls do IBGE
+    (abas 'BRASIL E UFs' e 'Municípios', com skiprows=1 e skipfooter=7), incluindo as linhas de Brasil e Regiões, os
+    valores com notas entre () e o rodapé da aba de municípios
+    :param municipios: DataFrame retornado por gera_municipios
+    :return: dicionário de DataFrames
+    '''
+
+    pop_uf = municipios.groupby('UF')['populacao'].sum()
+    linhas = [('Brasil', pop_uf.sum())]
+    for regiao in dict.fromkeys(u[3] for u in UFS):
+        ufs = [u for u in UFS if u[3] == regiao]
+        linhas.append((f'Região {regiao}', sum(pop_uf[u[1]] for u in ufs)))
+        linhas += [(u[2], pop_uf[u[1]]) for u in ufs]
+    # algumas populações vêm como texto, com separador de milhar e referência a notas
+    linhas = [(nome, f'{pop:,}'.replace(',', '.') + '(4)' if i % 9 == 4 else pop) for i, (nome, pop) in enumerate(linhas)]
+
+    brasil_ufs = pd.DataFrame(linhas, columns=['BRASIL E UNIDADES DA FEDERAÇÃO', 'POPULAÇÃO ESTIMADA'])
+    brasil_ufs.insert(1, 'Unnamed: 1', np.nan)
+
+    pop = municipios['populacao'].astype(object)
+    pop[::97] = municipios['populacao'][::97].astype(str) + '(1)'
+    munic = pd.DataFrame({
+        'UF': municipios['UF'],
+        'COD. UF': municipios['cod_uf'].astype(float),
+        'COD. MUNIC': (municipios['ibgeID'] % 100000).astype(float),
+        'NOME DO MUNICÍPIO': municipios['nome'],
+        'POPULAÇÃO ESTIMADA': pop,
+    })
+    rodape = pd.DataFrame({'UF': [np.nan, 'Fonte: IBGE.', np.nan, 'Notas:'] + [f'({i}) Nota {i}' for i in range(1, 6)]})
+    munic = pd.concat([munic, rodape], ignore_index=True)
+
+    return {'BRASIL E UFs': brasil_ufs, 'Municípios': munic}
+
+
+def gera_geojson() -> dict:
+    '''
+    Gera um GeoJSON com um polígono (quadrado) por UF, com as propriedades SIGLA_UF e NM_UF
+    '''
+
+    features = []
+    for i, (_, sigla, nome, _) in enumerate(UFS):
+        x, y = -70 + (i % 6) * 5, -30 + (i // 6) * 6
+        features.append({
+            'type': 'Feature',
+            'properties': {'SIGLA_UF': sigla, 'NM_UF': nome},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[x, y], [x + 4, y], [x + 4, y + 5], [x, y + 5], [x, y]]]},
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def write_dataset(destino_dir: str, n_dias: int, n_municipios: int, seed: int = 0) -> dict:
+    '''
+    Grava os conjuntos de dados sintéticos em disco, nos mesmos formatos das origens
+    :param destino_dir: diretório onde os arquivos serão gravados
+    :param n_dias: quantidade de dias das séries temporais
+    :param n_municipios: quantidade de municípios
+    :return: dicionário com os caminhos dos arquivos e o dicionário de DataFrames da população (popmunic)
+    '''
+
+    municipios = gera_municipios(n_municipios, seed)
+    caminhos = {
+        'url_br': os.path.join(destino_dir, 'cases-brazil-states.csv'),
+        'url_cities': os.path.join(destino_dir, 'cases-brazil-cities-time.csv.gz'),
+        'url_gpscities': os.path.join(destino_dir, 'gps_cities.csv'),
+        'url_geojson_br': os.path.join(destino_dir, 'brasil-uf-compressed.json'),
+    }
+
+    gera_states(municipios, n_dias, seed).to_csv(caminhos['url_br'], index=False)
+    gera_cities(municipios, n_dias, seed).to_csv(caminhos['url_cities'], index=False, compression='gzip')
+    gera_gps(municipios).to_csv(caminhos['url_gpscities'], index=False)
+    with open(caminhos['url_geojson_br'], 'w') as f:
+        json.dump(gera_geojson(), f)
+
+    caminhos['popmunic'] = gera_popmunic(municipios)
+
+    return caminhos
+
+
+# --------------------------------------------------------------------------------------------
+# Medição dos estágios
+# --------------------------------------------------------------------------------------------
+def bench(func, repeticoes: int = 3) -> tuple:
+    '''
+    Executa uma função repetidas vezes e mede o tempo de cada execução
+    :param func: função sem argumentos a ser medida
+    :param repeticoes: quantidade de execuções
+    :return: (resultado da última execução, dict com os tempos 'min', 'media' e 'max' em segundos)
+    '''
+
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - t0)
+
+    return resultado, dict(min=min(tempos), media=sum(tempos) / len(tempos), max=max(tempos))
+
+
+def run_benchmarks(caminhos: dict, chunk_size: int = 50000, repeticoes: int = 3) -> dict:
+    '''
+    Mede, separadamente, a carga de cada conjunto de dados, cada transformação e cada builder de graph_functions
+    :param caminhos: retorno de write_dataset
+    :param chunk_size: quantidade de linhas por parte na carga do conjunto de dados dos municípios
+    :param repeticoes: quantidade de execuções de cada estágio
+    :return: dicionário cuja chave é o nome do estágio e o valor são os tempos medidos
+    '''
+
+    resultados = {}
+
+    def _mede(nome, func):
+        resultado, resultados[nome] = bench(func, repeticoes)
+        return resultado
+
+    # CARGA
+    raw_br = _mede('load_data.df_br', lambda: df_.load_data(caminhos['url_br'], date_f=['date'],
+                                                             schema=df_.SCHEMAS['states']))
+    raw_cities = _mede('load_data.df_cities', lambda: df_.load_data(
+        caminhos['url_cities'], date_f=['date'], compression='gzip', chunksize=chunk_size,
+        reduce_f=df_.reduce_latest_date, schema=df_.SCHEMAS['cities']))
+    raw_gps = _mede('load_data.df_gpscities', lambda: df_.load_data(caminhos['url_gpscities']))
+    geojson = _mede('load_data.gj_br', lambda: df_.load_data(caminhos['url_geojson_br'], tipo='json'))
+
+    # TRANSFORMAÇÃO
+    df_br = _mede('transform_dfbr', lambda: df_.transform_dfbr(
+        raw_br, cols=['date', 'state', 'newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases', 'totalCasesMS',
+                      'recovered', 'tests', 'vaccinated', 'vaccinated_second']))
+    _mede('split_states', lambda: df_.split_states(
+        raw_br, cols=['date', 'state', 'newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases', 'totalCasesMS',
+                      'recovered', 'tests', 'vaccinated', 'vaccinated_second']))
+    df_popuf = _mede('transform_popuf', lambda: df_.transform_popuf(
+        {aba: _df.copy() for aba, _df in caminhos['popmunic'].items()}))
+    df_cities = _mede('transform_dfcities', lambda: df_.transform_dfcities(raw_cities, raw_gps))
+    with tempfile.TemporaryDirectory() as dir_cache:
+        indice_geo = _mede('geo.load_geo_index', lambda: np.array(geo.load_geo_index(caminhos['url_gpscities'],
+                                                                                     dir_cache)))
+    _mede('transform_dfcities.geo_index', lambda: df_.transform_dfcities(raw_cities, indice_geo))
+    df_uf = _mede('transform_dfuf', lambda: df_.transform_dfuf(raw_br, df_popuf))
+    _mede('series.state_panel', lambda: sf.state_panel(raw_br, df_popuf))
+    with tempfile.TemporaryDirectory() as dir_snapshots:
+        frames = {'df_br': df_br, 'df_cities': df_cities, 'df_popuf': df_popuf, 'df_uf': df_uf}
+        # cada repetição grava uma nova versão (o diretório é esvaziado), para medir a exportação completa
+        _mede('snapshot.write_snapshots', lambda: sn.write_snapshots(frames, tempfile.mkdtemp(dir=dir_snapshots)))
+        sn.write_snapshots(frames, dir_snapshots)
+        _mede('snapshot.read_snapshot', lambda: {nome: sn.read_snapshot(dir_snapshots, nome) for nome in frames})
+    hist_cities = df_.load_data(caminhos['url_cities'], date_f=['date'], compression='gzip', chunksize=chunk_size,
+                                schema=df_.SCHEMAS['cities'])
+    _mede('series.city_panel', lambda: sf.city_panel(hist_cities))
+
+    # grafo das transformações de fetch_dataframes, com as cargas já prontas: todas as etapas no pool de threads, ou as
+    # transformações em um pool de processos (ver run_pipeline) - o ganho do pool de processos depende das CPUs
+    def _cargas():
+        return {'df_br': raw_br, 'df_cities': raw_cities, 'df_gpscities': raw_gps,
+                'df_popmunic': {aba: _df.copy() for aba, _df in caminhos['popmunic'].items()}}
+
+    etapas = dict({nome: dict(func=None, deps=[]) for nome in _cargas()}, **df_.transform_stages(por_uf=True))
+    with ThreadPoolExecutor() as threads, ProcessPoolExecutor() as processos:
+        for nome, pool in (('run_pipeline.transformacoes', None), ('run_pipeline.transformacoes.processos', processos)):
+            _mede(nome, lambda: asyncio.run(df_.run_pipeline(etapas, threads, logging.getLogger('benchmark'),
+                                                             _cargas(), pool)))
+
+    # GRÁFICOS - mesmos recortes usados em graph_updates_covid19.py
+    dv = df_br[~df_br['vaccinated'].isna()]
+    doses = df_br['vaccinated'] + df_br['vaccinated_second']
+    # com poucos municípios ou dias a marca pode não ser alcançada - usa o maior total de doses da série
+    df_50M = df_br.loc[doses >= min(MARCA_DOSES, doses.max())].iloc[0]
+    dias_50M = (df_50M['date'] - dv['date'].min()).days
+    agg_mes = df_br.groupby(df_br['date'].dt.to_period('M')).agg({'newDeaths': 'sum', 'newCases': 'sum'}).to_timestamp()
+    cut_labels = df_uf['faixa_perc'].unique().tolist()
+    dict_colors = {label: color for label, color in zip(cut_labels, ['#bff7ff', '#8fd1e3', '#3088AE', '#005073'])}
+
+    variantes_geo = _mede('geo.simplify_geojson', lambda: {nome: geo.simplify_geojson(geojson, tolerancia)
+                                                           for nome, tolerancia in geo.VARIANTES_GEO.items()})
+
+    kpis = _mede('kpi.compute_kpis', lambda: kp.compute_kpis(df_br))
+    _mede('kpi.kpi_svg', lambda: [kp.kpi_svg(indicador) for indicador in kpis['indicadores'].values()])
+
+    builders = {
+        'kpi_total_doses': lambda: gf.kpi_total_doses(df_br),
+        'kpi_total_1dose': lambda: gf.kpi_total_1dose(df_br),
+        'kpi_total_2dose': lambda: gf.kpi_total_2dose(df_br),
+        'kpi_qtd_dias_vac': lambda: gf.kpi_qtd_dias_vac(data_BR=df_br),
+        'graph_vaccines_doses_cum': lambda: gf.graph_vaccines_doses_cum(df_vac=dv, df_50M=df_50M, dias_50M=dias_50M,
+                                                                        compacto=True),
+        'graph_vaccination_by_day': lambda: gf.graph_vaccination_by_day(df_vac=dv, compacto=True),
+        'mapbox_cloropleth_percvac': lambda: gf.mapbox_cloropleth_percvac(data_UF=df_uf, geo_UF=geojson,
+                                                                          map_colors=dict_colors),
+        'mapbox_cloropleth_percvac.variantes': lambda: gf.mapbox_cloropleth_percvac(data_UF=df_uf,
+                                                                                    geo_UF=variantes_geo,
+                                                                                    map_colors=dict_colors),
+        'mapbox_cases_p100k': lambda: gf.mapbox_cases_p100k(df_cities=df_cities),
+        'mapbox_cases_p100k.agrupado': lambda: gf.mapbox_cases_p100k(df_cities=df_cities, agrupado=True),
+        'graph_active_cases_cum': lambda: gf.graph_active_cases_cum(df_br, compacto=True),
+        'graph_confirmed_cases_by_month': lambda: gf.graph_confirmed_cases_by_month(p_mes=agg_mes),
+        'graph_deaths_cum': lambda: gf.graph_deaths_cum(data_BR=df_br, compacto=True),
+        'graph_deaths_by_month': lambda: gf.graph_deaths_by_month(p_mes=agg_mes),
+    }
+    for nome, builder in builders.items():
+        # construção da figura e serialização (o que é gravado no html)
+        _mede(f'graph_functions.{nome}', lambda: memo.serialize_figure(builder()))
+
+    return resultados
+
+
+def compare(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    '''
+    Compara os tempos medidos com os de uma execução de referência (baseline)
+    :param resultados: tempos medidos (ver run_benchmarks)
+    :param baseline: tempos da execução de referência
+    :param tolerancia: razão máxima aceita entre o tempo medido e o de referência (ex: 1.2 = até 20% mais lento)
+    :return: lista com os nomes dos estágios que ficaram mais lentos que a tolerância
+    '''
+
+    regressoes = []
+    print(f'{"estágio":45} {"baseline":>10} {"atual":>10} {"razão":>7}')
+    for nome, tempos in resultados.items():
+        if nome not in baseline:
+            continue
+        razao = tempos['min'] / baseline[nome]['min'] if baseline[nome]['min'] > 0 else float('inf')
+        marca = ' <--' if razao > tolerancia else ''
+        print(f'{nome:45} {baseline[nome]["min"]:10.4f} {tempos["min"]:10.4f} {razao:7.2f}{marca}')
+        if razao > tolerancia:
+            regressoes.append(nome)
+
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark das etapas de carga, transformação e geração de gráficos '
+                                                 'com dados sintéticos (não requer acesso à rede)')
+    parser.add_argument('--dias', type=int, default=500, help='quantidade de dias das séries temporais')
+    parser.add_argument('--municipios', type=int, default=5570, help='quantidade de municípios')
+    parser.add_argument('--repeticoes', type=int, default=3, help='quantidade de execuções de cada estágio')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='linhas por parte na carga dos municípios')
+    parser.add_argument('--saida', default='benchmark.json', help='arquivo json com os resultados')
+    parser.add_argument('--baseline', help='arquivo json de uma execução anterior, para comparação')
+    parser.add_argument('--tolerancia', type=float, default=1.2, help='razão máxima aceita em relação ao baseline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminhos = write_dataset(tmp, args.dias, args.municipios)
+        resultados = run_benchmarks(caminhos, chunk_size=args.chunk_size, repeticoes=args.repeticoes)
+
+    registro = {
+        'meta': {
+            'data': '{:%d/%m/%Y %H:%M}'.format(datetime.now()),
+            'dias': args.dias,
+            'municipios': args.municipios,
+            'repeticoes': args.repeticoes,
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plotly': plotly.__version__,
+        },
+        'resultados': resultados,
+    }
+    with open(args.saida, 'w') as f:
+        json.dump(registro, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressoes = compare(resultados, json.load(f)['resultados'], args.tolerancia)
+        if regressoes:
+            print(f'{len(regressoes)} estágio(s) acima da tolerância: {", ".join(regressoes)}')
+            sys.exit(1)
+    else:
+        for nome, tempos in resultados.items():
+            print(f'{nome:45} {tempos["min"]:10.4f}')
@@ -7,71 +7,586 @@
 import pandas as pd
 import numpy as np
 import asyncio
+import io
+import os
+import gzip
+import json
+import shutil
+import hashlib
 from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
+from functools import partial
 import time
+from series_functions import state_panel, city_panel
+from geo_functions import build_geo_index, load_geo_index, load_geometry_variants, lookup
+from trace_functions import dataset_attributes, span
+from population_functions import ARGS_PLANILHA, load_population, normalize_population
+
+
+# --------------------------------------------------------------------------------------------
+# Esquemas de tipos dos conjuntos de dados
+# --------------------------------------------------------------------------------------------
+# usecols, dtype e parse_dates são repassados ao pd.read_csv; as colunas em 'inteiros' e 'decimais' são convertidas,
+# após a leitura, para os menores tipos numéricos que representam seus valores
+SCHEMAS = {
+    'states': dict(
+        usecols=['date', 'state', 'newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases', 'totalCasesMS',
+                 'recovered', 'tests', 'vaccinated', 'vaccinated_second'],
+        dtype={'state': 'category'},
+        parse_dates=['date'],
+        inteiros=['newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases', 'totalCasesMS', 'recovered', 'tests',
+                  'vaccinated', 'vaccinated_second'],
+    ),
+    'cities': dict(
+        usecols=['date', 'state', 'city', 'ibgeID', 'newDeaths', 'deaths', 'newCases', 'totalCases',
+                 'deaths_per_100k_inhabitants', 'totalCases_per_100k_inhabitants'],
+        dtype={'state': 'category', 'city': 'category'},
+        parse_dates=['date'],
+        inteiros=['ibgeID', 'newDeaths', 'deaths', 'newCases', 'totalCases'],
+        decimais=['deaths_per_100k_inhabitants', 'totalCases_per_100k_inhabitants'],
+    ),
+}
+
+
+def schema_read_kwargs(schema: dict) -> dict:
+    '''
+    Retorna os argumentos de leitura (pd.read_csv) de um esquema de tipos
+    :param schema: esquema de tipos (ver SCHEMAS)
+    :return: dicionário com os argumentos usecols, dtype e parse_dates
+    '''
+
+    return {chave: schema[chave] for chave in ('usecols', 'dtype', 'parse_dates') if chave in schema}
+
+
+def apply_schema(df, schema: dict) -> 'DataFrame':
+    '''
+    Converte as colunas numéricas de um DataFrame para os menores tipos que representam seus valores. Colunas inteiras
+    com valores faltantes permanecem como float. Colunas categóricas que perderam o tipo ao concatenar partes com
+    categorias diferentes voltam a ser categóricas.
+    :param df: DataFrame carregado com os argumentos de leitura do esquema
+    :param schema: esquema de tipos (ver SCHEMAS)
+    :return: Pandas DataFrame
+    '''
+
+    for col in schema.get('inteiros', []):
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in schema.get('decimais', []):
+        df[col] = pd.to_numeric(df[col], downcast='float')
+    for col, tipo in schema.get('dtype', {}).items():
+        if tipo == 'category' and df[col].dtype != 'category':
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def memory_report(data_url: str, schema: dict, nrows: int = None, **kwargs) -> 'DataFrame':
+    '''
+    Compara a memória ocupada por um conjunto de dados carregado com os tipos padrão e com o esquema de tipos
+    :param data_url: caminho completo do arquivo a ser carregado
+    :param schema: esquema de tipos (ver SCHEMAS)
+    :param nrows: quantidade de linhas a serem carregadas (None = todas)
+    :param kwargs: argumentos especificos para a carga do arquivo (pd.read_csv)
+    :return: Pandas DataFrame com os bytes ocupados por coluna antes ('padrao') e depois ('schema') e o total
+    '''
+
+    padrao = pd.read_csv(data_url, nrows=nrows, **kwargs)
+    enxuto = load_data(data_url, schema=schema, nrows=nrows, **kwargs)
+
+    relatorio = pd.DataFrame({
+        'padrao': padrao.memory_usage(index=False, deep=True),
+        'schema': enxuto.memory_usage(index=False, deep=True),
+    })
+    relatorio.loc['TOTAL'] = relatorio.sum()
+
+    return relatorio
 
 
 # --------------------------------------------------------------------------------------------
 # Função de carga de dados
 # --------------------------------------------------------------------------------------------
-def load_data(data_url: str, tipo: str = 'csv', date_f: list = [], **kwargs) -> 'DataFrame':
+def iter_chunks(data_url: str, tipo: str = 'csv', date_f: list = [], **kwargs) -> 'Iterator[DataFrame]':
+    '''
+    Função geradora que carrega um conjunto de dados tabular em partes (chunks), já com os campos de data convertidos
+    :param data_url: caminho completo do arquivo a ser carregado
+    :param tipo: tipo de arquivo: csv|txt etc
+    :param date_f: lista com os nomes dos campos a ser convertidos para datetime
+    :param kwargs: argumentos especificos para a carga do arquivo, deve conter o 'chunksize'
+    :return: gerador de Pandas DataFrames
+    '''
+
+    leitor = pd.read_csv if tipo == 'csv' else pd.read_table
+
+    for _df in leitor(data_url, **kwargs):
+        for dt_field in date_f:
+            _df[dt_field] = pd.to_datetime(_df[dt_field])
+        yield _df
+
+
+def reduce_latest_date(acumulado, chunk, campo: str = 'date') -> 'DataFrame':
+    '''
+    Função redutora para ser usada com o load_data, mantém apenas as linhas da data mais recente encontrada até o momento
+    :param acumulado: DataFrame resultante das partes anteriores (None na primeira parte)
+    :param chunk: DataFrame da parte atual
+    :param campo: nome do campo de data
+    :return: Pandas DataFrame
+    '''
+
+    dt_max = chunk[campo].max()
+    _df = chunk[chunk[campo] == dt_max].copy()
+
+    if acumulado is None or len(acumulado) == 0:
+        return _df
+
+    dt_acumulado = acumulado[campo].max()
+    if dt_acumulado > dt_max:
+        return acumulado
+    if dt_acumulado == dt_max:
+        return pd.concat([acumulado, _df])
+
+    return _df
+
+
+def load_data(data_url: str, tipo: str = 'csv', date_f: list = [], stream: bool = False, reduce_f=None,
+              schema: dict = None, **kwargs) -> 'DataFrame':
     '''
     Função para carregar um conjunto de dados
     :rtype: pd.Dataframe
     :param data_url: caminho completo do arquivo a ser carregado
     :param tipo: tipo de arquivo: csv|xls|xlsx|json etc
     :param date_f: lista com os nomes dos campos a ser convertidos para datetime
+    :param stream: se True (e informado o 'chunksize'), retorna um gerador com as partes do conjunto de dados
+    :param reduce_f: função (acumulado, chunk) -> DataFrame aplicada a cada parte à medida que é lida, evitando manter
+    todo o conjunto de dados em memória (ex: reduce_latest_date). Usada apenas quando informado o 'chunksize'
+    :param schema: esquema de tipos do conjunto de dados (ver SCHEMAS), apenas para os tipos csv/txt
     :param kwargs: argumentos especificos para a carga do arquivo, conforme o parametro 'tipo'
     :return: Pandas DataFrame
     '''
 
-    if tipo == 'csv':
-
-        if 'chunksize' in kwargs:
-
-            kwargs['iterator'] = True
-            data = pd.DataFrame()
-            _df_chunked = pd.read_csv(data_url, **kwargs)
-            for _df in _df_chunked:
-                data = data.append(_df)
-        else:
-            data = pd.read_csv(data_url, **kwargs)
+    if schema is not None:
+        kwargs.update(schema_read_kwargs(schema))
 
-    elif tipo == 'xls' or tipo == 'xlsx':
+    if tipo == 'xls' or tipo == 'xlsx':
 
         data = pd.read_excel(data_url, **kwargs)
 
     elif tipo == 'json':
 
-        import json
-
         with open(data_url) as f:
             data = json.load(f)
 
         return data
 
-    else:
-        if 'chunksize' in kwargs:
+    elif 'chunksize' in kwargs:
 
-            kwargs['iterator'] = True
-            data = pd.DataFrame()
-            _df_chunked = pd.read_table(data_url, **kwargs)
-            for _df in _df_chunked:
-                data = data.append(_df)
+        chunks = iter_chunks(data_url, tipo=tipo, date_f=date_f, **kwargs)
+
+        if stream:
+            return chunks if schema is None else (apply_schema(_df, schema) for _df in chunks)
+
+        if reduce_f is not None:
+            data = None
+            for _df in chunks:
+                data = reduce_f(data, _df)
         else:
-            data = pd.read_table(data_url, **kwargs)
+            # uma única concatenação ao final, em vez de copiar o DataFrame acumulado a cada parte
+            data = pd.concat(chunks)
+
+        # as datas já foram convertidas em cada parte
+        return data if schema is None else apply_schema(data, schema)
+
+    elif tipo == 'csv':
+
+        data = pd.read_csv(data_url, **kwargs)
+
+    else:
+
+        data = pd.read_table(data_url, **kwargs)
 
     for dt_field in date_f:
         data[dt_field] = pd.to_datetime(data[dt_field])
 
+    if schema is not None:
+        data = apply_schema(data, schema)
+
     return data
 
 
+# --------------------------------------------------------------------------------------------
+# Cache local (colunar) das séries temporais, com carga incremental
+# --------------------------------------------------------------------------------------------
+# Versão do formato dos metadados do cache - caches em formato anterior são reconstruídos
+FORMATO_CACHE = 3
+
+
+def _cache_meta(dir_cache: str) -> dict:
+    '''
+    Lê os metadados do cache de um conjunto de dados
+    :param dir_cache: diretório do cache do conjunto de dados
+    :return: dicionário com os metadados, ou None caso o cache não exista
+    '''
+
+    try:
+        with open(os.path.join(dir_cache, '_meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _grava_json(caminho: str, dados: dict):
+    '''
+    Grava um arquivo json de forma atômica (arquivo temporário + rename)
+    :param caminho: caminho do arquivo json
+    :param dados: dicionário a ser gravado
+    '''
+
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(dados, f)
+    os.replace(tmp, caminho)
+
+
+def _grava_parte(dir_cache: str, meta: dict, df, campo_data: str) -> dict:
+    '''
+    Grava uma nova parte (arquivo parquet) no cache e a registra nos metadados, com a quantidade de linhas e o intervalo
+    de datas da parte
+    :param dir_cache: diretório do cache do conjunto de dados
+    :param meta: metadados do cache
+    :param df: DataFrame com as linhas da nova parte
+    :param campo_data: nome do campo de data (já convertido para datetime)
+    :return: metadados atualizados
+    '''
+
+    nome_parte = f'part-{meta["sequencia"]:05d}.parquet'
+    df.reset_index(drop=True).to_parquet(os.path.join(dir_cache, nome_parte), index=False)
+    datas = _datas_str(df[campo_data])
+    meta['partes'].append({'arquivo': nome_parte, 'linhas': len(df), 'inicio': datas.min(), 'fim': datas.max()})
+    meta['sequencia'] += 1
+    meta['linhas'] += len(df)
+
+    return meta
+
+
+def _compacta(dir_cache: str, meta: dict, linhas_por_parte: int, max_pequenas: int) -> dict:
+    '''
+    Junta em uma única parte as partes pequenas (menos de linhas_por_parte linhas) do final do cache, criadas pelas
+    atualizações incrementais, quando elas chegam a max_pequenas. Os arquivos antigos só são removidos depois que os
+    metadados já apontam para a nova parte
+    :return: metadados atualizados
+    '''
+
+    pequenas = []
+    for parte in reversed(meta['partes']):
+        if parte['linhas'] >= linhas_por_parte:
+            break
+        pequenas.insert(0, parte)
+
+    if len(pequenas) < max_pequenas:
+        return meta
+
+    df = pd.concat([pd.read_parquet(os.path.join(dir_cache, p['arquivo'])) for p in pequenas], ignore_index=True)
+    nome_parte = f'part-{meta["sequencia"]:05d}.parquet'
+    df.to_parquet(os.path.join(dir_cache, nome_parte), index=False)
+    meta['partes'] = meta['partes'][:-len(pequenas)] + [{
+        'arquivo': nome_parte, 'linhas': len(df), 'inicio': pequenas[0]['inicio'], 'fim': pequenas[-1]['fim']}]
+    meta['sequencia'] += 1
+    _grava_json(os.path.join(dir_cache, '_meta.json'), meta)
+
+    for parte in pequenas:
+        os.remove(os.path.join(dir_cache, parte['arquivo']))
+
+    return meta
+
+
+def _datas_str(serie) -> 'Series':
+    '''
+    Retorna as datas de uma coluna (já convertida ou não para datetime) no formato AAAA-MM-DD
+    '''
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime('%Y-%m-%d')
+
+    return serie.astype(str)
+
+
+def _hash_datas(hashes: dict, df, datas, contagens: dict = None) -> dict:
+    '''
+    Acumula, por data, a soma dos hashes das linhas de uma parte da origem. Colunas numéricas entram como float64, para
+    que o hash não dependa do tipo inferido em cada parte (ex: inteiros que viram float na parte com valores faltantes).
+    Usado para detectar alterações no histórico já armazenado no cache.
+    :param hashes: dicionário data -> hash acumulado
+    :param df: DataFrame da parte lida da origem
+    :param datas: Series com as datas (str) de cada linha do df
+    :param contagens: dicionário data -> quantidade de linhas, também acumulado quando informado
+    :return: dicionário data -> hash acumulado
+    '''
+
+    numericas = [col for col, tipo in df.dtypes.items() if pd.api.types.is_numeric_dtype(tipo)]
+    normalizado = df.astype({col: np.float64 for col in numericas}) if numericas else df
+    # descarta os bits menos significativos para que a soma por data não ultrapasse o int64
+    h = pd.Series((pd.util.hash_pandas_object(normalizado, index=False).values >> np.uint64(20)).astype(np.int64),
+                  index=df.index)
+    for data, valor in h.groupby(datas.values).sum().items():
+        hashes[data] = (hashes.get(data, 0) + int(valor)) % 2 ** 63
+    if contagens is not None:
+        for data, qtd in datas.value_counts().items():
+            contagens[data] = contagens.get(data, 0) + int(qtd)
+
+    return hashes
+
+
+# Tamanho dos blocos lidos da origem no cálculo do hash do trecho anterior à janela final
+TAM_BLOCO = 1024 * 1024
+
+
+def _abre_origem(data_url: str, compression: str = None):
+    '''
+    Abre a origem de uma série temporal em modo binário, descomprimindo-a se necessário. Em arquivos gzip, seek/tell
+    usam as posições do conteúdo descomprimido
+    '''
+
+    return gzip.open(data_url, 'rb') if compression == 'gzip' else open(data_url, 'rb')
+
+
+def _corte(hwm: str, janela: int) -> str:
+    '''
+    Primeira data da janela final (últimos 'janela' dias até a hwm), cujas linhas são relidas a cada atualização
+    '''
+
+    return f'{pd.Timestamp(hwm) - pd.Timedelta(days=janela):%Y-%m-%d}'
+
+
+def _hash_trecho(f, inicio: int, fim: int):
+    '''
+    Hash (sha256) dos bytes [inicio, fim) de um arquivo aberto, lido em blocos de TAM_BLOCO
+    :return: objeto hashlib, que pode continuar a ser atualizado com os bytes seguintes
+    '''
+
+    h = hashlib.sha256()
+    f.seek(inicio)
+    restante = fim - inicio
+    while restante > 0:
+        bloco = f.read(min(TAM_BLOCO, restante))
+        if not bloco:
+            break
+        h.update(bloco)
+        restante -= len(bloco)
+
+    return h
+
+
+def _posiciona(meta: dict, data_url: str, compression: str, janela: int):
+    '''
+    Registra nos metadados a posição (em bytes) da origem onde começa a janela final e o hash de todo o histórico
+    anterior a ela (do fim do cabeçalho até essa posição). Exige as linhas da origem em ordem de data; caso contrário,
+    a janela passa a ser o arquivo inteiro
+    '''
+
+    corte = _corte(meta['hwm'], janela) if meta['ordenado'] else ''
+    linhas_antes = sum(qtd for data, qtd in meta['contagens'].items() if data < corte)
+
+    h = hashlib.sha256()
+    with _abre_origem(data_url, compression) as f:
+        f.readline()    # cabeçalho
+        for _ in range(linhas_antes):
+            h.update(f.readline())
+        offset = f.tell()
+
+    meta.update(corte=corte, offset=offset, impressao=h.hexdigest())
+
+
+def _build_cache(data_url: str, dir_cache: str, campo_data: str, chunk_size: int, linhas_por_parte: int, janela: int,
+                 **kwargs) -> dict:
+    '''
+    (Re)constrói o cache completo de um conjunto de dados, gravando as partes à medida que são lidas
+    :return: metadados do cache
+    '''
+
+    shutil.rmtree(dir_cache, ignore_errors=True)
+    os.makedirs(dir_cache)
+
+    with _abre_origem(data_url, kwargs.get('compression')) as f:
+        cabecalho = f.readline()
+
+    meta = {'formato': FORMATO_CACHE, 'data_url': data_url, 'hwm': None, 'linhas': 0, 'colunas': None, 'partes': [],
+            'sequencia': 0, 'hashes': {}, 'contagens': {}, 'ordenado': True, 'cabecalho': cabecalho.decode('utf-8'),
+            'inicio_dados': len(cabecalho)}
+    buffer = []
+    ultima = ''
+
+    for _df in iter_chunks(data_url, chunksize=chunk_size, **kwargs):
+        datas = _datas_str(_df[campo_data])
+        meta['hashes'] = _hash_datas(meta['hashes'], _df, datas, meta['contagens'])
+        meta['ordenado'] &= bool(datas.is_monotonic_increasing) and datas.iloc[0] >= ultima
+        ultima = datas.iloc[-1]
+        meta['colunas'] = _df.columns.to_list()
+        _df[campo_data] = pd.to_datetime(datas)
+        buffer.append(_df)
+        if sum(len(b) for b in buffer) >= linhas_por_parte:
+            meta = _grava_parte(dir_cache, meta, pd.concat(buffer), campo_data)
+            buffer = []
+
+    if buffer:
+        meta = _grava_parte(dir_cache, meta, pd.concat(buffer), campo_data)
+
+    if meta['hashes']:
+        meta['hwm'] = max(meta['hashes'])
+        _posiciona(meta, data_url, kwargs.get('compression'), janela)
+
+    _grava_json(os.path.join(dir_cache, '_meta.json'), meta)
+
+    return meta
+
+
+def _update_cache(data_url: str, dir_cache: str, meta: dict, campo_data: str, chunk_size: int, janela: int,
+                  **kwargs) -> dict:
+    '''
+    Atualiza o cache com as linhas posteriores à marca d'água (hwm). A origem não é relida por inteiro: a leitura começa
+    na posição da janela final (últimos 'janela' dias), registrada na atualização anterior. Para detectar reescrita do
+    histórico na origem, o cabeçalho, o hash dos bytes de todo o histórico anterior à janela (sem conversão) e os hashes
+    por data das linhas da janela são comparados com os armazenados
+    :return: metadados atualizados, ou None caso o histórico da origem tenha sido alterado
+    '''
+
+    compression = kwargs.pop('compression', None)
+
+    with _abre_origem(data_url, compression) as f:
+        if f.readline().decode('utf-8') != meta['cabecalho']:
+            return None
+        impressao = _hash_trecho(f, meta['inicio_dados'], meta['offset'])
+        if impressao.hexdigest() != meta['impressao']:
+            return None
+
+        # com a origem ordenada, a janela e as linhas novas são poucas e ficam em memória, para calcular a nova posição
+        cauda = f.read() if meta['ordenado'] else None
+        fonte = io.BytesIO(cauda) if meta['ordenado'] else f
+        nomes = pd.read_csv(io.StringIO(meta['cabecalho']), nrows=0).columns.to_list()
+
+        # apenas as linhas posteriores à hwm têm a data convertida; as demais só entram no cálculo dos hashes
+        hashes = {}
+        contagens = {}
+        novos = []
+        ultima = ''
+        for _df in pd.read_csv(fonte, header=None, names=nomes, chunksize=chunk_size, **kwargs):
+            if _df.columns.to_list() != meta['colunas']:
+                return None
+            datas = _datas_str(_df[campo_data])
+            hashes = _hash_datas(hashes, _df, datas, contagens)
+            if meta['ordenado'] and not (datas.is_monotonic_increasing and datas.iloc[0] >= ultima):
+                return None     # origem deixou de estar ordenada: o cache é reconstruído
+            ultima = datas.iloc[-1]
+            mask = datas > meta['hwm']
+            if mask.any():
+                novos.append(_df[mask])
+
+    if {data: h for data, h in hashes.items() if data <= meta['hwm']} != \
+            {data: h for data, h in meta['hashes'].items() if data >= meta['corte']}:
+        return None
+
+    if novos:
+        novos = pd.concat(novos)
+        novos[campo_data] = pd.to_datetime(novos[campo_data])
+        meta = _grava_parte(dir_cache, meta, novos, campo_data)
+        meta['hashes'].update({data: h for data, h in hashes.items() if data > meta['hwm']})
+        meta['contagens'].update({data: qtd for data, qtd in contagens.items() if data > meta['hwm']})
+        meta['hwm'] = max(meta['hashes'])
+
+        if meta['ordenado']:
+            # nova posição: avança as linhas da janela anterior que ficaram antes do novo corte
+            corte = _corte(meta['hwm'], janela)
+            linhas = cauda.splitlines(keepends=True)
+            n_antes = sum(qtd for data, qtd in contagens.items() if data < corte)
+            avanco = sum(len(linha) for linha in linhas[:n_antes])
+            # o hash do histórico é estendido com as linhas que saíram da janela, sem reler a origem
+            impressao.update(cauda[:avanco])
+            meta.update(corte=corte, offset=meta['offset'] + avanco, impressao=impressao.hexdigest())
+
+        _grava_json(os.path.join(dir_cache, '_meta.json'), meta)
+
+    return meta
+
+
+def load_incremental(data_url: str, nome: str, cache_dir: str, campo_data: str = 'date', chunk_size: int = 50000,
+                     linhas_por_parte: int = 1000000, reduce_f=None, schema: dict = None, logger=None, janela: int = 7,
+                     max_pequenas: int = 8, **kwargs) -> 'DataFrame':
+    '''
+    Função para carregar uma série temporal usando um cache local em parquet. O histórico já processado fica salvo em
+    partes no diretório 'cache_dir/nome', junto com a data mais recente armazenada (hwm) e a posição, na origem, dos
+    últimos dias armazenados. Nas execuções seguintes, só esses dias (para conferência) e as linhas posteriores são
+    convertidos, e só as linhas novas são acrescentadas ao cache; o histórico anterior é conferido apenas pelo hash dos
+    seus bytes. Se a origem reescrever qualquer parte do histórico, o cache é reconstruído por completo.
+    :param data_url: caminho completo do arquivo a ser carregado
+    :param nome: nome do conjunto de dados, usado como nome do diretório do cache
+    :param cache_dir: diretório raiz do cache
+    :param campo_data: nome do campo de data da série temporal (formato AAAA-MM-DD na origem)
+    :param chunk_size: quantidade de linhas por parte na leitura da origem
+    :param linhas_por_parte: quantidade de linhas por arquivo parquet na construção completa do cache
+    :param reduce_f: função (acumulado, chunk) -> DataFrame aplicada a cada parte do cache (ex: reduce_latest_date).
+    Não sendo informada, retorna todo o histórico. Com reduce_latest_date, só a parte com a data mais recente é lida
+    :param schema: esquema de tipos do conjunto de dados (ver SCHEMAS)
+    :param logger: biblioteca para registrar os passos da carga
+    :param janela: quantidade de dias, até a hwm, relidos e conferidos a cada atualização
+    :param max_pequenas: quantidade de partes pequenas (das atualizações incrementais) que, acumuladas no final do
+    cache, são juntadas em uma única parte
+    :param kwargs: argumentos especificos para a leitura da origem (pd.read_csv)
+    :return: Pandas DataFrame
+    '''
+
+    dir_cache = os.path.join(cache_dir, nome)
+    if schema is not None:
+        kwargs.update(schema_read_kwargs(schema))
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if logger is not None:
+            logger.warning(f'pyarrow não instalado - {nome} carregado sem cache')
+        data = load_data(data_url, date_f=[campo_data], chunksize=chunk_size, reduce_f=reduce_f, **kwargs)
+        return data if schema is None else apply_schema(data, schema)
+
+    # argumentos de leitura usados na construção do cache - se mudarem, o cache é reconstruído
+    leitura = repr(sorted(kwargs.items()))
+    meta = _cache_meta(dir_cache)
+
+    if meta is not None and meta.get('formato') == FORMATO_CACHE and meta['hwm'] is not None and \
+            meta['data_url'] == data_url and meta.get('leitura') == leitura:
+        meta = _update_cache(data_url, dir_cache, meta, campo_data, chunk_size, janela, **kwargs)
+        if meta is None and logger is not None:
+            logger.warning(f'histórico de {nome} alterado na origem - reconstruindo o cache')
+    else:
+        meta = None
+
+    if meta is None:
+        meta = _build_cache(data_url, dir_cache, campo_data, chunk_size, linhas_por_parte, janela, **kwargs)
+        meta['leitura'] = leitura
+        _grava_json(os.path.join(dir_cache, '_meta.json'), meta)
+
+    meta = _compacta(dir_cache, meta, linhas_por_parte, max_pequenas)
+
+    if logger is not None:
+        logger.info(f'cache de {nome} atualizado até {meta["hwm"]} - {meta["linhas"]} linhas em '
+                    f'{len(meta["partes"])} partes')
+
+    partes = meta['partes']
+    if reduce_f is reduce_latest_date:
+        # apenas as partes que contêm a data mais recente
+        partes = [parte for parte in partes if parte['fim'] == meta['hwm']]
+    partes = (pd.read_parquet(os.path.join(dir_cache, parte['arquivo'])) for parte in partes)
+
+    if reduce_f is not None:
+        data = None
+        for _df in partes:
+            data = reduce_f(data, _df)
+    else:
+        data = pd.concat(partes, ignore_index=True)
+
+    return data if schema is None else apply_schema(data, schema)
+
+
 # --------------------------------------------------------------------------------------------
 # Funções de Transformação dos dados
 # --------------------------------------------------------------------------------------------
-async def transform_dfbr(df, cols: list = []) -> 'DataFrame':
+# As funções transform_* são síncronas (executadas no pool do run_pipeline): chamadas que usavam 'await transform_...'
+# devem chamá-las diretamente, ou via loop.run_in_executor
+def transform_dfbr(df, cols: list = []) -> 'DataFrame':
     '''
     Função para transformar o DataFrame df_br, filtra os dados para o Brasil, seleciona colunas especificadas
     e adiciona novas colunas
@@ -86,75 +601,78 @@ async def transform_dfbr(df, cols: list = []) -> 'DataFrame':
     # Filtra os dados para o Brasil e seleciona colunas específicas
     _df_BR = df.query("state == 'TOTAL'")[colunas]
 
-    # cria novas colunas
-    _df_BR['activeCases'] = _df_BR['totalCases'] - _df_BR['deaths'] - _df_BR['recovered']
-    _df_BR['activeCasesMS'] = _df_BR['totalCasesMS'] - _df_BR['deathsMS'] - _df_BR['recovered']
-    _df_BR['activeCasesDiff'] = _df_BR['activeCases'] - _df_BR['activeCasesMS']
-    _df_BR['deathsDiff'] = _df_BR['deaths'] - _df_BR['deathsMS']
-    _df_BR['newVaccinated'] = _df_BR['vaccinated'].diff()
-    _df_BR['newVaccinated_second'] = _df_BR['vaccinated_second'].diff()
+    return _colunas_derivadas(_df_BR)
 
-    return _df_BR
 
+def _colunas_derivadas(_df) -> 'DataFrame':
+    '''
+    Cria as colunas derivadas de df_br (casos ativos, diferenças em relação ao MS e doses diárias) no recorte de uma
+    única série (Brasil ou UF)
+    '''
 
-async def transform_popuf(df_munic) -> 'DataFrame':
+    _df['activeCases'] = _df['totalCases'] - _df['deaths'] - _df['recovered']
+    _df['activeCasesMS'] = _df['totalCasesMS'] - _df['deathsMS'] - _df['recovered']
+    _df['activeCasesDiff'] = _df['activeCases'] - _df['activeCasesMS']
+    _df['deathsDiff'] = _df['deaths'] - _df['deathsMS']
+    _df['newVaccinated'] = _df['vaccinated'].diff()
+    _df['newVaccinated_second'] = _df['vaccinated_second'].diff()
+
+    return _df
+
+
+def split_states(df, cols: list = []) -> dict:
     '''
-    Função para transformar o DataFrame df_popmunic, trata o dado de POPULAÇÃO ESTIMADA e retonar outro dataframe
-    agregado por UF
-    :param df_munic: Dicionario de DataFrames com dados populacionais dos municípios e por UF
-    :return: Pandas DataFrame
+    Separa o DataFrame df_br em um recorte por UF, no mesmo formato do transform_dfbr, com um único groupby em vez de
+    um filtro por UF
+    :param df: dataframe com dados sobre a covid do Brasil e das UFs
+    :param cols: lista com os nomes das colunas que deverão conter nos recortes (ver transform_dfbr)
+    :return: dicionário cuja chave é a sigla da UF e o valor é o Pandas DataFrame da UF
     '''
 
-    # ---- Trata o DataFrame de População do Brasil e UFs ----
-    # Exclui uma coluna vazia e as linhas que contém a string 'Brasil' e 'Região'
-    pop_uf = df_munic['BRASIL E UFs'].drop(columns='Unnamed: 1').drop(
-        np.where(df_munic['BRASIL E UFs'].iloc[:, 0].str.contains('Brasil|Região', case=False))[0]
-    ).reset_index(drop=True)
+    colunas = cols if len(cols) > 0 else df.columns.to_list()
+    _df = df[df['state'] != 'TOTAL'][colunas]
 
-    # Trata os valores populacionais que contém referências entre ()
-    pop_uf['POPULAÇÃO ESTIMADA'] = pop_uf['POPULAÇÃO ESTIMADA'].apply(
-        lambda x: int(x.split('(')[0].replace('.', '')) if isinstance(x, str) else x)
+    return {str(uf): _colunas_derivadas(_df_uf.copy()) for uf, _df_uf in _df.groupby('state', observed=True)}
 
-    # Renomeia as colunas que sobraram
-    pop_uf.rename(columns={'BRASIL E UNIDADES DA FEDERAÇÃO': 'NM_UF', 'POPULAÇÃO ESTIMADA': 'POPULACAO'}, inplace=True)
 
-    # ---- Trata o DataFrame de População de Municípios ----
-    _pop_munic = df_munic['Municípios'].drop(index=df_munic['Municípios'].index[-9:])
-    _pop_munic['POPULAÇÃO ESTIMADA'] = _pop_munic['POPULAÇÃO ESTIMADA'].apply(lambda x: str(x).split('(')[0])
-    _pop_munic['POPULAÇÃO ESTIMADA'] = _pop_munic['POPULAÇÃO ESTIMADA'].astype(int)
+def transform_popuf(df_munic) -> 'DataFrame':
+    '''
+    Função para transformar o DataFrame df_popmunic, trata o dado de POPULAÇÃO ESTIMADA e retonar outro dataframe
+    agregado por UF
+    :param df_munic: Dicionario de DataFrames com dados populacionais dos municípios e por UF, ou as tabelas já
+    normalizadas (ver population_functions.load_population)
+    :return: Pandas DataFrame
+    '''
 
-    # Adciona a sigla da UF no DataFrame pop_uf baseado na populacao do DataFrame _pop_munic
-    pop_uf['UF'] = pop_uf['POPULACAO'].map(_pop_munic[['UF', 'POPULAÇÃO ESTIMADA']].groupby('UF')
-                                           .sum().reset_index().set_index('POPULAÇÃO ESTIMADA')['UF'])
+    # a limpeza dos valores e a identificação da sigla de cada UF (pelo código IBGE) ficam em population_functions
+    tabelas = df_munic if 'uf' in df_munic else normalize_population(df_munic)
 
-    return pop_uf
+    return tabelas['uf']
 
 
-async def transform_dfcities(df_cities, df_gps_cities) -> 'DataFrame':
+def transform_dfcities(df_cities, df_gps_cities) -> 'DataFrame':
     '''
     Função para transformar o DataFrame df_cities, acrescentando informações de latitude e longitude a partir do df_gps_cities
     :param df_cities: dataframe com dados de covid por município
-    :param df_gps_cities: dataframe com dados de coordenadas geográficas dos municípios
+    :param df_gps_cities: dataframe com dados de coordenadas geográficas dos municípios, ou o índice geográfico já
+    montado (ver geo_functions.load_geo_index)
     :return: Pandas DataFrame
     '''
 
     # filtra pela data mais recente
     _df = df_cities.query('date == @df_cities.date.max()').copy()
 
-    # removendo as linhas cujo campo ibgeID está faltando
-    _df_gps = df_gps_cities.dropna(subset=['ibgeID']).copy()
+    # índice geográfico ordenado pelo ibgeID - já carregado do cache (load_geo_index) ou montado a partir do dataframe
+    indice = df_gps_cities if isinstance(df_gps_cities, np.ndarray) else build_geo_index(df_gps_cities)
 
-    # convertendo o tipo da coluna ibeID do df_gps_cities para o mesmo tipo da coluna ibgeID do df_cities
-    _df_gps.loc[:, 'ibgeID'] = _df_gps['ibgeID'].astype(int)
-
-    # definindo as colunas 'lat' e 'lon' no df_cities com base no 'ibgeID' do df_gps_cities
-    _df['lat'] = _df.loc[:, 'ibgeID'].map(_df_gps.set_index('ibgeID').loc[:, 'lat'])
-    _df['lon'] = _df.loc[:, 'ibgeID'].map(_df_gps.set_index('ibgeID').loc[:, 'lon'])
+    # definindo as colunas 'lat' e 'lon' no df_cities com uma única busca pelo 'ibgeID'
+    for campo, valores in lookup(indice, _df['ibgeID'], campos=['lat', 'lon']).items():
+        _df[campo] = valores
 
     return _df
 
 
-async def transform_dfuf(df, df_popuf) -> 'DataFrame':
+def transform_dfuf(df, df_popuf) -> 'DataFrame':
     '''
     Função para transformar o DataFrame df_br, filtra os dados por UF e adiciona nova coluna de percentual
     da população vacinada de cada UF com base na informação de população do df_popuf
@@ -167,9 +685,10 @@ async def transform_dfuf(df, df_popuf) -> 'DataFrame':
     _df_UF = df.query("state != 'TOTAL' and date == @df['date'].max()").copy()
 
     # cria novas colunas
-    _df_UF['perc_vac'] = (_df_UF.loc[:, 'vaccinated'] / _df_UF.loc[:, 'state'].map(
-        df_popuf.set_index('UF').loc[:, 'POPULACAO'])) * 100
-    _df_UF['NM_UF'] = _df_UF.loc[:, 'state'].map(df_popuf.set_index('UF').loc[:, 'NM_UF'])
+    # a coluna 'state' pode ser categórica (ver SCHEMAS) - o map é feito sobre os valores
+    _uf = _df_UF.loc[:, 'state'].astype(str)
+    _df_UF['perc_vac'] = (_df_UF.loc[:, 'vaccinated'] / _uf.map(df_popuf.set_index('UF').loc[:, 'POPULACAO'])) * 100
+    _df_UF['NM_UF'] = _uf.map(df_popuf.set_index('UF').loc[:, 'NM_UF'])
 
     # Definindo faixa de valores de população vacinada por UF
     limite_inferior = int(round(_df_UF['perc_vac'].min(), 0))
@@ -188,10 +707,123 @@ async def transform_dfuf(df, df_popuf) -> 'DataFrame':
     return _df_UF
 
 
+# --------------------------------------------------------------------------------------------
+# Execução das etapas de carga e transformação conforme o grafo de dependências
+# --------------------------------------------------------------------------------------------
+async def run_pipeline(etapas: dict, executor, logger, prontos: dict = None, executor_transformacao=None) -> tuple:
+    '''
+    Executa um conjunto de etapas no executor informado, iniciando cada etapa assim que as etapas das quais ela depende
+    terminarem
+    :param etapas: dicionário cuja chave é o nome da etapa e o valor é um dict com 'func' (função a ser executada) e
+    'deps' (lista com os nomes das etapas cujos resultados são passados, na ordem, como argumentos da função) e,
+    opcionalmente, 'origem' (arquivo lido pela etapa, registrado no trace - ver trace_functions)
+    :param executor: ThreadPoolExecutor ou ProcessPoolExecutor onde as etapas são executadas
+    :param logger: biblioteca para registrar os passos e os tempos de cada etapa
+    :param prontos: dicionário com os resultados já conhecidos de algumas etapas, que não são executadas novamente
+    :param executor_transformacao: pool onde são executadas as etapas com dependências (transformações), ex: um
+    ProcessPoolExecutor, para que as transformações em pandas (limitadas pelo GIL) executem de fato em paralelo. As
+    funções, as entradas e os resultados dessas etapas precisam ser serializáveis (pickle). Não sendo informado, todas
+    as etapas são executadas em 'executor'
+    :return: resultados,    -> dicionário com o resultado de cada etapa
+            tempos          -> dicionário com o tempo de execução (s) de cada etapa
+    '''
+
+    loop = asyncio.get_running_loop()
+    inicio = time.perf_counter()
+    tarefas = {}
+    tempos = {}
+
+    prontos = prontos or {}
+
+    async def _executa(nome, etapa):
+        if nome in prontos:
+            logger.info(f'etapa {nome} reaproveitada da execução anterior')
+            return prontos[nome]
+        entradas = await asyncio.gather(*[tarefas[dep] for dep in etapa['deps']])
+        t0 = time.perf_counter()
+        pool = executor_transformacao if etapa['deps'] and executor_transformacao is not None else executor
+        with span(nome, 'transformacao' if etapa['deps'] else 'carga') as registro:
+            try:
+                resultado = await loop.run_in_executor(pool, partial(etapa['func'], *entradas))
+            except Exception as exc:
+                logger.error(f'{nome} generated an exception: {exc}')
+                raise
+            registro.update(dataset_attributes(resultado, etapa.get('origem')))
+        tempos[nome] = time.perf_counter() - t0
+        linhas = f' - {len(resultado)} linhas' if hasattr(resultado, '__len__') else ''
+        if hasattr(resultado, 'memory_usage'):
+            linhas += f', {resultado.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB'
+        logger.info(f'etapa {nome} finalizada{linhas} - início: {t0 - inicio:.3f}s, duração: {tempos[nome]:.3f}s')
+        return resultado
+
+    # as tarefas só começam a executar no primeiro await, quando todas já estão registradas em 'tarefas'
+    for nome, etapa in etapas.items():
+        tarefas[nome] = asyncio.ensure_future(_executa(nome, etapa))
+
+    try:
+        resultados = await asyncio.gather(*tarefas.values())
+    except BaseException:
+        # na primeira falha, as demais etapas são canceladas e aguardadas, para que as exceções delas (inclusive de
+        # outras falhas simultâneas) sejam recuperadas e não fiquem pendentes no loop
+        for tarefa in tarefas.values():
+            tarefa.cancel()
+        await asyncio.gather(*tarefas.values(), return_exceptions=True)
+        raise
+
+    return dict(zip(tarefas.keys(), resultados)), tempos
+
+
 # --------------------------------------------------------------------------------------------
 # Função para retornar os dataframes carregados e transformados
 # --------------------------------------------------------------------------------------------
-async def fetch_dataframes(url_br, url_cities, url_popmunic, url_gpscities, url_geojson_br, chunk_size, logger):
+# Colunas de df_br mantidas na transformação
+COLS_BR = ['date', 'state', 'newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases', 'totalCasesMS', 'recovered',
+           'tests', 'vaccinated', 'vaccinated_second']
+
+
+def transform_stages(por_uf: bool = False, historico_cities: bool = False, painel_uf: bool = False) -> dict:
+    '''
+    Etapas de transformação do grafo de fetch_dataframes (ver run_pipeline), que dependem das etapas de carga 'df_br',
+    'df_cities', 'df_gpscities' e 'df_popmunic'
+    :param por_uf: se True, inclui a separação do df_br por UF ('df_estados')
+    :param historico_cities: se True, inclui o painel de séries temporais dos municípios ('painel_cities')
+    :param painel_uf: se True, inclui o painel de séries temporais das UFs ('painel_uf')
+    :return: dicionário nome da etapa -> dict com 'func' e 'deps'
+    '''
+
+    etapas = {
+        'df_br_t': dict(func=partial(transform_dfbr, cols=COLS_BR), deps=['df_br']),
+        'df_cities_t': dict(func=transform_dfcities, deps=['df_cities', 'df_gpscities']),
+        'df_popuf': dict(func=transform_popuf, deps=['df_popmunic']),
+        'df_uf': dict(func=transform_dfuf, deps=['df_br', 'df_popuf']),
+    }
+    if painel_uf:
+        etapas['painel_uf'] = dict(func=state_panel, deps=['df_br', 'df_popuf'])
+    if por_uf:
+        etapas['df_estados'] = dict(func=partial(split_states, cols=COLS_BR), deps=['df_br'])
+    if historico_cities:
+        etapas['painel_cities'] = dict(func=city_panel, deps=['df_cities'])
+
+    return etapas
+
+
+def _assinatura(args: dict) -> str:
+    '''
+    Assinatura de uma etapa de carga: tamanho e data de modificação do arquivo de origem e argumentos da carga
+    '''
+
+    try:
+        origem = os.stat(args['data_url'])
+        origem = (origem.st_size, origem.st_mtime_ns)
+    except OSError:
+        origem = None
+
+    return repr((origem, sorted((chave, repr(valor)) for chave, valor in args.items() if chave != 'logger')))
+
+
+async def fetch_dataframes(url_br, url_cities, url_popmunic, url_gpscities, url_geojson_br, chunk_size, logger,
+                           cache_dir=None, historico_cities=False, memoria=None, por_uf=False, painel_uf=False,
+                           executor_transformacao=None):
     '''
 
     :param url_br: caminho do conjunto de dados sobre a covid referente ao Brasil e aos estados brasileiros
@@ -201,64 +833,97 @@ async def fetch_dataframes(url_br, url_cities, url_popmunic, url_gpscities, url_
     :param url_geojson_br: caminho do arquivo geojson do mapa geográfico brasileiro, dividido por UF
     :param chunk_size: quantidade de linhas por parte, usado para particionar o carregamento de DataFrames muito grandes
     :param logger: biblioteca para registrar os passos dos processamentos dos DatFrames
+    :param cache_dir: diretório do cache local das séries temporais (load_incremental). Não sendo informado, os
+    conjuntos de dados são carregados por completo a cada execução
+    :param historico_cities: se True, carrega todo o histórico dos municípios (e não apenas a data mais recente) e monta
+    o painel de séries temporais dos municípios (series_functions.city_panel)
+    :param memoria: dicionário mantido pelo chamador entre execuções (modo residente). Guarda os resultados de todas as
+    etapas e a assinatura (arquivo de origem e argumentos) de cada carga; na execução seguinte, as cargas cuja origem não
+    mudou, e as transformações que dependem apenas delas, são reaproveitadas em vez de executadas novamente
+    :param por_uf: se True, separa também o df_br em um recorte por UF (split_states), para os painéis por UF
+    :param painel_uf: se True, monta o painel de séries temporais das UFs (series_functions.state_panel). Nenhum gráfico
+    do painel o utiliza, por isso a etapa só é executada quando solicitada
+    :param executor_transformacao: pool de processos onde as etapas de transformação são executadas (ver run_pipeline).
+    Não sendo informado, todas as etapas executam no pool de threads. Só compensa com várias CPUs: as entradas e os
+    resultados de cada transformação são serializados entre os processos (ver benchmark_covid19,
+    'run_pipeline.transformacoes')
     :return: df_br,     -> DataFrame com dados de covid no Brasil transformado
             df_cities,  -> DataFrame com dados de covid nos municípios brasileiros transformado
             df_popuf,   -> DataFrame com dados populacionais por UF
-            df_uf       -> DataFrame com dados de covid agregados por UF e com percentual de vacinados por UF
+            df_uf,      -> DataFrame com dados de covid agregados por UF e com percentual de vacinados por UF
+            gj_br,      -> geojson do mapa do Brasil dividido por UF (com cache_dir, dicionário com as variantes
+                           simplificadas - ver geo_functions.load_geometry_variants)
+            paineis     -> dicionário com os painéis de séries temporais 'uf' (None se painel_uf for False) e 'cities'
+                           (None se historico_cities for False) - ver series_functions - e os recortes 'estados'
+                           (None se por_uf for False)
     '''
 
     # Dicionário cuja chave é o nome do Dataframe a ser carregado e o valor são os parâmetros a serem
     # passados para a função que irá carregar o DataFrame - load_data
     D_ARGS = {
-        'df_br': dict(data_url=url_br, date_f=['date']),
-        'df_cities': dict(data_url=url_cities, date_f=['date'], compression='gzip', chunksize=chunk_size),
-        'df_popmunic': dict(data_url=url_popmunic, tipo='xls', sheet_name=['BRASIL E UFs', 'Municípios'], skiprows=1,
-                            skipfooter=7),
+        'df_br': dict(data_url=url_br, date_f=['date'], schema=SCHEMAS['states']),
+        'df_cities': dict(data_url=url_cities, date_f=['date'], compression='gzip', chunksize=chunk_size,
+                          reduce_f=reduce_latest_date, schema=SCHEMAS['cities']),
+        'df_popmunic': dict(data_url=url_popmunic, tipo='xls', **ARGS_PLANILHA),
         'df_gpscities': dict(data_url=url_gpscities),
         'gj_br': dict(data_url=url_geojson_br, tipo='json'),
     }
 
-    # Inicializa o Dicionário que irá conter os DataFrames carregados
-    datasets = {}
-
-    logger.info('Iniciando carga de dados...')
-
-    # Marca o tempo de início da execução da carga
+    # Função de carga de cada DataFrame - load_data, exceto quando usado o cache local
+    D_LOADERS = {chave: load_data for chave in D_ARGS}
+
+    if cache_dir is not None:
+        D_ARGS['df_br'] = dict(data_url=url_br, nome='df_br', cache_dir=cache_dir, chunk_size=chunk_size,
+                               schema=SCHEMAS['states'], logger=logger)
+        D_ARGS['df_cities'] = dict(data_url=url_cities, nome='df_cities', cache_dir=cache_dir, chunk_size=chunk_size,
+                                   reduce_f=reduce_latest_date, schema=SCHEMAS['cities'], logger=logger,
+                                   compression='gzip')
+        D_LOADERS['df_br'] = D_LOADERS['df_cities'] = load_incremental
+        D_ARGS['df_gpscities'] = dict(data_url=url_gpscities, cache_dir=cache_dir)
+        D_LOADERS['df_gpscities'] = load_geo_index
+        D_ARGS['gj_br'] = dict(data_url=url_geojson_br, cache_dir=cache_dir)
+        D_LOADERS['gj_br'] = load_geometry_variants
+        D_ARGS['df_popmunic'] = dict(data_url=url_popmunic, cache_dir=cache_dir)
+        D_LOADERS['df_popmunic'] = load_population
+
+    if historico_cities:
+        del D_ARGS['df_cities']['reduce_f']
+
+    # Grafo de dependências das etapas de carga e transformação: cada etapa recebe, na ordem, os resultados das etapas
+    # listadas em 'deps' e inicia assim que eles estiverem disponíveis
+    ETAPAS = {chave: dict(func=partial(D_LOADERS[chave], **valor), deps=[], origem=valor['data_url'])
+              for chave, valor in D_ARGS.items()}
+    ETAPAS.update(transform_stages(por_uf=por_uf, historico_cities=historico_cities, painel_uf=painel_uf))
+
+    # etapas reaproveitadas da execução anterior: cargas com a mesma assinatura e etapas que só dependem delas
+    prontos = {}
+    if memoria is not None:
+        assinaturas = {chave: _assinatura(valor) for chave, valor in D_ARGS.items()}
+        anteriores = memoria.get('resultados', {})
+        for chave, etapa in ETAPAS.items():
+            if chave not in anteriores:
+                continue
+            if (chave in D_ARGS and memoria['assinaturas'].get(chave) == assinaturas[chave]) or \
+                    (etapa['deps'] and all(dep in prontos for dep in etapa['deps'])):
+                prontos[chave] = anteriores[chave]
+
+    logger.info('Iniciando carga e tratamento dos dados...')
+
+    # Marca o tempo de início da execução
     start = time.perf_counter()
 
-    # Execução paralela da carga de dados
+    # Execução paralela das etapas - o tempo total passa a ser o do caminho crítico do grafo
     with ThreadPoolExecutor() as executor:
+        datasets, tempos = await run_pipeline(ETAPAS, executor, logger, prontos, executor_transformacao)
 
-        # Inicia as tarefas de carga e atribui a cada tarefa o nome da chave correspondente a cada conjunto de dados
-        future_data_loader = {executor.submit(load_data, **valor): chave for chave, valor in D_ARGS.items()}
-
-        for task in as_completed(future_data_loader):
-
-            try:
-                datasets[future_data_loader[task]] = task.result()
-            except Exception as exc:
-
-                logger.error(f'{future_data_loader[task]} generated an exception: {exc}')
-            else:
-                logger.info(
-                    f'dataset {future_data_loader[task]} carregado - {len(datasets[future_data_loader[task]])} linhas')
-
-    logger.info(f'Carga de dados finalizada. Tempo de execução: {time.perf_counter() - start} ')
-
-    logger.info('Iniciando tratamento dos dados...')
+    if memoria is not None:
+        memoria.update(assinaturas=assinaturas, resultados=datasets)
 
-    # Marca o tempo de início da transformação dos dados
-    start = time.perf_counter()
-
-    df_br, df_cities, df_popuf = await asyncio.gather(
-        transform_dfbr(datasets['df_br'],
-                       cols=['date', 'state', 'newDeaths', 'deaths', 'deathsMS', 'newCases', 'totalCases',
-                             'totalCasesMS', 'recovered', 'tests', 'vaccinated', 'vaccinated_second']),
-        transform_dfcities(datasets['df_cities'], datasets['df_gpscities']),
-        transform_popuf(datasets['df_popmunic']),
-    )
-    df_uf = await transform_dfuf(datasets['df_br'], df_popuf)
+    logger.info(f'Carga e tratamento dos dados finalizados. Tempo de execução: {time.perf_counter() - start} '
+                f'(soma das etapas: {sum(tempos.values())})')
 
-    logger.info(f'Tratamento os dados finalizada. Tempo de execução: {time.perf_counter() - start} ')
+    paineis = {'uf': datasets.get('painel_uf'), 'cities': datasets.get('painel_cities'),
+               'estados': datasets.get('df_estados')}
 
-    return df_br, df_cities, df_popuf, df_uf, datasets['gj_br']
+    return (datasets['df_br_t'], datasets['df_cities_t'], datasets['df_popuf'], datasets['df_uf'], datasets['gj_br'],
+            paineis)
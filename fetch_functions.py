@@ -0,0 +1,189 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from trace_functions import span
+
+
+BLOCO = 1024 * 1024
+
+
+# --------------------------------------------------------------------------------------------
+# Funções auxiliares
+# --------------------------------------------------------------------------------------------
+def nova_sessao(conexoes: int = 10) -> 'requests.Session':
+    '''
+    Cria uma sessão HTTP com pool de conexões keep-alive, para ser compartilhada entre as requisições
+    :param conexoes: quantidade máxima de conexões mantidas por host
+    :return: requests.Session
+    '''
+
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=conexoes, pool_maxsize=conexoes, max_retries=3)
+    sessao.mount('http://', adapter)
+    sessao.mount('https://', adapter)
+
+    return sessao
+
+
+def sha256_arquivo(caminho: str) -> str:
+    '''
+    Calcula o hash SHA-256 de um arquivo local
+    :param caminho: caminho do arquivo
+    :return: hash em hexadecimal
+    '''
+
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(BLOCO), b''):
+            h.update(bloco)
+
+    return h.hexdigest()
+
+
+def _le_json(caminho: str) -> dict:
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _grava_json(caminho: str, dados: dict):
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(dados, f, indent=2)
+    os.replace(tmp, caminho)
+
+
+# --------------------------------------------------------------------------------------------
+# Funções de download condicional
+# --------------------------------------------------------------------------------------------
+def fetch_url(url: str, nome: str, destino_dir: str, sessao=None, timeout: int = 60) -> dict:
+    '''
+    Baixa um arquivo usando requisição condicional (If-None-Match / If-Modified-Since) e guarda uma cópia local junto
+    com os metadados ETag, Last-Modified e SHA-256. Caminhos locais não são baixados, apenas têm o hash calculado.
+    :param url: endereço (http/https) ou caminho local do arquivo
+    :param nome: nome do arquivo local
+    :param destino_dir: diretório onde ficam as cópias locais e os metadados
+    :param sessao: requests.Session compartilhada (ver nova_sessao)
+    :param timeout: tempo limite da requisição, em segundos
+    :return: dicionário com 'caminho' (arquivo local), 'sha256' e 'status' ('local', 'nao_modificado' ou 'baixado')
+    '''
+
+    if not url.startswith(('http://', 'https://')):
+        return {'caminho': url, 'sha256': sha256_arquivo(url), 'status': 'local'}
+
+    os.makedirs(destino_dir, exist_ok=True)
+    caminho = os.path.join(destino_dir, nome)
+    caminho_meta = caminho + '.meta.json'
+    meta = _le_json(caminho_meta) if os.path.exists(caminho) else {}
+
+    headers = {}
+    if meta.get('url') == url:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    sessao = sessao or requests
+    with sessao.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+
+        if resp.status_code == 304:
+            return {'caminho': caminho, 'sha256': meta['sha256'], 'status': 'nao_modificado'}
+
+        resp.raise_for_status()
+
+        # grava o conteúdo em arquivo temporário calculando o hash à medida que os bytes chegam
+        h = hashlib.sha256()
+        tmp = caminho + '.tmp'
+        with open(tmp, 'wb') as f:
+            for bloco in resp.iter_content(BLOCO):
+                h.update(bloco)
+                f.write(bloco)
+        os.replace(tmp, caminho)
+
+        meta = {
+            'url': url,
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'sha256': h.hexdigest(),
+        }
+
+    _grava_json(caminho_meta, meta)
+
+    return {'caminho': caminho, 'sha256': meta['sha256'], 'status': 'baixado'}
+
+
+def _fetch_url_trace(url: str, nome: str, destino_dir: str, sessao=None) -> dict:
+    '''
+    Executa fetch_url registrando a etapa de download no trace (ver trace_functions). Os bytes lidos são os do arquivo
+    baixado ou local; respostas 304 não leem nenhum byte
+    '''
+
+    with span(nome, 'download', url=url) as registro:
+        entrada = fetch_url(url, nome, destino_dir, sessao)
+        registro['status'] = entrada['status']
+        registro['bytes_lidos'] = 0 if entrada['status'] == 'nao_modificado' else os.path.getsize(entrada['caminho'])
+
+    return entrada
+
+
+def fetch_inputs(urls: dict, destino_dir: str, logger, sessao=None) -> dict:
+    '''
+    Baixa em paralelo, de forma condicional, todos os conjuntos de dados de entrada
+    :param urls: dicionário cuja chave é o nome do arquivo local e o valor é o endereço do conjunto de dados
+    :param destino_dir: diretório onde ficam as cópias locais e os metadados
+    :param logger: biblioteca para registrar os passos do download
+    :param sessao: requests.Session compartilhada. Não sendo informada, é criada uma nova
+    :return: dicionário cuja chave é o nome do arquivo local e o valor é o retorno de fetch_url
+    '''
+
+    sessao = sessao or nova_sessao(conexoes=len(urls))
+    entradas = {}
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+
+        future_fetch = {executor.submit(_fetch_url_trace, url, nome, destino_dir, sessao): nome for nome, url in urls.items()}
+
+        for task in as_completed(future_fetch):
+            entradas[future_fetch[task]] = task.result()
+            logger.info(f'entrada {future_fetch[task]}: {entradas[future_fetch[task]]["status"]}')
+
+    return entradas
+
+
+# --------------------------------------------------------------------------------------------
+# Controle das entradas já processadas
+# --------------------------------------------------------------------------------------------
+def inputs_changed(entradas: dict, arquivo_estado: str) -> list:
+    '''
+    Compara os hashes das entradas com os da última execução concluída com sucesso
+    :param entradas: retorno de fetch_inputs
+    :param arquivo_estado: arquivo json com os hashes da última execução concluída
+    :return: lista com os nomes das entradas alteradas (vazia se nenhuma entrada mudou)
+    '''
+
+    estado = _le_json(arquivo_estado)
+
+    return [nome for nome, entrada in entradas.items() if estado.get(nome) != entrada['sha256']]
+
+
+def save_inputs_state(entradas: dict, arquivo_estado: str):
+    '''
+    Registra os hashes das entradas processadas, ao final de uma execução concluída com sucesso
+    :param entradas: retorno de fetch_inputs
+    :param arquivo_estado: arquivo json com os hashes da última execução concluída
+    '''
+
+    os.makedirs(os.path.dirname(arquivo_estado) or '.', exist_ok=True)
+    _grava_json(arquivo_estado, {nome: entrada['sha256'] for nome, entrada in entradas.items()})
@@ -0,0 +1,432 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from fetch_functions import sha256_arquivo
+
+
+# Colunas de gps_cities.csv guardadas no índice geográfico dos municípios
+CAMPOS_GEO = ['lat', 'lon']
+# Propriedades do geojson das UFs usadas como chave de busca das geometrias (sigla e código IBGE)
+CHAVES_UF = ['SIGLA_UF', 'CD_UF']
+# Variantes simplificadas das geometrias das UFs: nome -> tolerância da simplificação (graus)
+VARIANTES_GEO = {'detalhada': 0.001, 'padrao': 0.005, 'leve': 0.02}
+# Fração da tolerância usada como passo da quantização das coordenadas
+PASSOS_POR_TOLERANCIA = 4
+# Níveis de agrupamento do mapa de municípios: zoom mínimo -> tamanho da célula da grade (graus). 0 = sem agrupamento
+NIVEIS_CLUSTER = {0: 1.0, 5: 0.25, 7: 0}
+# Tamanho (graus) dos blocos em que os níveis detalhados do agrupamento são divididos
+TAMANHO_TILE = 5.0
+
+
+# --------------------------------------------------------------------------------------------
+# Índice geográfico dos municípios, ordenado pelo código IBGE
+# --------------------------------------------------------------------------------------------
+def build_geo_index(df_gps_cities, campos: list = CAMPOS_GEO) -> 'ndarray':
+    '''
+    Monta o índice geográfico dos municípios: um array estruturado ordenado pelo ibgeID, com um campo para cada coluna
+    de atributos. Linhas sem ibgeID são descartadas e, havendo códigos repetidos, vale a primeira ocorrência
+    :param df_gps_cities: dataframe com dados de coordenadas geográficas dos municípios (gps_cities.csv)
+    :param campos: colunas de atributos guardadas no índice
+    :return: NumPy structured array com os campos 'ibgeID' e campos
+    '''
+
+    _df = df_gps_cities.dropna(subset=['ibgeID'])
+    ids, primeiras = np.unique(_df['ibgeID'].to_numpy(dtype=np.int64), return_index=True)
+
+    indice = np.empty(len(ids), dtype=[('ibgeID', np.int64)] + [(campo, np.float64) for campo in campos])
+    indice['ibgeID'] = ids
+    for campo in campos:
+        indice[campo] = _df[campo].to_numpy(dtype=np.float64)[primeiras]
+
+    return indice
+
+
+def load_geo_index(data_url: str, cache_dir: str, campos: list = CAMPOS_GEO) -> 'ndarray':
+    '''
+    Carrega o índice geográfico dos municípios a partir de um arquivo .npy mapeado em memória, identificado pelo hash da
+    origem. O arquivo só é reconstruído quando o conteúdo de gps_cities.csv muda
+    :param data_url: caminho local do gps_cities.csv
+    :param cache_dir: diretório raiz do cache
+    :param campos: colunas de atributos guardadas no índice
+    :return: NumPy structured array (memmap, somente leitura) - ver build_geo_index
+    '''
+
+    dir_geo = os.path.join(cache_dir, 'geo')
+    caminho = os.path.join(dir_geo, f'ibge-{sha256_arquivo(data_url)[:16]}.npy')
+
+    if not os.path.exists(caminho):
+        indice = build_geo_index(pd.read_csv(data_url), campos)
+        os.makedirs(dir_geo, exist_ok=True)
+        for antigo in glob.glob(os.path.join(dir_geo, 'ibge-*.npy')):
+            os.remove(antigo)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, indice)
+        os.replace(tmp, caminho)
+
+    return np.load(caminho, mmap_mode='r')
+
+
+def lookup(indice, ibgeids, campos: list = None) -> dict:
+    '''
+    Busca vetorizada (busca binária sobre o índice ordenado) dos atributos de vários municípios de uma só vez
+    :param indice: índice geográfico (ver build_geo_index)
+    :param ibgeids: sequência com os códigos IBGE dos municípios
+    :param campos: campos a serem retornados. Não sendo informado, retorna todos os campos de atributos do índice
+    :return: dicionário campo -> array com os valores, na ordem de ibgeids (NaN para códigos não encontrados)
+    '''
+
+    campos = campos or [campo for campo in indice.dtype.names if campo != 'ibgeID']
+    ids = pd.Series(ibgeids).fillna(-1).to_numpy(dtype=np.int64)
+    chaves = indice['ibgeID']
+
+    if len(chaves) == 0:
+        # índice vazio (ex: gps_cities sem linhas): nenhum código é encontrado
+        return {campo: np.full(len(ids), np.nan) for campo in campos}
+
+    pos = np.minimum(np.searchsorted(chaves, ids), len(chaves) - 1)
+    encontrado = chaves[pos] == ids
+
+    return {campo: np.where(encontrado, indice[campo][pos], np.nan) for campo in campos}
+
+
+# --------------------------------------------------------------------------------------------
+# Geometrias das UFs
+# --------------------------------------------------------------------------------------------
+def uf_geometry_index(geojson: dict, chaves: list = CHAVES_UF) -> dict:
+    '''
+    Monta o dicionário de busca das geometrias das UFs, a partir da sigla e do código IBGE da UF
+    :param geojson: geojson do mapa do Brasil dividido por UF
+    :param chaves: propriedades das features usadas como chave
+    :return: dicionário cuja chave é a sigla ou o código da UF (texto) e o valor é a feature correspondente
+    '''
+
+    return {str(feature['properties'][chave]): feature
+            for feature in geojson['features'] for chave in chaves if chave in feature['properties']}
+
+
+def select_features(geojson: dict, ufs, indice: dict = None) -> dict:
+    '''
+    Retorna um geojson contendo apenas as geometrias das UFs informadas, na ordem informada
+    :param geojson: geojson do mapa do Brasil dividido por UF
+    :param ufs: sequência com as siglas ou os códigos IBGE das UFs
+    :param indice: dicionário de busca (ver uf_geometry_index). Não sendo informado, é montado a partir do geojson
+    :return: geojson (FeatureCollection)
+    '''
+
+    indice = indice or uf_geometry_index(geojson)
+    ufs = dict.fromkeys(str(uf) for uf in ufs)
+
+    return dict(type='FeatureCollection', features=[indice[uf] for uf in ufs if uf in indice])
+
+
+# --------------------------------------------------------------------------------------------
+# Variantes simplificadas e quantizadas das geometrias das UFs
+# --------------------------------------------------------------------------------------------
+def _douglas_peucker(pts, tolerancia: float) -> 'ndarray':
+    '''
+    Simplifica uma linha pelo algoritmo de Douglas-Peucker, mantendo o primeiro e o último ponto
+    :param pts: array (n, 2) com os pontos da linha
+    :param tolerancia: distância máxima entre a linha original e a simplificada
+    :return: array com os pontos mantidos
+    '''
+
+    pts = np.asarray(pts, dtype=np.float64)
+    manter = np.zeros(len(pts), dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, len(pts) - 1)]
+
+    while pilha:
+        i, j = pilha.pop()
+        if j <= i + 1:
+            continue
+        seg = pts[j] - pts[i]
+        rel = pts[i + 1:j] - pts[i]
+        comprimento = np.hypot(*seg)
+        if comprimento == 0:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / comprimento
+        k = int(np.argmax(dist))
+        if dist[k] > tolerancia:
+            manter[i + 1 + k] = True
+            pilha.extend([(i, i + 1 + k), (i + 1 + k, j)])
+
+    return pts[manter]
+
+
+def _poligonos(geometria: dict) -> list:
+    '''
+    Retorna a lista de polígonos (lista de anéis) de uma geometria Polygon ou MultiPolygon
+    '''
+
+    return [geometria['coordinates']] if geometria['type'] == 'Polygon' else geometria['coordinates']
+
+
+def simplify_geojson(geojson: dict, tolerancia: float) -> dict:
+    '''
+    Gera uma versão simplificada e quantizada do geojson das UFs. As coordenadas são quantizadas em uma grade de
+    tolerancia / PASSOS_POR_TOLERANCIA graus, e as fronteiras compartilhadas entre UFs (arcos, como no TopoJSON) são
+    simplificadas uma única vez, de forma que UFs vizinhas continuem encaixadas, sem frestas ou sobreposições
+    :param geojson: geojson (FeatureCollection) com geometrias Polygon/MultiPolygon
+    :param tolerancia: tolerância da simplificação (graus)
+    :return: geojson (FeatureCollection) simplificado
+    '''
+
+    passo = tolerancia / PASSOS_POR_TOLERANCIA
+    casas = max(0, int(np.ceil(-np.log10(passo))))
+
+    # anéis quantizados (sem o ponto de fechamento) e sem vértices consecutivos repetidos
+    aneis = []
+    for feature in geojson['features']:
+        for poligono in _poligonos(feature['geometry']):
+            for anel in poligono:
+                q = np.round(np.asarray(anel, dtype=np.float64)[:, :2] / passo).astype(np.int64)
+                q = q[np.any(q != np.roll(q, 1, axis=0), axis=1)] if len(q) > 1 else q
+                aneis.append([tuple(v) for v in q])
+
+    # anéis que contêm cada vértice
+    vertices = {}
+    for n, anel in enumerate(aneis):
+        for v in anel:
+            vertices.setdefault(v, set()).add(n)
+
+    arcos = {}
+
+    def _simplifica_arco(arco):
+        chave = min(tuple(arco), tuple(reversed(arco)))
+        if chave not in arcos:
+            arcos[chave] = [tuple(v) for v in _douglas_peucker(chave, PASSOS_POR_TOLERANCIA).astype(np.int64)]
+        return arcos[chave] if chave == tuple(arco) else arcos[chave][::-1]
+
+    def _simplifica_anel(anel):
+        if len(anel) < 3:
+            return None
+        # vértices fixos: onde muda o conjunto de anéis que compartilham a fronteira (junções entre arcos)
+        fixos = [i for i, v in enumerate(anel)
+                 if vertices[v] != vertices[anel[i - 1]] or vertices[v] != vertices[anel[(i + 1) % len(anel)]]]
+        if not fixos:
+            # anel sem fronteiras compartilhadas - fixa o menor vértice e o mais distante dele
+            inicio = anel.index(min(anel))
+            dist = np.hypot(*(np.asarray(anel) - anel[inicio]).T)
+            fixos = sorted({inicio, int(np.argmax(dist))})
+        girado = anel[fixos[0]:] + anel[:fixos[0]]
+        posicoes = [i - fixos[0] for i in fixos] + [len(anel)]
+        girado.append(girado[0])
+        resultado = [girado[0]]
+        for a, b in zip(posicoes[:-1], posicoes[1:]):
+            resultado.extend(_simplifica_arco(girado[a:b + 1])[1:])
+        return resultado if len(resultado) >= 4 else None
+
+    def _coordenadas(anel):
+        return [[round(x * passo, casas), round(y * passo, casas)] for x, y in anel]
+
+    features = []
+    n = 0
+    for feature in geojson['features']:
+        poligonos = []
+        for poligono in _poligonos(feature['geometry']):
+            simplificados = [_simplifica_anel(aneis[n + i]) for i in range(len(poligono))]
+            n += len(poligono)
+            # polígonos cujo anel externo colapsou (ilhas menores que a tolerância) são descartados
+            if simplificados[0] is not None:
+                poligonos.append([_coordenadas(anel) for anel in simplificados if anel is not None])
+        if not poligonos:
+            # mantém ao menos o maior polígono da UF, apenas quantizado
+            maior = max(_poligonos(feature['geometry']), key=lambda p: len(p[0]))
+            poligonos = [[[[round(x, casas), round(y, casas)] for x, y, *_ in maior[0]]]]
+        geometria = (dict(type='Polygon', coordinates=poligonos[0]) if len(poligonos) == 1
+                     else dict(type='MultiPolygon', coordinates=poligonos))
+        features.append(dict(type='Feature', properties=feature.get('properties', {}), geometry=geometria))
+
+    return dict(type='FeatureCollection', features=features)
+
+
+def load_geometry_variants(data_url: str, cache_dir: str, variantes: dict = VARIANTES_GEO) -> dict:
+    '''
+    Carrega as variantes simplificadas do geojson das UFs a partir de um arquivo json identificado pelo hash da origem.
+    As variantes só são geradas novamente quando o conteúdo do geojson de origem muda
+    :param data_url: caminho local do geojson das UFs
+    :param cache_dir: diretório raiz do cache
+    :param variantes: dicionário nome -> tolerância (ver VARIANTES_GEO)
+    :return: dicionário nome -> geojson simplificado
+    '''
+
+    dir_geo = os.path.join(cache_dir, 'geo')
+    # o nome do arquivo identifica a origem e as tolerâncias usadas
+    h_variantes = hashlib.sha256(json.dumps(variantes, sort_keys=True).encode()).hexdigest()[:8]
+    caminho = os.path.join(dir_geo, f'uf-{sha256_arquivo(data_url)[:16]}-{h_variantes}.json')
+
+    if not os.path.exists(caminho):
+        with open(data_url) as f:
+            origem = json.load(f)
+        dados = {nome: simplify_geojson(origem, tolerancia) for nome, tolerancia in variantes.items()}
+        os.makedirs(dir_geo, exist_ok=True)
+        for antigo in glob.glob(os.path.join(dir_geo, 'uf-*.json')):
+            os.remove(antigo)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dados, f, separators=(',', ':'))
+        os.replace(tmp, caminho)
+        return dados
+
+    with open(caminho) as f:
+        return json.load(f)
+
+
+def pick_variant(geo: dict, zoom: float, variantes: dict = VARIANTES_GEO) -> dict:
+    '''
+    Escolhe a variante mais leve cuja simplificação fica abaixo de 1 pixel no nível de zoom do mapa
+    :param geo: geojson, ou dicionário nome -> geojson (ver load_geometry_variants)
+    :param zoom: nível de zoom do mapa (mapbox)
+    :param variantes: dicionário nome -> tolerância (ver VARIANTES_GEO)
+    :return: geojson
+    '''
+
+    if 'features' in geo:
+        return geo
+
+    graus_por_pixel = 360 / (256 * 2 ** zoom)
+    candidatas = sorted((variantes[nome], nome) for nome in geo if nome in variantes)
+    nome = candidatas[0][1]
+    for tolerancia, _nome in candidatas:
+        if tolerancia <= graus_por_pixel:
+            nome = _nome
+
+    return geo[nome]
+
+
+# --------------------------------------------------------------------------------------------
+# Agrupamento dos municípios em grade, por nível de zoom, e divisão dos níveis detalhados em blocos (tiles)
+# --------------------------------------------------------------------------------------------
+def grid_clusters(df_cities, tamanho: float) -> 'DataFrame':
+    '''
+    Agrupa os municípios em células quadradas de uma grade de latitude/longitude. A taxa por 100 mil habitantes de cada
+    célula é calculada sobre a soma dos casos e das populações (obtidas de totalCases_per_100k_inhabitants)
+    :param df_cities: dataframe com dados de covid por município, com lat e lon (ver transform_dfcities)
+    :param tamanho: tamanho da célula (graus). Sendo 0, retorna os municípios individualmente
+    :return: Pandas DataFrame com 'lat', 'lon' (centro dos municípios da célula), 'nome', 'municipios', 'totalCases',
+    'deaths', 'populacao' e 'taxa'
+    '''
+
+    _df = df_cities.dropna(subset=['lat', 'lon'])
+    lat = _df['lat'].to_numpy(dtype=np.float64)
+    lon = _df['lon'].to_numpy(dtype=np.float64)
+    casos = _df['totalCases'].to_numpy(dtype=np.float64)
+    obitos = _df['deaths'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        populacao = casos / _df['totalCases_per_100k_inhabitants'].to_numpy(dtype=np.float64) * 100000
+    populacao[~np.isfinite(populacao)] = 0
+
+    if tamanho == 0:
+        return pd.DataFrame({'lat': lat, 'lon': lon, 'nome': _df['city'].astype(str).to_numpy(), 'municipios': 1,
+                             'totalCases': casos, 'deaths': obitos, 'populacao': populacao,
+                             'taxa': _df['totalCases_per_100k_inhabitants'].to_numpy(dtype=np.float64)})
+
+    celulas = np.stack([np.floor(lat / tamanho), np.floor(lon / tamanho)], axis=1).astype(np.int64)
+    _, grupo = np.unique(celulas, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+
+    def _soma(pesos):
+        return np.bincount(grupo, weights=pesos)
+
+    municipios = np.bincount(grupo)
+    soma_pop = _soma(populacao)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        taxa = np.where(soma_pop > 0, _soma(np.where(populacao > 0, casos, 0)) / soma_pop * 100000, np.nan)
+
+    return pd.DataFrame({
+        'lat': _soma(lat) / municipios,
+        'lon': _soma(lon) / municipios,
+        'nome': [f'{n} município{"s" if n > 1 else ""}' for n in municipios],
+        'municipios': municipios,
+        'totalCases': _soma(casos),
+        'deaths': _soma(obitos),
+        'populacao': soma_pop,
+        'taxa': taxa,
+    })
+
+
+def cluster_levels(df_cities, niveis: dict = NIVEIS_CLUSTER) -> dict:
+    '''
+    Agrupa os municípios em cada nível de zoom
+    :param df_cities: dataframe com dados de covid por município, com lat e lon (ver transform_dfcities)
+    :param niveis: dicionário zoom mínimo -> tamanho da célula (ver NIVEIS_CLUSTER)
+    :return: dicionário zoom mínimo -> DataFrame (ver grid_clusters)
+    '''
+
+    return {zoom: grid_clusters(df_cities, tamanho) for zoom, tamanho in niveis.items()}
+
+
+def marker_size(municipios) -> 'ndarray':
+    '''
+    Tamanho do marcador de cada célula, proporcional à raiz da quantidade de municípios agrupados
+    '''
+
+    return np.minimum(6 + 2 * np.sqrt(np.asarray(municipios, dtype=np.float64) - 1), 30).round(1)
+
+
+def write_cluster_tiles(niveis: dict, destino_dir: str, tamanho_tile: float = TAMANHO_TILE) -> tuple:
+    '''
+    Grava os níveis detalhados do agrupamento em blocos json ('destino_dir/<zoom>/<x>_<y>.json'), carregados pela página
+    do mapa conforme o zoom e a região visível, junto com o índice dos blocos existentes ('destino_dir/index.json'). O
+    nível mais geral não é gravado, pois já vai embutido no gráfico. Só são gravados os arquivos cujo conteúdo mudou, e
+    os blocos que deixaram de existir são removidos
+    :param niveis: dicionário zoom mínimo -> DataFrame (ver cluster_levels)
+    :param destino_dir: diretório dos blocos
+    :param tamanho_tile: tamanho dos blocos (graus)
+    :return: gravados,  -> lista com os caminhos dos arquivos gravados
+            removidos   -> lista com os caminhos dos blocos removidos, para serem removidos também na publicação
+    '''
+
+    gravados = []
+    existentes = set(glob.glob(os.path.join(destino_dir, '*', '*.json')))
+    indice = {'tamanho_tile': tamanho_tile, 'niveis': {}}
+
+    def _grava(caminho, dados):
+        conteudo = json.dumps(dados, separators=(',', ':')).encode('utf-8')
+        existentes.discard(caminho)
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                if f.read() == conteudo:
+                    return
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(conteudo)
+        os.replace(tmp, caminho)
+        gravados.append(caminho)
+
+    for zoom, _df in sorted(niveis.items())[1:]:
+        tx = np.floor(_df['lon'].to_numpy() / tamanho_tile).astype(int)
+        ty = np.floor(_df['lat'].to_numpy() / tamanho_tile).astype(int)
+        blocos = _df.assign(tamanho=marker_size(_df['municipios']), tile=[f'{x}_{y}' for x, y in zip(tx, ty)])
+        indice['niveis'][str(zoom)] = sorted(blocos['tile'].unique().tolist())
+        for tile, bloco in blocos.groupby('tile'):
+            taxa = [None if np.isnan(v) else v for v in bloco['taxa'].round(2).tolist()]
+            _grava(os.path.join(destino_dir, str(zoom), f'{tile}.json'), {
+                'lat': bloco['lat'].round(4).tolist(),
+                'lon': bloco['lon'].round(4).tolist(),
+                'taxa': taxa,
+                'customdata': list(zip(bloco['nome'].tolist(), bloco['totalCases'].astype(int).tolist(),
+                                       bloco['deaths'].astype(int).tolist(), taxa)),
+                'tamanho': bloco['tamanho'].tolist(),
+            })
+
+    _grava(os.path.join(destino_dir, 'index.json'), indice)
+
+    # blocos que deixaram de existir
+    removidos = sorted(existentes)
+    for caminho in removidos:
+        os.remove(caminho)
+
+    return gravados, removidos
@@ -4,390 +4,323 @@
 # ver: 1.0  21/05/2021
 ########################################
 
+import numpy as np
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import plotly.express as px
+from geo_functions import NIVEIS_CLUSTER, grid_clusters, marker_size, pick_variant
+from memo_functions import memoize_figure
+import spec_functions as sp
 
 
-def graph_active_cases_cum(data_BR):
+UM_DIA_MS = 86400000
+
+
+# --------------------------------------------------------------------------------------------
+# Funções auxiliares de serialização compacta das séries temporais
+# --------------------------------------------------------------------------------------------
+def lttb(x, y, n_pontos: int):
     """
-    Gera gráfico da evolução de casos ativos de covid-19 no Brasil - Acumulado
-    :param data_BR: Pandas DataFrame com os dados de casos de covid-19 no Brasil acumulados
-    :return: Plotly Fig object
+    Reduz uma série a n_pontos usando o algoritmo Largest-Triangle-Three-Buckets, que preserva o formato visual da curva
+    :param x: array numérico com os valores do eixo x (ordenado)
+    :param y: array numérico com os valores do eixo y
+    :param n_pontos: quantidade de pontos da série reduzida
+    :return: array com os índices dos pontos selecionados
     """
 
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(
-        go.Scatter(
-            x=data_BR['date'],
-            y=data_BR['activeCases'],
-            line=dict(width=3),
-            name='Casos Ativos',
-            text=data_BR['date'],
-            hoverinfo='text',
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=data_BR['date'],
-            y=data_BR['activeCasesMS'],
-            line=dict(width=3),
-            name='Casos Ativos - MS',
-            text=data_BR['date'],
-            hoverinfo='text',
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Bar(
-            x=data_BR['date'],
-            y=data_BR['activeCasesDiff'],
-            name='diferença',
-            text=data_BR['date'],
-            hoverinfo='text',
-        ),
-        secondary_y=True,
-    )
+    n = len(y)
+    if n_pontos >= n or n_pontos < 3:
+        return np.arange(n)
 
-    # customizações de layout
-    fig.update_layout(
-        title=dict(
-            text='<b>Casos Ativos - MS x SES</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        xaxis_tickformat='%d/%m/%Y',
-        hovermode='x unified',
-        separators=',.',
-        plot_bgcolor='#fafafa',
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10)
-        ),
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
 
-    fig.update_traces(hovertemplate='%{y:,.0f}')
+    # o primeiro e o último ponto são mantidos; os demais são divididos em n_pontos - 2 faixas
+    bordas = np.linspace(1, n - 1, n_pontos - 1).astype(int)
+    bordas = np.append(bordas, n)
+    indices = np.empty(n_pontos, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
 
-    # Anotações
-    fig.add_annotation(x=data_BR.loc[data_BR['activeCasesDiff'].idxmax(), 'date'], y=data_BR['activeCasesDiff'].max(),
-                       yref='y2',
-                       text="> " + str(round(data_BR['activeCasesDiff'].max(), -3)),
-                       font=dict(size=10),
-                       showarrow=True,
-                       arrowhead=1)
+    a = 0
+    for i in range(n_pontos - 2):
+        ini, fim = bordas[i], bordas[i + 1]
+        prox_x, prox_y = x[fim:bordas[i + 2]].mean(), y[fim:bordas[i + 2]].mean()
+        area = np.abs((x[a] - prox_x) * (y[ini:fim] - y[a]) - (x[a] - x[ini:fim]) * (prox_y - y[a]))
+        a = ini + int(np.argmax(area))
+        indices[i + 1] = a
 
-    # Set y-axes titles
-    fig.update_yaxes(title_text="Casos Confirmados", secondary_y=False)
-    fig.update_yaxes(title_text="Diferença", secondary_y=True)
+    return indices
 
-    return fig
 
+def _array_compacto(serie):
+    """
+    Converte uma série numérica para o menor tipo que a representa sem perda (o menor inteiro quando possível, senão
+    floats com 2 casas decimais) e a codifica como typed array em base64 (ver spec_functions.typed_array): o plotly.py
+    não faz essa codificação antes da versão 6, e os arrays seriam gravados como listas de números em texto
+    :param serie: série numérica
+    :return: typed array (dict) ou array numpy
+    """
+
+    valores = serie.to_numpy(dtype=float)
+    if np.isfinite(valores).all() and (valores == np.round(valores)).all():
+        maximo = np.abs(valores).max(initial=0)
+        inteiro = next((tipo for tipo in (np.int8, np.int16, np.int32) if maximo <= np.iinfo(tipo).max), np.int64)
+        valores = valores.astype(inteiro)
+    else:
+        valores = np.round(valores, 2)
 
-def graph_confirmed_cases_by_month(p_mes):
+    return sp.typed_array(valores)
+
+
+def _series(df, col_x: str, cols_y: list, compacto: bool = False, max_pontos: int = None) -> dict:
     """
-    Gera gráfico de casos de covid-19 confirmados por mês no Brasil, desde o início dos registros
-    :param p_mes: Pandas DataFrame df_br agrupado por mês
-    :return: Plotly Fig object
+    Monta os argumentos x/y de cada trace de uma série temporal
+    :param df: Pandas DataFrame com os dados
+    :param col_x: nome da coluna de datas
+    :param cols_y: nomes das colunas de valores
+    :param compacto: se True, datas diárias regulares viram x0/dx, os valores são convertidos com _array_compacto e a
+    série pode ser reduzida com lttb
+    :param max_pontos: quantidade máxima de pontos da série no modo compacto (None = sem redução)
+    :return: dicionário cuja chave é a coluna de valores e o valor são os argumentos do trace
     """
 
-    fig = go.Figure(
-        data=[
-            go.Bar(
-                x=p_mes.index,
-                y=p_mes['newCases'],
-                name='Casos',
-            ),
-        ]
-    )
+    if not compacto:
+        return {col: dict(x=df[col_x], y=df[col]) for col in cols_y}
 
-    fig.update_layout(
-        title=dict(
-            text='<b>Casos Confirmados por mês - COVID-19</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10),
-        ),
-        hovermode='x unified',
-        separators=',.',
-        plot_bgcolor='#fafafa',
-        xaxis_tickformat='%m/%Y',
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
-    fig.update_xaxes(nticks=p_mes.shape[0])
+    if max_pontos and len(df) > max_pontos:
+        # a mesma seleção de pontos é usada em todas as séries, para manter o hover unificado alinhado
+        df = df.iloc[lttb(df[col_x].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9,
+                          df[cols_y[0]].to_numpy(dtype=float), max_pontos)]
 
-    fig.update_traces(
-        hovertemplate='%{y:,.0f}',
-        marker_color='goldenrod',
-    )
+    datas = df[col_x].to_numpy(dtype='datetime64[ns]')
+    passos = np.diff(datas).astype('timedelta64[ms]').astype(np.int64)
+    if len(datas) > 1 and (passos == UM_DIA_MS).all():
+        eixo_x = dict(x0=str(datas[0])[:10], dx=UM_DIA_MS)
+    else:
+        eixo_x = dict(x=np.datetime_as_string(datas, unit='D'))
 
-    return fig
+    return {col: dict(eixo_x, y=_array_compacto(df[col])) for col in cols_y}
 
 
-def graph_deaths_cum(data_BR):
+@memoize_figure(colunas={'data_BR': ['date', 'activeCases', 'activeCasesMS', 'activeCasesDiff']})
+def graph_active_cases_cum(data_BR, compacto: bool = False, max_pontos: int = None):
     """
-    Gera gráfico da evolução de óbitos por covid-19 no Brasil - Acumulado
-    :param data_BR: Pandas DataFrame com os dados de óbitos por covid-19 acumulados
-    :return: Plotly Fig object
+    Gera gráfico da evolução de casos ativos de covid-19 no Brasil - Acumulado
+    :param data_BR: Pandas DataFrame com os dados de casos de covid-19 no Brasil acumulados
+    :param compacto: se True, serializa as séries de forma compacta e sem o texto de hover redundante (ver _series)
+    :param max_pontos: quantidade máxima de pontos de cada série no modo compacto
+    :return: figura (dict - ver spec_functions)
     """
 
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(
-        go.Scatter(
-            x=data_BR['date'],
-            y=data_BR['deaths'],
-            line=dict(width=3, color='orange'),
-            name='Óbitos',
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=data_BR['date'],
-            y=data_BR['deathsMS'],
-            line=dict(width=3, color='blue'),
-            name='Óbitos - MS',
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Bar(
-            x=data_BR['date'],
-            y=data_BR['deathsDiff'],
-            name='diferença',
-        ),
-        secondary_y=True,
-    )
+    series = _series(data_BR, 'date', ['activeCases', 'activeCasesMS', 'activeCasesDiff'], compacto, max_pontos)
+    # o hovertemplate já exibe os valores; o texto com as datas só é mantido fora do modo compacto
+    hover = {} if compacto else dict(text=data_BR['date'], hoverinfo='text')
+    comum = dict(hovertemplate=sp.HOVER_VALOR)
+
+    traces = [
+        sp.trace('scatter', 'y', comum, **series['activeCases'], line=dict(width=3), name='Casos Ativos', **hover),
+        sp.trace('scatter', 'y', comum, **series['activeCasesMS'], line=dict(width=3), name='Casos Ativos - MS',
+                 **hover),
+        sp.trace('bar', 'y2', comum, **series['activeCasesDiff'], name='diferença', **hover),
+    ]
+
+    # com x0/dx (modo compacto) o plotly.js não consegue inferir que o eixo x é de datas
+    eixos = sp.secondary_axes('Casos Confirmados', 'Diferença', tickformat='%d/%m/%Y',
+                              **(dict(type='date') if compacto else {}))
+
+    return sp.figure(traces, dict(
+        eixos,
+        title=sp.title('<b>Casos Ativos - MS x SES</b>'),
+        legend=sp.LEGENDA,
+        margin=sp.MARGEM,
+        **sp.LAYOUT_BASE,
+        # Anotações
+        annotations=[sp.annotation(x=data_BR.loc[data_BR['activeCasesDiff'].idxmax(), 'date'],
+                                   y=data_BR['activeCasesDiff'].max(),
+                                   yref='y2',
+                                   text="> " + str(round(data_BR['activeCasesDiff'].max(), -3)),
+                                   font=dict(size=10),
+                                   showarrow=True,
+                                   arrowhead=1)],
+    ))
 
-    # customização do layout
-    fig.update_layout(
-        title=dict(
-            text='<b>Óbitos - Acumulado - MS x SES</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        xaxis_tickformat='%d/%m/%Y',
-        hovermode='x unified',
-        separators=',.',
-        plot_bgcolor='#fafafa',
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10)
-        ),
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
 
-    fig.update_traces(hovertemplate='%{y:,.0f}')
+@memoize_figure(colunas={'p_mes': ['newCases']})
+def graph_confirmed_cases_by_month(p_mes):
+    """
+    Gera gráfico de casos de covid-19 confirmados por mês no Brasil, desde o início dos registros
+    :param p_mes: Pandas DataFrame df_br agrupado por mês
+    :return: figura (dict - ver spec_functions)
+    """
 
-    # Anotações
-    fig.add_annotation(x=data_BR.loc[data_BR['deathsDiff'].idxmax(), 'date'], y=data_BR['deathsDiff'].max(),
-                       yref='y2',
-                       text="> " + str(round(data_BR['deathsDiff'].max(), -2)),
-                       font=dict(size=10),
-                       showarrow=True,
-                       arrowhead=1)
+    traces = [
+        sp.trace('bar', atualizacao=dict(marker=dict(color='goldenrod'), hovertemplate=sp.HOVER_VALOR),
+                 x=p_mes.index, y=p_mes['newCases'], name='Casos'),
+    ]
+
+    return sp.figure(traces, dict(
+        title=sp.title('<b>Casos Confirmados por mês - COVID-19</b>'),
+        legend=sp.LEGENDA,
+        xaxis=dict(tickformat='%m/%Y', nticks=p_mes.shape[0]),
+        margin=sp.MARGEM,
+        **sp.LAYOUT_BASE,
+    ))
 
-    # Set x-axis title
-    # fig.update_xaxes(title_text="Data")
 
-    # Set y-axes titles
-    fig.update_yaxes(title_text="Óbitos Confirmados", secondary_y=False)
-    fig.update_yaxes(title_text="Diferença", secondary_y=True)
+@memoize_figure(colunas={'data_BR': ['date', 'deaths', 'deathsMS', 'deathsDiff']})
+def graph_deaths_cum(data_BR, compacto: bool = False, max_pontos: int = None):
+    """
+    Gera gráfico da evolução de óbitos por covid-19 no Brasil - Acumulado
+    :param data_BR: Pandas DataFrame com os dados de óbitos por covid-19 acumulados
+    :param compacto: se True, serializa as séries de forma compacta (ver _series)
+    :param max_pontos: quantidade máxima de pontos de cada série no modo compacto
+    :return: figura (dict - ver spec_functions)
+    """
 
-    return fig
+    series = _series(data_BR, 'date', ['deaths', 'deathsMS', 'deathsDiff'], compacto, max_pontos)
+    comum = dict(hovertemplate=sp.HOVER_VALOR)
+
+    traces = [
+        sp.trace('scatter', 'y', comum, **series['deaths'], line=dict(color='orange', width=3), name='Óbitos'),
+        sp.trace('scatter', 'y', comum, **series['deathsMS'], line=dict(color='blue', width=3), name='Óbitos - MS'),
+        sp.trace('bar', 'y2', comum, **series['deathsDiff'], name='diferença'),
+    ]
+
+    # com x0/dx (modo compacto) o plotly.js não consegue inferir que o eixo x é de datas
+    eixos = sp.secondary_axes('Óbitos Confirmados', 'Diferença', tickformat='%d/%m/%Y',
+                              **(dict(type='date') if compacto else {}))
+
+    return sp.figure(traces, dict(
+        eixos,
+        title=sp.title('<b>Óbitos - Acumulado - MS x SES</b>'),
+        legend=sp.LEGENDA,
+        margin=sp.MARGEM,
+        **sp.LAYOUT_BASE,
+        # Anotações
+        annotations=[sp.annotation(x=data_BR.loc[data_BR['deathsDiff'].idxmax(), 'date'],
+                                   y=data_BR['deathsDiff'].max(),
+                                   yref='y2',
+                                   text="> " + str(round(data_BR['deathsDiff'].max(), -2)),
+                                   font=dict(size=10),
+                                   showarrow=True,
+                                   arrowhead=1)],
+    ))
 
 
+@memoize_figure(colunas={'p_mes': ['newDeaths']})
 def graph_deaths_by_month(p_mes):
     """
     Gera gráfico de óbitos por covid-19 no Brasil, por mês, desde o início dos registros
     :param p_mes: Pandas DataFrame df_br agrupado por mês
-    :return: Plotly Fig object
+    :return: figura (dict - ver spec_functions)
     """
 
-    fig = go.Figure(
-        data=[
-            go.Bar(
-                x=p_mes.index,
-                y=p_mes['newDeaths'],
-                name='Óbitos',
-            ),
-        ]
-    )
-
-    fig.update_layout(
-        title=dict(
-            text='<b>Óbitos registrados por mês - COVID-19</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10),
-        ),
-        hovermode='x unified',
-        separators=',.',
-        plot_bgcolor='#fafafa',
-        xaxis_tickformat='%m/%Y',
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
-    fig.update_xaxes(nticks=p_mes.shape[0])
-
-    fig.update_traces(
-        hovertemplate='%{y:,.0f}',
-        marker_color='firebrick',
-    )
-
-    return fig
+    traces = [
+        sp.trace('bar', atualizacao=dict(marker=dict(color='firebrick'), hovertemplate=sp.HOVER_VALOR),
+                 x=p_mes.index, y=p_mes['newDeaths'], name='Óbitos'),
+    ]
+
+    return sp.figure(traces, dict(
+        title=sp.title('<b>Óbitos registrados por mês - COVID-19</b>'),
+        legend=sp.LEGENDA,
+        xaxis=dict(tickformat='%m/%Y', nticks=p_mes.shape[0]),
+        margin=sp.MARGEM,
+        **sp.LAYOUT_BASE,
+    ))
 
 
-def graph_vaccines_doses_cum(df_vac, df_50M, dias_50M):
+@memoize_figure(colunas={'df_vac': ['date', 'vaccinated', 'vaccinated_second']})
+def graph_vaccines_doses_cum(df_vac, df_50M, dias_50M, compacto: bool = False, max_pontos: int = None):
     """
     Gera gráfico da evolução da vacinação contra a covid-19 no Brasil desde o início dos registros - Acumulado
     :param df_vac: recorte do DataFrame data_BR contendo apenas os registros a partir do início da vacinação, e que contém dados de doses de vacina aplicadas - acumulados
-    :param df_50M: recorte do DataFrame data_BR contendo apenas o registro da data em que o Brasil alcançou a marca de 50 milhões de doses aplicadas
+    :param df_50M: recorte do DataFrame data_BR contendo apenas o registro da data em que o Brasil alcançou a marca de 50 milhões de doses aplicadas. Sendo None (marca ainda não alcançada), o gráfico não recebe a linha e a anotação da marca
     :param dias_50M: número de dias de vacinação que o Brasil levou para alcançar a marca de 50 milhões de doses aplicadas
-    :return: Plotly Fig object
+    :param compacto: se True, serializa as séries de forma compacta (ver _series)
+    :param max_pontos: quantidade máxima de pontos de cada série no modo compacto
+    :return: figura (dict - ver spec_functions)
     """
 
-    fig = go.Figure(go.Scatter(
-        x=df_vac['date'],
-        y=df_vac['vaccinated'],
-        line=dict(color='MediumPurple', width=3),
-        fill='tonexty',
-        name='primeira dose'
-
-    ))
-
-    fig.add_trace(go.Scatter(
-        x=df_vac['date'],
-        y=df_vac['vaccinated_second'],
-        line=dict(color='Coral', width=3),
-        fill='tozeroy',
-        name='segunda dose'
-    ))
-
-    fig.update_layout(
-        title=dict(
-            text='<b>Evolução da vacinação - COVID-19</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        xaxis_tickformat='%d/%m/%Y',
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10)
-        ),
-        hovermode='x unified',
-        separators=',.',
-        plot_bgcolor='#fafafa',
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
-
-    fig.update_traces(hovertemplate='%{y:,.0f}')
-
-    fig.add_vline(
-        x=df_50M['date'],
-        line_width=3,
-        line_dash="dash",
-        line_color="green",
-    )
-
-    # Anotações
-    fig.add_annotation(
-        x=df_50M['date'],
-        y=df_50M['vaccinated'] + 100000,
-        text=f"50M em {dias_50M} dias",
-        font=dict(size=10, color='white'),
-        showarrow=False,
-        xref="x",
-        yref="y",
-        yshift=-100,
-        xshift=-50,
-        align="left",
-        borderpad=4,
-        bgcolor="ForestGreen",
-    )
-
-    return fig
-
-
-def graph_vaccination_by_day(df_vac):
+    series = _series(df_vac, 'date', ['vaccinated', 'vaccinated_second'], compacto, max_pontos)
+    comum = dict(hovertemplate=sp.HOVER_VALOR)
+
+    traces = [
+        sp.trace('scatter', None, comum, **series['vaccinated'], line=dict(color='MediumPurple', width=3),
+                 fill='tonexty', name='primeira dose'),
+        sp.trace('scatter', None, comum, **series['vaccinated_second'], line=dict(color='Coral', width=3),
+                 fill='tozeroy', name='segunda dose'),
+    ]
+
+    # com x0/dx (modo compacto) o plotly.js não consegue inferir que o eixo x é de datas
+    layout = dict(
+        title=sp.title('<b>Evolução da vacinação - COVID-19</b>'),
+        xaxis=dict(tickformat='%d/%m/%Y', **(dict(type='date') if compacto else {})),
+        legend=sp.LEGENDA,
+        margin=sp.MARGEM,
+        **sp.LAYOUT_BASE,
+    )
+
+    if df_50M is not None:
+        # linha vertical na data da marca
+        layout['shapes'] = [sp.vline(df_50M['date'], line=dict(color='green', dash='dash', width=3))]
+
+        # Anotações
+        layout['annotations'] = [sp.annotation(x=df_50M['date'],
+                                               y=df_50M['vaccinated'] + 100000,
+                                               text=f"50M em {dias_50M} dias",
+                                               font=dict(size=10, color='white'),
+                                               showarrow=False,
+                                               xref="x",
+                                               yref="y",
+                                               yshift=-100,
+                                               xshift=-50,
+                                               align="left",
+                                               borderpad=4,
+                                               bgcolor="ForestGreen")]
+
+    return sp.figure(traces, layout)
+
+
+@memoize_figure(colunas={'df_vac': ['date', 'newVaccinated', 'newVaccinated_second', '1_dose_7d',
+                                    '2_dose_7d']})
+def graph_vaccination_by_day(df_vac, compacto: bool = False, max_pontos: int = None):
     """
     Gera gráfico de doses de vacinas contra a covid-19 aplicadas por dia no Brasil desde o início dos registros,
     além das médias móveis de 07 dias para a primeira e segunda doses
     :param df_vac: recorte do DataFrame data_BR contendo apenas os registros a partir do início da vacinação, e que contém dados de doses de vacina aplicadas
-    :return: Plotly Fig object
+    :param compacto: se True, serializa as séries de forma compacta (ver _series)
+    :param max_pontos: quantidade máxima de pontos de cada série no modo compacto
+    :return: figura (dict - ver spec_functions)
     """
 
-    _df_vac = df_vac.copy()
-    _df_vac['1_dose_7d'] = df_vac['newVaccinated'].rolling(7).mean()
-    _df_vac['2_dose_7d'] = df_vac['newVaccinated_second'].rolling(7).mean()
-
-    fig = go.Figure(
-        data=[
-            go.Bar(
-                x=_df_vac['date'],
-                y=_df_vac['newVaccinated'],
-                name='primeira dose',
-                opacity=0.5
-            ),
-            go.Bar(
-                x=_df_vac['date'],
-                y=_df_vac['newVaccinated_second'],
-                name='segunda dose',
-            ),
-            go.Scatter(
-                x=_df_vac['date'],
-                y=_df_vac['1_dose_7d'],
-                line=dict(color='MediumPurple', width=5),
-                name='média móvel 1ª dose'
-            ),
-            go.Scatter(
-                x=_df_vac['date'],
-                y=_df_vac['2_dose_7d'],
-                line=dict(color='Coral', width=5),
-                name='média móvel 2ª dose'
-            )
-        ]
-    )
-
-    fig.update_layout(
-        title=dict(
-            text='<b>Vacinação por dia - COVID-19</b>',
-            xref='paper',
-            pad=dict(l=150),
-        ),
-        xaxis_tickformat='%d/%m/%Y',
+    # médias móveis já calculadas no armazenamento de agregados (ver aggregate_functions) são reaproveitadas
+    _df_vac = df_vac
+    if '1_dose_7d' not in df_vac.columns or '2_dose_7d' not in df_vac.columns:
+        _df_vac = df_vac.copy()
+        _df_vac['1_dose_7d'] = df_vac['newVaccinated'].rolling(7).mean()
+        _df_vac['2_dose_7d'] = df_vac['newVaccinated_second'].rolling(7).mean()
+
+    series = _series(_df_vac, 'date', ['newVaccinated', 'newVaccinated_second', '1_dose_7d', '2_dose_7d'], compacto,
+                     max_pontos)
+    comum = dict(marker=dict(color='DarkGray'), hovertemplate=sp.HOVER_VALOR)
+
+    traces = [
+        sp.trace('bar', atualizacao=comum, **series['newVaccinated'], name='primeira dose', opacity=0.5),
+        sp.trace('bar', atualizacao=comum, **series['newVaccinated_second'], name='segunda dose'),
+        sp.trace('scatter', atualizacao=comum, **series['1_dose_7d'], line=dict(color='MediumPurple', width=5),
+                 name='média móvel 1ª dose'),
+        sp.trace('scatter', atualizacao=comum, **series['2_dose_7d'], line=dict(color='Coral', width=5),
+                 name='média móvel 2ª dose'),
+    ]
+
+    return sp.figure(traces, dict(
+        title=sp.title('<b>Vacinação por dia - COVID-19</b>'),
+        # com x0/dx (modo compacto) o plotly.js não consegue inferir que o eixo x é de datas
+        xaxis=dict(tickformat='%d/%m/%Y', **(dict(type='date') if compacto else {})),
+        legend=sp.LEGENDA,
+        margin=sp.MARGEM,
         barmode='stack',
-        legend=dict(
-            x=0.01,
-            y=0.9,
-            traceorder='normal',
-            font=dict(size=10)
-        ),
-        margin=dict(l=0, r=0, t=30, b=0),
-    )
-    fig.update_traces(
-        hovertemplate='%{y:,.0f}',
-        marker_color='DarkGray',
-    )
-    fig.update_layout(hovermode='x unified', separators=',.', plot_bgcolor='#fafafa')
-
-    return fig
+        **sp.LAYOUT_BASE,
+    ))
 
 
 def kpi_total_doses(data_BR):
@@ -472,17 +405,19 @@ def kpi_total_2dose(data_BR):
     return fig
 
 
-def kpi_qtd_dias_vac(data_BR):
+def kpi_qtd_dias_vac(data_BR, t_decorrido: int = None):
     """
     Gera o indicador da quantidade de dias desde o início da vacinação no Brasil
     :param data_BR: Pandas DataFrame com os dados de doses de vacinas contra covid-19 aplicadas no Brasil
+    :param t_decorrido: quantidade de dias já calculada (ver aggregate_functions). Não sendo informada, é calculada a
+    partir do data_BR
     :return: Plotly Fig object
     """
 
-    t_menor = data_BR[~data_BR['vaccinated'].isna()]['date'].min()
-    t_maior = data_BR[~data_BR['vaccinated'].isna()]['date'].max()
-    t_decorrido = t_maior - t_menor
-    t_decorrido = int(str(t_decorrido).split()[0])
+    if t_decorrido is None:
+        datas_vac = data_BR.loc[data_BR['vaccinated'].notna(), 'date']
+        t_decorrido = (datas_vac.max() - datas_vac.min()).days
+
     fig = go.Figure()
     fig.add_trace(go.Indicator(
             mode="number",
@@ -498,14 +433,19 @@ def kpi_qtd_dias_vac(data_BR):
     return fig
 
 
-def mapbox_cloropleth_percvac(data_UF, geo_UF, map_colors:dict={}, ):
+@memoize_figure(colunas={'data_UF': ['state', 'NM_UF', 'perc_vac', 'faixa_perc']})
+def mapbox_cloropleth_percvac(data_UF, geo_UF, map_colors:dict={}, zoom: float = 3):
     """
     Gera o gráfico cloroplético do percentual da população de cada UF vacinada com a 1a dose
     :param data_UF: Pandas DataFrame com os dados de doses de vacinas contra covid-19 aplicadas por UF
-    :param geo_UF: GeoJson com as coordenadas de cada UF
+    :param geo_UF: GeoJson com as coordenadas de cada UF, ou dicionário com as variantes simplificadas do GeoJson
+    (ver geo_functions.load_geometry_variants) - neste caso é usada a variante adequada ao zoom do mapa
+    :param zoom: nível de zoom inicial do mapa
     :return: Plotly Figure Object
     """
 
+    geo_UF = pick_variant(geo_UF, zoom)
+
     # fig = go.Figure(go.Choroplethmapbox(
     #     geojson=geo_UF,
     #     featureidkey="properties.SIGLA_UF",
@@ -548,7 +488,7 @@ def mapbox_cloropleth_percvac(data_UF, geo_UF, map_colors:dict={}, ):
         hover_name='NM_UF',
         hover_data={'perc_vac': ':,.2f%', 'state': False, 'faixa_perc': False},
         labels={'perc_vac': 'Pop. Vacinada', 'faixa_perc': '% Vacinados'},
-        zoom=3
+        zoom=zoom
     )
     fig.update_layout(
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
@@ -561,22 +501,55 @@ def mapbox_cloropleth_percvac(data_UF, geo_UF, map_colors:dict={}, ):
     return fig
 
 
-def mapbox_cases_p100k(df_cities):
-
-    _df = df_cities.query('date == @df_cities.date.max()')
-    mapa = px.scatter_mapbox(
-        _df,
-        lat='lat',
-        lon='lon',
-        hover_name='city',
-        color_continuous_scale=px.colors.sequential.matter,
-        color='totalCases_per_100k_inhabitants',
-        zoom=3,
-        hover_data={'lat': False, 'lon': False, 'totalCases': True, 'deaths': True,
-                    'totalCases_per_100k_inhabitants': ':.2f'},
-        labels={'totalCases': 'Casos', 'deaths': 'Óbitos', 'totalCases_per_100k_inhabitants': 'Casos p/ 100mil hab.'},
-        title='<b>Covid-19</b> Proporção de casos por 100mil habitantes'
-    )
+@memoize_figure(colunas={'df_cities': ['city', 'lat', 'lon', 'totalCases', 'deaths',
+                                       'totalCases_per_100k_inhabitants']})
+def mapbox_cases_p100k(df_cities, agrupado: bool = False, niveis: dict = NIVEIS_CLUSTER):
+    """
+    Gera o mapa de casos por 100mil habitantes dos municípios
+    :param df_cities: Pandas DataFrame com os dados de covid dos municípios na data mais recente (transform_dfcities)
+    :param agrupado: se True, os municípios são agrupados em células de uma grade (nível mais geral de 'niveis'); os
+    níveis detalhados são carregados pela página conforme o zoom (ver geo_functions.write_cluster_tiles e
+    cluster_tiles_script)
+    :param niveis: dicionário zoom mínimo -> tamanho da célula (ver geo_functions.NIVEIS_CLUSTER)
+    :return: Plotly Figure Object
+    """
+
+    if not agrupado:
+        mapa = px.scatter_mapbox(
+            df_cities,
+            lat='lat',
+            lon='lon',
+            hover_name='city',
+            color_continuous_scale=px.colors.sequential.matter,
+            color='totalCases_per_100k_inhabitants',
+            zoom=3,
+            hover_data={'lat': False, 'lon': False, 'totalCases': True, 'deaths': True,
+                        'totalCases_per_100k_inhabitants': ':.2f'},
+            labels={'totalCases': 'Casos', 'deaths': 'Óbitos',
+                    'totalCases_per_100k_inhabitants': 'Casos p/ 100mil hab.'},
+            title='<b>Covid-19</b> Proporção de casos por 100mil habitantes'
+        )
+    else:
+        _df = grid_clusters(df_cities, niveis[min(niveis)])
+        # escala de cores fixa, para que os níveis carregados pela página usem as mesmas cores
+        cmax = float(df_cities['totalCases_per_100k_inhabitants'].quantile(0.99))
+        mapa = go.Figure(go.Scattermapbox(
+            lat=_df['lat'].round(4),
+            lon=_df['lon'].round(4),
+            mode='markers',
+            marker=dict(size=marker_size(_df['municipios']), color=_df['taxa'].round(2), cmin=0, cmax=cmax,
+                        colorscale=px.colors.sequential.matter,
+                        colorbar=dict(title='Casos p/ 100mil hab.')),
+            customdata=np.stack([_df['nome'], _df['totalCases'].astype(int), _df['deaths'].astype(int),
+                                 _df['taxa'].round(2)], axis=1),
+            hovertemplate='<b>%{customdata[0]}</b><br><br>Casos=%{customdata[1]}<br>Óbitos=%{customdata[2]}<br>'
+                          'Casos p/ 100mil hab.=%{customdata[3]:.2f}<extra></extra>',
+        ))
+        mapa.update_layout(
+            mapbox_zoom=3,
+            mapbox_center={'lat': float(_df['lat'].mean()), 'lon': float(_df['lon'].mean())},
+            title='<b>Covid-19</b> Proporção de casos por 100mil habitantes',
+        )
 
     mapa.update_layout(
         mapbox_style='open-street-map',
@@ -586,3 +559,53 @@ def mapbox_cases_p100k(df_cities):
     )
 
     return mapa
+
+
+def cluster_tiles_script(dir_tiles: str) -> str:
+    """
+    Script (post_script do html) que, conforme o zoom e a região visível do mapa agrupado de municípios, carrega os
+    blocos do nível de detalhe correspondente e substitui os pontos do gráfico. Abaixo do primeiro nível detalhado,
+    volta aos pontos do nível geral embutido no gráfico
+    :param dir_tiles: endereço do diretório dos blocos (ver geo_functions.write_cluster_tiles), relativo ao html
+    :return: código javascript
+    """
+
+    script = '''(function() {
+    var gd = document.getElementById('{plot_id}'), base = '{dir_tiles}/', cache = {};
+    var geral = {lat: [gd.data[0].lat], lon: [gd.data[0].lon], customdata: [gd.data[0].customdata],
+                 'marker.color': [gd.data[0].marker.color], 'marker.size': [gd.data[0].marker.size]};
+    var atual = null, pedido = 0;
+    function carrega(url) {
+        return cache[url] || (cache[url] = fetch(url).then(function(r) { return r.json(); }));
+    }
+    carrega(base + 'index.json').then(function(indice) {
+        gd.on('plotly_relayout', function() {
+            var m = gd._fullLayout.mapbox, t = indice.tamanho_tile, n = null;
+            Object.keys(indice.niveis).forEach(function(z) { if (+z <= m.zoom && (n === null || +z > +n)) n = z; });
+            var lon = 360 * gd._fullLayout.width / (256 * Math.pow(2, m.zoom)) / 2 + t;
+            var lat = lon * gd._fullLayout.height / gd._fullLayout.width + t;
+            var tiles = n === null ? [] : indice.niveis[n].filter(function(k) {
+                var p = k.split('_').map(Number);
+                return p[0] * t <= m.center.lon + lon && (p[0] + 1) * t >= m.center.lon - lon &&
+                       p[1] * t <= m.center.lat + lat && (p[1] + 1) * t >= m.center.lat - lat;
+            });
+            var chave = n === null ? null : n + ':' + tiles.join(',');
+            if (chave === atual) return;
+            atual = chave;
+            var id = ++pedido;
+            if (n === null) { Plotly.restyle(gd, geral, [0]); return; }
+            Promise.all(tiles.map(function(k) { return carrega(base + n + '/' + k + '.json'); })).then(function(blocos) {
+                if (id !== pedido) return;
+                var d = {lat: [], lon: [], customdata: [], 'marker.color': [], 'marker.size': []};
+                blocos.forEach(function(b) {
+                    d.lat = d.lat.concat(b.lat); d.lon = d.lon.concat(b.lon); d.customdata = d.customdata.concat(b.customdata);
+                    d['marker.color'] = d['marker.color'].concat(b.taxa); d['marker.size'] = d['marker.size'].concat(b.tamanho);
+                });
+                Plotly.restyle(gd, {lat: [d.lat], lon: [d.lon], customdata: [d.customdata],
+                                    'marker.color': [d['marker.color']], 'marker.size': [d['marker.size']]}, [0]);
+            });
+        });
+    });
+})();'''
+
+    return script.replace('{dir_tiles}', dir_tiles.rstrip('/'))
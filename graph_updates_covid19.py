@@ -4,19 +4,24 @@
 # ver: 1.0  21/05/2021
 ########################################
 
-import asyncio
-import os
+import argparse
+import importlib
 import json
-from datetime import datetime
-from data_functions import fetch_dataframes
 import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from fetch_functions import fetch_inputs, inputs_changed, nova_sessao, save_inputs_state
+from kpi_functions import compute_kpis, write_kpis
+from trace_functions import configure_tracing, span, write_prometheus
+# pandas, plotly e os módulos que dependem deles só são importados quando há uma atualização a fazer (importa_modulos)
+
+INICIO = time.perf_counter()
 logging.root.handlers
-import graph_functions as gf
-import plotly.io as pio
-pio.kaleido.scope.default_format = "svg"
-pio.kaleido.scope.default_width = 300
-pio.kaleido.scope.default_height = 200
-pio.kaleido.scope.default_scale = 1
 
 
 
@@ -27,91 +32,413 @@ url_popmunic = 'datasets/originais/populacao_2020.xls'
 url_gpscities = "https://raw.githubusercontent.com/wcota/covid19br/master/gps_cities.csv"
 url_geojson_br = 'geojson/brasil-uf-compressed.json'
 chunk_size = 50000
+cache_path = 'datasets/cache'
+aggregates_path = os.path.join(cache_path, 'agregados')
+figures_path = os.path.join(cache_path, 'figuras')
+download_path = 'datasets/download'
+snapshots_path = 'datasets/snapshots'     # snapshots colunares dos DataFrames transformados (ver snapshot_functions)
+inputs_state = os.path.join(download_path, 'entradas-processadas.json')
 maps_path = 'graficos'
 graphs_path = 'graficos/leg-int'
 ind_path = 'graficos/indicadores'
+ufs_path = 'graficos/uf'     # painéis por UF: graficos/uf/<UF>/...
+# Siglas aceitas em --ufs (as mesmas de population_functions.UFS, que não é importado aqui para não carregar o pandas
+# quando não há atualização)
+siglas_uf = ('AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB', 'PE', 'PI', 'PR',
+             'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO')
+manifest_path = os.path.join(maps_path, 'manifesto.json')
+changed_path = os.path.join(maps_path, 'alterados.txt')
+removed_path = os.path.join(maps_path, 'removidos.txt')     # arquivos removidos, a serem removidos também na publicação
+trace_path = 'gera_graficos_covid.trace.jsonl'
+tiles_path = os.path.join(maps_path, 'mapa-casos-p-100k-h-tiles')
+# Indicadores gravados em svg, além do feed kpis.json: nome do indicador -> arquivo
+kpi_svgs = {
+    'doses_aplicadas': 'ind-qtd-vacinas.svg',
+    '1a_dose': 'ind-qtd-1dose.svg',
+    '2a_dose': 'ind-qtd-2dose.svg',
+    'dias_vacinacao': 'ind-tempo-vacinacao.svg',
+}
+# Conjuntos de dados de entrada: nome do arquivo local -> endereço
+urls = {
+    'cases-brazil-states.csv': url_br,
+    'cases-brazil-cities-time.csv.gz': url_cities,
+    'populacao_2020.xls': url_popmunic,
+    'gps_cities.csv': url_gpscities,
+    'brasil-uf-compressed.json': url_geojson_br,
+}
+# Módulos importados apenas quando há uma atualização a fazer, na ordem de importação
+MODULOS_PESADOS = (
+    'asyncio',
+    'numpy',
+    'pandas',
+    'plotly.io',
+    'data_functions',
+    'graph_functions',
+    'aggregate_functions',
+    'geo_functions',
+    'render_functions',
+    'memo_functions',
+    'snapshot_functions',
+)
 
-if __name__ == "__main__":
-    # seta o arquivo que armazenará os logs e as configurações básicas de log
-    logging.basicConfig(filename='gera_graficos_covid.log',
-                        filemode='w',
-                        format='%(asctime)s - %(levelname)s - %(message)s',
-                        datefmt='%d/%m/%Y %H:%M:%S',
-                        level=logging.INFO)
 
-    # Instancia o objeto de Log
-    # logger = logging.getLogger()
-    # logger.setLevel(logging.INFO)
+def importa_modulos():
+    '''
+    Importa os módulos de MODULOS_PESADOS e configura o Kaleido e o cache das figuras, registrando no log o tempo de
+    import de cada módulo (o tempo de um módulo não inclui o dos módulos já importados antes dele). As funções que usam
+    esses módulos os importam localmente depois desta chamada, sem custo adicional
+    '''
 
-    # Fazendo a carga dos dados atualizados e tratamento dos mesmos
-    df_br, df_cities, df_popuf, df_uf, gj_uf_br = asyncio.run(fetch_dataframes(url_br, url_cities, url_popmunic, url_gpscities, url_geojson_br, chunk_size, logging))
+    tempos = {}
+    for modulo in MODULOS_PESADOS:
+        if modulo not in sys.modules:
+            t0 = time.perf_counter()
+            with span(modulo, 'importacao'):
+                importlib.import_module(modulo)
+            tempos[modulo] = time.perf_counter() - t0
+
+    import plotly.io as pio
+    import memo_functions as memo
+
+    # figuras serializadas dos builders, reaproveitadas enquanto as entradas não mudam - configurado antes da criação
+    # dos workers dos gráficos, que herdam a configuração
+    memo.configure_figure_cache(figures_path)
+    pio.kaleido.scope.default_format = "svg"
+    pio.kaleido.scope.default_width = 300
+    pio.kaleido.scope.default_height = 200
+    pio.kaleido.scope.default_scale = 1
+
+    if tempos:
+        logging.info(f'tempo de import: {sum(tempos.values()):.3f}s - ' +
+                     ', '.join(f'{modulo}: {t:.3f}s' for modulo, t in tempos.items()))
 
-    #---------------------------------------------------------------------------------------------
-    # gerando os gráficos atualizados
-    # ---------------------------------------------------------------------------------------------
 
-    # KPI's
-    logging.info('Gerando os KPIs...')
-    kpi_doses_aplicadas = gf.kpi_total_doses(df_br)
-    kpi_doses_aplicadas.write_image(os.path.join(ind_path, 'ind-qtd-vacinas.svg'))
+def jobs_uf(uf: str, args: dict) -> list:
+    '''
+    Conjunto de gráficos do painel de uma UF - as mesmas versões dos gráficos nacionais que dependem apenas da série da
+    UF (ver render_functions.render_fanout)
+    :param uf: sigla da UF
+    :param args: referências aos recortes da UF: 'df' (formato do df_br), 'df_vac' e 'p_mes' (ver paineis_uf)
+    :return: lista de chart_job
+    '''
 
-    kpi_1a_dose = gf.kpi_total_1dose(df_br)
-    kpi_1a_dose.write_image(os.path.join(ind_path, 'ind-qtd-1dose.svg'))
+    import graph_functions as gf
+    import render_functions as rf
 
-    kpi_2a_dose = gf.kpi_total_2dose(df_br)
-    kpi_2a_dose.write_image(os.path.join(ind_path, 'ind-qtd-2dose.svg'))
+    destino = os.path.join(ufs_path, uf)
+    return [
+        rf.chart_job(f'{uf}_vacinacao_por_dia', gf.graph_vaccination_by_day,
+                     os.path.join(destino, 'vacinacao-por-dia.html'), df_vac=args['df_vac'], compacto=True),
+        rf.chart_job(f'{uf}_casos_ativos', gf.graph_active_cases_cum, os.path.join(destino, 'casos-ativos.html'),
+                     data_BR=args['df'], compacto=True),
+        rf.chart_job(f'{uf}_casos_p_mes', gf.graph_confirmed_cases_by_month, os.path.join(destino, 'casos-p-mes.html'),
+                     p_mes=args['p_mes']),
+        rf.chart_job(f'{uf}_obitos_acumulados', gf.graph_deaths_cum, os.path.join(destino, 'obitos-acumulados.html'),
+                     data_BR=args['df'], compacto=True),
+        rf.chart_job(f'{uf}_obitos_p_mes', gf.graph_deaths_by_month, os.path.join(destino, 'obitos-p-mes.html'),
+                     p_mes=args['p_mes']),
+    ]
+
+
+def paineis_uf(estados: dict, ufs: list = None, executor=None) -> list:
+    '''
+    Gera os KPIs e os gráficos dos painéis por UF, a partir dos recortes já separados na carga (split_states). Os
+    gráficos de todas as UFs são gerados em um único pool de processos (render_fanout)
+    :param estados: dicionário UF -> DataFrame no formato do df_br (ver data_functions.split_states)
+    :param ufs: lista das siglas das UFs. Não sendo informada, gera os painéis de todas as UFs
+    :param executor: pool de processos do modo residente, reaproveitado em vez de um novo pool a cada ciclo (ver
+    render_functions.render_fanout)
+    :return: lista com os caminhos dos arquivos alterados
+    '''
+
+    import aggregate_functions as ag
+    import render_functions as rf
+
+    alterados = []
+    paineis = {}
+    ausentes = sorted(set(ufs or []) - set(estados))
+    if ausentes:
+        logging.warning(f'UFs sem dados na origem - painéis não gerados: {", ".join(ausentes)}')
+
+    for uf in [uf for uf in ufs if uf in estados] if ufs else sorted(estados):
+        agregados = ag.build_aggregates(estados[uf])
+        dv = agregados['diario']
+        dv = dv[dv['vaccinated'].notna()]
+        with span(f'{uf}_kpis', 'grafico'):
+            alterados += write_kpis(compute_kpis(estados[uf]), os.path.join(ufs_path, uf, 'indicadores'), kpi_svgs)
+        os.makedirs(os.path.join(ufs_path, uf), exist_ok=True)
+        paineis[uf] = {'df': estados[uf], 'df_vac': dv, 'p_mes': agregados['mensal']}
+
+    t0 = time.perf_counter()
+    tempos = rf.render_fanout(paineis, jobs_uf, logging, executor=executor,
+                              plotlyjs=rf.write_plotlyjs_asset(maps_path), manifesto=manifest_path)
+    alterados += [t['caminho'] for t in tempos.values() if t['alterado']]
+    logging.info(f'painéis de {len(paineis)} UFs gerados em {time.perf_counter() - t0:.3f}s - '
+                 f'{len(alterados)} arquivos alterados')
+
+    return alterados
+
+
+def atualiza_painel(entradas: dict, memoria: dict = None, executor=None, ufs: list = None, processos: bool = False):
+    '''
+    Carrega os dados, gera os gráficos e KPIs cujas entradas mudaram e registra as entradas processadas
+    :param entradas: retorno de fetch_inputs
+    :param memoria: dicionário mantido entre as atualizações do modo residente, com os conjuntos de dados já carregados
+    (ver fetch_dataframes)
+    :param executor: pool de processos reaproveitado entre as atualizações do modo residente (ver render_charts)
+    :param ufs: siglas das UFs cujos painéis também são gerados ([] para todas). Não sendo informado, gera apenas o
+    painel nacional
+    :param processos: se True, as transformações dos dados executam em um pool de processos - o do modo residente
+    (executor), ou um criado apenas para a carga (ver data_functions.fetch_dataframes)
+    '''
+
+    importa_modulos()
+    import asyncio
+    import pandas as pd
+    import data_functions as df_
+    import graph_functions as gf
+    import aggregate_functions as ag
+    import geo_functions as geo
+    import render_functions as rf
+    import snapshot_functions as sn
+
+    transformacao = None
+    if processos:
+        from concurrent.futures import ProcessPoolExecutor
+        transformacao = executor or ProcessPoolExecutor()
+
+    # Fazendo a carga dos dados atualizados e tratamento dos mesmos
+    try:
+        df_br, df_cities, df_popuf, df_uf, gj_uf_br, paineis = asyncio.run(df_.fetch_dataframes(
+            entradas['cases-brazil-states.csv']['caminho'],
+            entradas['cases-brazil-cities-time.csv.gz']['caminho'],
+            entradas['populacao_2020.xls']['caminho'],
+            entradas['gps_cities.csv']['caminho'],
+            entradas['brasil-uf-compressed.json']['caminho'],
+            chunk_size, logging, cache_dir=cache_path, memoria=memoria, por_uf=ufs is not None,
+            executor_transformacao=transformacao))
+    finally:
+        if transformacao is not None and transformacao is not executor:
+            transformacao.shutdown()
+
+    # snapshots versionados (Parquet/Feather) dos DataFrames transformados, abertos pelos demais consumidores (notebook,
+    # API) sem refazer a carga e a transformação
+    with span('snapshots', 'exportacao') as registro:
+        manifesto = sn.write_snapshots({'df_br': df_br, 'df_cities': df_cities, 'df_popuf': df_popuf, 'df_uf': df_uf},
+                                       snapshots_path, logger=logging)
+        registro['versao'] = manifesto and manifesto['versao']
+
+    #---------------------------------------------------------------------------------------------
+    # preparando os recortes usados pelos gráficos
+    # ---------------------------------------------------------------------------------------------
 
-    kpi_dias_doinicio = gf.kpi_qtd_dias_vac(data_BR=df_br)
-    kpi_dias_doinicio.write_image(os.path.join(ind_path, 'ind-tempo-vacinacao.svg'))
+    # agregados diários, semanais e mensais e marcos da vacinação, atualizados apenas com os novos dias
+    with span('agregados', 'transformacao') as registro:
+        agregados = ag.aggregate_store(df_br, dir_agregados=aggregates_path, logger=logging)
+        registro['linhas'] = len(agregados['diario'])
+    diario, marcos = agregados['diario'], agregados['marcos']
 
     # VACINAS
-    logging.info('Gerando o gráfico de evolução da vacinação')
-    dv = df_br[~df_br['vaccinated'].isna()]     # recorte contendo apenas os registros a partir do início da vacinação
-    dt_inicio_vac = dv['date'].min()            # data de inicio da vacinação no Brasil
-    df_50M = df_br.loc[(df_br['vaccinated'] + df_br['vaccinated_second']) > 49999999].iloc[0] # dados do primeiro dia em que o Brasil alcançou a marca de 50M de doses aplicadas
-    dias_50M = df_50M['date'] - dt_inicio_vac
-    dias_50M = int(str(dias_50M).split()[0]) # número de dias até alcançar a marca de 50M de doses aplicadas no Brasil
-    fig_evol_vac = gf.graph_vaccines_doses_cum(df_vac=dv, df_50M=df_50M, dias_50M=dias_50M)
-    fig_evol_vac.write_html(os.path.join(graphs_path, 'evolucao-vacinacao.html'))
-
-    logging.info('Gerando o gráfico de vacinação por dia')
-    fig_vac_pdia = gf.graph_vaccination_by_day(df_vac=dv)
-    fig_vac_pdia.write_html(os.path.join(graphs_path, 'vacinacao-por-dia.html'))
+    dt_inicio_vac = pd.Timestamp(marcos['inicio_vacinacao'])    # data de inicio da vacinação no Brasil
+    dv = diario.loc[dt_inicio_vac:]                             # recorte contendo apenas os registros a partir do início da vacinação
+    dv = dv[dv['vaccinated'].notna()]
+    df_50M, dias_50M = None, None                               # marca de 50M de doses ainda não alcançada
+    if marcos['doses_50M'] is not None:
+        df_50M = diario.loc[marcos['doses_50M']]                # dados do primeiro dia em que o Brasil alcançou a marca de 50M de doses aplicadas
+        dias_50M = (df_50M['date'] - dt_inicio_vac).days        # número de dias até alcançar a marca de 50M de doses aplicadas no Brasil
+    dias_vacinacao = (dv['date'].max() - dt_inicio_vac).days    # número de dias desde o início da vacinação
 
     # MAPAS
-    logging.info('Gerando gráficos de mapa')
+    # apenas as geometrias das UFs presentes nos dados, em cada variante simplificada
+    geo_uf = {variante: geo.select_features(gj, df_uf['state'].astype(str)) for variante, gj in gj_uf_br.items()}
     cut_labels = df_uf['faixa_perc'].unique().tolist()
     dict_colors = {label: color for label, color in zip(cut_labels, ['#bff7ff', '#8fd1e3', '#3088AE', '#005073'])}
-    map_perc_vacinados = gf.mapbox_cloropleth_percvac(data_UF=df_uf, geo_UF=gj_uf_br, map_colors=dict_colors)
-    map_perc_vacinados.write_html(os.path.join(maps_path, 'mapa_vacinacao.html'))
+    # níveis detalhados do mapa agrupado de municípios, carregados pela página conforme o zoom
+    with span('mapa_casos_p100k_tiles', 'grafico') as registro:
+        tiles_alterados, tiles_removidos = geo.write_cluster_tiles(geo.cluster_levels(df_cities), tiles_path)
+        registro['alterados'] = len(tiles_alterados)
+        registro['removidos'] = len(tiles_removidos)
 
-    map_casos_p100k = gf.mapbox_cases_p100k(df_cities=df_cities)
-    map_casos_p100k.write_html(os.path.join(maps_path, 'mapa-casos-p-100k-h.html'))
+    # CASOS E OBITOS
+    agg_mes = agregados['mensal']
 
-    # CASOS
-    logging.info('Gerando gráfico de casos ativos e confirmados...')
-    fig_casos_ativos_cum = gf.graph_active_cases_cum(df_br)
-    fig_casos_ativos_cum.write_html(os.path.join(graphs_path, 'casos-ativos_x_consorcio.html'))
-
-    per = df_br['date'].dt.to_period('M')
-    agg_mes = df_br.groupby(per).agg({
-        'newDeaths': 'sum',
-        'newCases': 'sum'}).to_timestamp()
-    fig_casos_confirmados  = gf.graph_confirmed_cases_by_month(p_mes=agg_mes)
-    fig_casos_confirmados.write_html(os.path.join(graphs_path, 'casos-p-mes.html'))
+    #---------------------------------------------------------------------------------------------
+    # gerando os KPI's e os gráficos atualizados
+    # ---------------------------------------------------------------------------------------------
+    # KPI's - feed json com todos os indicadores e svg gerados a partir de template, sem o Kaleido
+    with span('kpis', 'grafico') as registro:
+        kpis_alterados = write_kpis(compute_kpis(df_br, t_decorrido=dias_vacinacao), ind_path, kpi_svgs)
+        registro['alterados'] = len(kpis_alterados)
 
-    # OBITOS
-    logging.info('Gerando gráfico de óbitos acumulados e por mês...')
-    fig_obitos_acumulados = gf.graph_deaths_cum(data_BR=df_br)
-    fig_obitos_acumulados.write_html(os.path.join(graphs_path, 'obitos_x_consorcio.html'))
+    chart_job = rf.chart_job
+    charts = [
+        # VACINAS
+        chart_job('evolucao_vacinacao', gf.graph_vaccines_doses_cum, os.path.join(graphs_path, 'evolucao-vacinacao.html'),
+                  df_vac=dv, df_50M=df_50M, dias_50M=dias_50M, compacto=True),
+        chart_job('vacinacao_por_dia', gf.graph_vaccination_by_day, os.path.join(graphs_path, 'vacinacao-por-dia.html'),
+                  df_vac=dv, compacto=True),
+        # MAPAS
+        chart_job('mapa_vacinacao', gf.mapbox_cloropleth_percvac, os.path.join(maps_path, 'mapa_vacinacao.html'),
+                  data_UF=df_uf, geo_UF=geo_uf, map_colors=dict_colors),
+        chart_job('mapa_casos_p100k', gf.mapbox_cases_p100k, os.path.join(maps_path, 'mapa-casos-p-100k-h.html'),
+                  post_script=gf.cluster_tiles_script(os.path.basename(tiles_path)), df_cities=df_cities,
+                  agrupado=True),
+        # CASOS
+        chart_job('casos_ativos', gf.graph_active_cases_cum, os.path.join(graphs_path, 'casos-ativos_x_consorcio.html'),
+                  data_BR=df_br, compacto=True),
+        chart_job('casos_p_mes', gf.graph_confirmed_cases_by_month, os.path.join(graphs_path, 'casos-p-mes.html'),
+                  p_mes=agg_mes),
+        # OBITOS
+        chart_job('obitos_acumulados', gf.graph_deaths_cum, os.path.join(graphs_path, 'obitos_x_consorcio.html'),
+                  data_BR=df_br, compacto=True),
+        chart_job('obitos_p_mes', gf.graph_deaths_by_month, os.path.join(graphs_path, 'obitos-p-mes.html'),
+                  p_mes=agg_mes),
+    ]
 
-    fig_obitos_pmes = gf.graph_deaths_by_month(p_mes=agg_mes)
-    fig_obitos_pmes.write_html(os.path.join(graphs_path, 'obitos-p-mes.html'))
+    logging.info('Gerando os gráficos e KPIs...')
+    plotlyjs = rf.write_plotlyjs_asset(maps_path)  # plotly.js compartilhado, referenciado por todos os html
+    rf.render_charts(charts, logging, plotlyjs=plotlyjs, manifesto=manifest_path, alterados=changed_path,
+                     executor=executor)
+    ufs_alterados = paineis_uf(paineis['estados'], ufs, executor) if ufs is not None else []
+    with open(changed_path, 'a') as f:
+        f.writelines(f'{caminho}\n' for caminho in kpis_alterados + tiles_alterados + ufs_alterados)
+    with open(removed_path, 'w') as f:
+        f.writelines(f'{caminho}\n' for caminho in tiles_removidos)
+    logging.info(f'{len(kpis_alterados)} arquivos de KPIs alterados')
+    logging.info(f'{len(tiles_alterados)} blocos do mapa de municípios alterados, {len(tiles_removidos)} removidos')
 
-    logging.info('FIM')
     record = {'app': 'painel-covid', 'dt_atualizacao': '{:%d/%m/%Y %H:%M}'.format(datetime.now())}
     with open('dt-atualizacao-painel-covid.json', 'w') as atualizacao:
         json.dump(record, atualizacao)
+    save_inputs_state(entradas, inputs_state)
+    logging.info('FIM')
 
-    print('OK!')
 
+def finaliza_trace(prometheus: str = None):
+    '''
+    Grava as métricas das etapas desta execução no arquivo textfile do Prometheus, se informado
+    '''
+
+    if prometheus:
+        write_prometheus(prometheus)
+
+
+def _sinais_worker():
+    '''
+    Inicializador dos workers do pool de processos do modo residente: desfaz os tratadores de sinais herdados do
+    processo principal no fork. O SIGTERM volta ao padrão; SIGINT (Ctrl+C, enviado a todo o grupo de processos) e
+    SIGUSR1 (ex: pkill -USR1 -f, que também encontra os workers) são ignorados - quem os trata é o processo principal
+    '''
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for sinal in (signal.SIGINT, signal.SIGUSR1):
+        signal.signal(sinal, signal.SIG_IGN)
+
+
+def executa_residente(intervalo: int, ao_atualizar: str = None, trace: str = None, prometheus: str = None,
+                      ufs: list = None, force: bool = False, processos: bool = False):
+    '''
+    Modo residente: mantém em memória os conjuntos de dados carregados, o pool de processos dos gráficos e o Kaleido, e
+    verifica as entradas a cada 'intervalo' segundos, ou imediatamente ao receber o sinal SIGUSR1. O painel só é
+    atualizado quando alguma entrada muda. O sinal SIGTERM (ou SIGINT) encerra o serviço ao final do ciclo corrente
+    :param intervalo: intervalo (s) entre as verificações das entradas
+    :param ao_atualizar: comando executado após cada atualização concluída (ex: publicação dos arquivos alterados)
+    :param trace: arquivo JSON lines onde são registradas as etapas de cada ciclo (ver trace_functions)
+    :param prometheus: arquivo textfile do Prometheus atualizado ao final de cada ciclo
+    :param ufs: siglas das UFs cujos painéis também são gerados (ver atualiza_painel)
+    :param force: se True, o primeiro ciclo atualiza o painel mesmo que nenhuma entrada tenha mudado
+    :param processos: se True, as transformações dos dados também executam no pool de processos (ver atualiza_painel)
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    sessao = nova_sessao(conexoes=len(urls))
+    memoria = {}
+    forcar = force
+
+    logging.info(f'Modo residente iniciado (pid {os.getpid()}) - verificando as entradas a cada {intervalo}s')
+    # os workers são criados sob demanda, com fork: o inicializador desfaz neles os tratadores de sinais abaixo
+    with ProcessPoolExecutor(initializer=_sinais_worker) as executor:
+        despertar = threading.Event()
+        encerrar = threading.Event()
+        signal.signal(signal.SIGUSR1, lambda *_: despertar.set())
+        for sinal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sinal, lambda *_: (encerrar.set(), despertar.set()))
+
+        while not encerrar.is_set():
+            configure_tracing(trace)
+            try:
+                entradas = fetch_inputs(urls, download_path, logging, sessao)
+                if forcar or inputs_changed(entradas, inputs_state):
+                    atualiza_painel(entradas, memoria, executor, ufs, processos)
+                    if ao_atualizar:
+                        subprocess.run(ao_atualizar, shell=True, check=True)
+                else:
+                    logging.info('Nenhuma entrada foi alterada desde a última atualização')
+            except Exception:
+                # uma falha (ex: origem indisponível) não encerra o serviço - nova tentativa no próximo ciclo
+                logging.exception('Falha na atualização do painel')
+            forcar = False      # --force vale apenas para o primeiro ciclo
+            finaliza_trace(prometheus)
+            despertar.wait(intervalo)
+            despertar.clear()
+
+    logging.info('Modo residente encerrado')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Atualiza os gráficos e KPIs do painel covid-19')
+    parser.add_argument('--force', action='store_true',
+                        help='atualiza mesmo que nenhuma entrada tenha mudado (modo residente: no primeiro ciclo)')
+    parser.add_argument('--residente', action='store_true',
+                        help='mantém o processo ativo, atualizando o painel sempre que alguma entrada mudar')
+    parser.add_argument('--intervalo', type=int, default=900,
+                        help='modo residente: intervalo (s) entre as verificações das entradas')
+    parser.add_argument('--ao-atualizar', default=None,
+                        help='modo residente: comando executado após cada atualização (ex: publicação)')
+    parser.add_argument('--trace', default=trace_path,
+                        help='arquivo JSON lines onde são registradas as etapas (carga, transformação e gráficos)')
+    parser.add_argument('--prometheus', default=None,
+                        help='arquivo .prom atualizado com as métricas das etapas (textfile collector do node_exporter)')
+    parser.add_argument('--ufs', default=None,
+                        help='gera também os painéis por UF: siglas separadas por vírgula (ex: SP,RJ) ou "todas"')
+    parser.add_argument('--processos', action='store_true',
+                        help='executa as transformações dos dados em um pool de processos (ganho apenas com várias '
+                             'CPUs - ver o estágio run_pipeline.transformacoes do benchmark_covid19.py)')
+    args = parser.parse_args()
+    ufs = None if args.ufs is None else [] if args.ufs.strip().lower() == 'todas' else \
+        [sigla.strip().upper() for sigla in args.ufs.split(',')]
+    invalidas = [sigla for sigla in ufs or [] if sigla not in siglas_uf]
+    if invalidas:
+        parser.error(f'--ufs: siglas inválidas: {", ".join(invalidas) or repr(args.ufs)} '
+                     f'(válidas: {",".join(siglas_uf)} ou "todas")')
+
+    # seta o arquivo que armazenará os logs e as configurações básicas de log
+    logging.basicConfig(filename='gera_graficos_covid.log',
+                        filemode='a' if args.residente else 'w',
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        datefmt='%d/%m/%Y %H:%M:%S',
+                        level=logging.INFO)
+
+    if args.residente:
+        executa_residente(args.intervalo, args.ao_atualizar, args.trace, args.prometheus, ufs, args.force,
+                          args.processos)
+        sys.exit(0)
+
+    configure_tracing(args.trace)
+
+    # Download condicional das entradas - se nenhuma mudou desde a última execução, não há o que atualizar
+    entradas = fetch_inputs(urls, download_path, logging)
+
+    if not args.force and not inputs_changed(entradas, inputs_state):
+        logging.info(f'Nenhuma entrada foi alterada desde a última execução ({time.perf_counter() - INICIO:.3f}s). FIM')
+        open(changed_path, 'w').close()     # nenhum arquivo a ser publicado
+        open(removed_path, 'w').close()     # nem removido
+        finaliza_trace(args.prometheus)
+        print('OK!')
+        sys.exit(0)
+
+    atualiza_painel(entradas, ufs=ufs, processos=args.processos)
+    finaliza_trace(args.prometheus)
+
+    print('OK!')
@@ -0,0 +1,174 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import math
+from xml.sax.saxutils import escape
+
+
+# Prefixos SI usados na formatação dos valores (mesmos do formato 's' do d3/plotly)
+PREFIXOS_SI = {-24: 'y', -21: 'z', -18: 'a', -15: 'f', -12: 'p', -9: 'n', -6: 'µ', -3: 'm', 0: '', 3: 'k', 6: 'M',
+               9: 'G', 12: 'T', 15: 'P', 18: 'E', 21: 'Z', 24: 'Y'}
+# Dígitos significativos do valor e da variação dos indicadores (valueformat ',.4s' e ',.5s' dos antigos KPIs)
+DIGITOS_VALOR = 4
+DIGITOS_DELTA = 5
+# Cores da variação positiva e negativa (padrão do go.Indicator)
+CORES_DELTA = {'▲': '#3D9970', '▼': '#FF4136'}
+
+# Template dos indicadores em svg - mesmo tamanho (300x200) das imagens geradas anteriormente pelo Kaleido
+TEMPLATE_SVG = '''<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" height="{altura}" viewBox="0 0 {largura} {altura}">
+<g font-family="'Open Sans', verdana, arial, sans-serif" fill="#444" text-anchor="middle">
+<text x="{centro}" y="{y_titulo}" font-size="17">{titulo}</text>
+<text x="{centro}" y="{y_valor}" font-size="{fonte_valor}">{texto}</text>
+{delta}</g>
+</svg>
+'''
+TEMPLATE_SVG_DELTA = '<text x="{centro}" y="{y_delta}" font-size="25" fill="{cor}">{texto_delta}</text>\n'
+
+
+# --------------------------------------------------------------------------------------------
+# Cálculo dos indicadores
+# --------------------------------------------------------------------------------------------
+def si_format(valor: float, digitos: int) -> str:
+    '''
+    Formata um número com 'digitos' dígitos significativos e prefixo SI (ex: 52340000 -> '52.34M'), equivalente ao
+    formato ',.<digitos>s' do d3 usado pelo plotly
+    :param valor: número a ser formatado
+    :param digitos: quantidade de dígitos significativos
+    :return: texto formatado ('-' para valores não finitos, ex: NaN)
+    '''
+
+    if not math.isfinite(valor):
+        return '-'
+
+    sinal = '-' if valor < 0 else ''
+    mantissa, expoente = f'{abs(float(valor)):.{digitos - 1}e}'.split('e')
+    expoente = int(expoente) if float(mantissa) else 0
+    k = max(-24, min(24, expoente // 3 * 3))
+    decimais = max(0, digitos - 1 - (expoente - k))
+
+    return f'{sinal}{float(mantissa) * 10 ** (expoente - k):.{decimais}f}{PREFIXOS_SI[k]}'
+
+
+def _indicador(titulo: str, valor, anterior=None, texto: str = None) -> dict:
+    '''
+    Monta um indicador com o valor e, se informado o valor anterior, a variação em relação a ele
+    '''
+
+    valor = float(valor)
+    indicador = {'titulo': titulo, 'valor': valor, 'texto': texto or si_format(valor, DIGITOS_VALOR)}
+    if anterior is not None:
+        delta = valor - float(anterior)
+        indicador['delta'] = delta
+        indicador['texto_delta'] = ('▲' if delta >= 0 else '▼') + si_format(abs(delta), DIGITOS_DELTA)
+
+    return indicador
+
+
+def _ultimos(serie) -> tuple:
+    '''
+    Último e penúltimo valores não nulos de uma coluna - a origem pode publicar o último dia ainda sem os dados de
+    vacinação
+    :return: (último valor (0 se não houver nenhum), penúltimo valor ou None)
+    '''
+
+    valores = serie.dropna().to_numpy()[-2:]
+    if len(valores) == 0:
+        return 0.0, None
+
+    return valores[-1], (valores[0] if len(valores) == 2 else None)
+
+
+def compute_kpis(df_br, t_decorrido: int = None) -> dict:
+    '''
+    Calcula todos os indicadores do painel a partir dos dois últimos valores (não nulos) de cada coluna de df_br. Sem o
+    valor anterior (ex: primeiro dia da série), o indicador não tem variação
+    :param df_br: DataFrame df_br (transform_dfbr)
+    :param t_decorrido: quantidade de dias desde o início da vacinação (ver aggregate_functions). Não sendo
+    informada, é calculada a partir do df_br
+    :return: dicionário com a 'data' do último registro e os 'indicadores' (nome -> dict com 'titulo', 'valor',
+    'texto' e, quando houver, 'delta' e 'texto_delta')
+    '''
+
+    dose1, dose1_anterior = _ultimos(df_br['vaccinated'])
+    dose2, dose2_anterior = _ultimos(df_br['vaccinated_second'])
+
+    if t_decorrido is None:
+        datas_vac = df_br.loc[df_br['vaccinated'].notna(), 'date']
+        t_decorrido = (datas_vac.max() - datas_vac.min()).days if len(datas_vac) else 0
+
+    return {
+        'data': str(df_br['date'].iloc[-1].date()),
+        'indicadores': {
+            'doses_aplicadas': _indicador('Doses aplicadas', dose1 + dose2),
+            '1a_dose': _indicador('1ª Dose', dose1, dose1_anterior),
+            '2a_dose': _indicador('2ª Dose', dose2, dose2_anterior),
+            'dias_vacinacao': _indicador('Tempo decorrido', t_decorrido, texto=str(int(t_decorrido))),
+        },
+    }
+
+
+# --------------------------------------------------------------------------------------------
+# Gravação do feed json e dos svg
+# --------------------------------------------------------------------------------------------
+def kpi_svg(indicador: dict, largura: int = 300, altura: int = 200) -> str:
+    '''
+    Gera o svg de um indicador a partir de TEMPLATE_SVG, sem depender do Kaleido/navegador
+    :param indicador: indicador (ver compute_kpis)
+    :param largura: largura da imagem
+    :param altura: altura da imagem
+    :return: conteúdo do svg
+    '''
+
+    centro = largura / 2
+    delta = ''
+    if 'texto_delta' in indicador:
+        texto_delta = indicador['texto_delta']
+        delta = TEMPLATE_SVG_DELTA.format(centro=centro, y_delta=altura * 0.82, cor=CORES_DELTA[texto_delta[0]],
+                                          texto_delta=escape(texto_delta))
+
+    return TEMPLATE_SVG.format(largura=largura, altura=altura, centro=centro, y_titulo=altura * 0.2,
+                               y_valor=altura * (0.6 if delta else 0.68), fonte_valor=50 if delta else 60,
+                               titulo=escape(indicador['titulo']), texto=escape(indicador['texto']), delta=delta)
+
+
+def _grava_se_alterado(caminho: str, conteudo: bytes) -> bool:
+    '''
+    Grava um arquivo de forma atômica, apenas se o conteúdo for diferente do já gravado
+    :return: True se o arquivo foi gravado
+    '''
+
+    if os.path.exists(caminho):
+        with open(caminho, 'rb') as f:
+            if f.read() == conteudo:
+                return False
+
+    tmp = caminho + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(conteudo)
+    os.replace(tmp, caminho)
+
+    return True
+
+
+def write_kpis(kpis: dict, destino_dir: str, svgs: dict = None, feed: str = 'kpis.json') -> list:
+    '''
+    Grava o feed json com todos os indicadores e, opcionalmente, um svg por indicador. Apenas os arquivos cujo conteúdo
+    mudou são gravados
+    :param kpis: retorno de compute_kpis
+    :param destino_dir: diretório dos indicadores
+    :param svgs: dicionário nome do indicador -> nome do arquivo svg. Não sendo informado, grava apenas o feed
+    :param feed: nome do arquivo json
+    :return: lista com os caminhos dos arquivos gravados
+    '''
+
+    os.makedirs(destino_dir, exist_ok=True)
+    arquivos = {os.path.join(destino_dir, feed): json.dumps(kpis, ensure_ascii=False, indent=2, sort_keys=True)}
+    for nome, arquivo in (svgs or {}).items():
+        arquivos[os.path.join(destino_dir, arquivo)] = kpi_svg(kpis['indicadores'][nome])
+
+    return [caminho for caminho, conteudo in arquivos.items() if _grava_se_alterado(caminho, conteudo.encode('utf-8'))]
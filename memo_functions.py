@@ -0,0 +1,165 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import hashlib
+import pandas as pd
+import plotly
+from spec_functions import to_json
+from render_functions import code_version as versao_codigo
+
+
+# Cache das figuras: diretório (None = desativado) e tamanho máximo (bytes) do diretório
+CACHE_FIGURAS = {'dir': None, 'limite': 64 * 2 ** 20}
+
+
+def configure_figure_cache(diretorio: str = None, limite: int = 64 * 2 ** 20):
+    '''
+    Configura o cache das figuras (ver memoize_figure). Deve ser chamada antes da criação dos pools de processos, que
+    herdam a configuração
+    :param diretorio: diretório do cache. Não sendo informado, o cache é desativado
+    :param limite: tamanho máximo (bytes) do cache; os arquivos usados há mais tempo são removidos ao ultrapassá-lo
+    '''
+
+    CACHE_FIGURAS['dir'] = diretorio
+    CACHE_FIGURAS['limite'] = limite
+
+
+def serialize_figure(figura) -> str:
+    '''
+    Serializa a figura retornada por um builder: dicionário montado com spec_functions (serializado com o orjson, quando
+    instalado) ou Figure do plotly (fig.to_json())
+    '''
+
+    return to_json(figura) if isinstance(figura, dict) else figura.to_json()
+
+
+# --------------------------------------------------------------------------------------------
+# Chave das figuras: versão do builder e hash das entradas relevantes
+# --------------------------------------------------------------------------------------------
+def code_version(builder) -> str:
+    '''
+    Versão do código de um builder: código da função (recursivamente) e código-fonte dos módulos auxiliares (ver
+    render_functions.code_version), e versão do plotly
+    '''
+
+    h = hashlib.sha256(versao_codigo(builder).encode())
+    h.update(plotly.__version__.encode())
+
+    return h.hexdigest()
+
+
+def _hash_argumento(h, valor, colunas: list = None):
+    '''
+    Acumula no hash h um argumento do builder. De DataFrames entram apenas as colunas relevantes (e o índice)
+    '''
+
+    if isinstance(valor, pd.DataFrame):
+        if colunas is not None:
+            valor = valor[[col for col in colunas if col in valor.columns]]
+        h.update(repr(list(valor.columns)).encode())
+        h.update(pd.util.hash_pandas_object(valor, index=True).values.tobytes())
+    elif isinstance(valor, pd.Series):
+        h.update(pd.util.hash_pandas_object(valor.astype(str), index=True).values.tobytes())
+    elif isinstance(valor, (dict, list)):
+        h.update(json.dumps(valor, sort_keys=True, default=str).encode())
+    else:
+        h.update(repr(valor).encode())
+
+
+def figure_key(builder, versao: str, argumentos: dict, colunas: dict) -> str:
+    '''
+    Chave de uma figura no cache
+    :param builder: função de graph_functions
+    :param versao: versão do código do builder (ver code_version)
+    :param argumentos: argumentos nomeados da chamada
+    :param colunas: dicionário argumento -> colunas relevantes (ver memoize_figure)
+    :return: hash em hexadecimal
+    '''
+
+    h = hashlib.sha256(f'{builder.__module__}.{builder.__qualname__}:{versao}'.encode())
+    for nome in sorted(argumentos):
+        h.update(nome.encode())
+        _hash_argumento(h, argumentos[nome], colunas.get(nome))
+
+    return h.hexdigest()
+
+
+# --------------------------------------------------------------------------------------------
+# Armazenamento em disco com remoção LRU
+# --------------------------------------------------------------------------------------------
+def _evict(diretorio: str, limite: int):
+    '''
+    Remove as figuras usadas há mais tempo (data de modificação, atualizada a cada acerto) até o cache caber no limite
+    '''
+
+    arquivos = []
+    for entrada in os.scandir(diretorio):
+        if entrada.name.endswith('.json'):
+            info = entrada.stat()
+            arquivos.append((info.st_mtime, info.st_size, entrada.path))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite:
+            break
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass    # já removido por outro worker
+        total -= tamanho
+
+
+def memoize_figure(colunas: dict = None):
+    '''
+    Decorator dos builders de graph_functions que acrescenta ao builder o ponto de entrada builder.cached(...): mesmos
+    argumentos do builder, mas retorna a figura serializada (json), guardada em disco e identificada pela versão do
+    código do builder e pelo hash das entradas. Quando as entradas não mudam, retorna o json guardado sem construir e
+    validar a figura novamente. Com o cache desativado (ver configure_figure_cache), apenas serializa a figura. A
+    chamada direta do builder não é alterada e continua retornando a figura
+    :param colunas: dicionário nome do argumento -> lista das colunas do DataFrame usadas pelo builder. Argumentos não
+    informados entram inteiros no hash
+    :return: decorator
+    '''
+
+    colunas = colunas or {}
+
+    def decorator(builder):
+        versao = code_version(builder)
+        nomes = builder.__code__.co_varnames[:builder.__code__.co_argcount]
+        padroes = dict(zip(nomes[len(nomes) - len(builder.__defaults__ or ()):], builder.__defaults__ or ()))
+
+        def cached(*args, **kwargs) -> str:
+            diretorio = CACHE_FIGURAS['dir']
+            if diretorio is None:
+                return serialize_figure(builder(*args, **kwargs))
+
+            argumentos = dict(padroes, **dict(zip(nomes, args)), **kwargs)
+            caminho = os.path.join(diretorio, figure_key(builder, versao, argumentos, colunas) + '.json')
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    figura = f.read()
+                os.utime(caminho)     # registra o uso, para a remoção LRU
+                return figura
+            except FileNotFoundError:
+                pass
+
+            figura = serialize_figure(builder(*args, **kwargs))
+            os.makedirs(diretorio, exist_ok=True)
+            tmp = f'{caminho}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(figura)
+            os.replace(tmp, caminho)
+            _evict(diretorio, CACHE_FIGURAS['limite'])
+
+            return figura
+
+        builder.cached = cached
+        builder.versao = versao
+        return builder
+
+    return decorator
@@ -0,0 +1,115 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import numpy as np
+import pandas as pd
+from fetch_functions import sha256_arquivo
+
+
+# UFs: código IBGE, sigla e nome (como escrito na aba 'BRASIL E UFs' da planilha do IBGE)
+UFS = [
+    (11, 'RO', 'Rondônia'), (12, 'AC', 'Acre'), (13, 'AM', 'Amazonas'), (14, 'RR', 'Roraima'), (15, 'PA', 'Pará'),
+    (16, 'AP', 'Amapá'), (17, 'TO', 'Tocantins'), (21, 'MA', 'Maranhão'), (22, 'PI', 'Piauí'), (23, 'CE', 'Ceará'),
+    (24, 'RN', 'Rio Grande do Norte'), (25, 'PB', 'Paraíba'), (26, 'PE', 'Pernambuco'), (27, 'AL', 'Alagoas'),
+    (28, 'SE', 'Sergipe'), (29, 'BA', 'Bahia'), (31, 'MG', 'Minas Gerais'), (32, 'ES', 'Espírito Santo'),
+    (33, 'RJ', 'Rio de Janeiro'), (35, 'SP', 'São Paulo'), (41, 'PR', 'Paraná'), (42, 'SC', 'Santa Catarina'),
+    (43, 'RS', 'Rio Grande do Sul'), (50, 'MS', 'Mato Grosso do Sul'), (51, 'MT', 'Mato Grosso'), (52, 'GO', 'Goiás'),
+    (53, 'DF', 'Distrito Federal'),
+]
+# Argumentos de leitura da planilha de população estimada do IBGE (populacao_2020.xls)
+ARGS_PLANILHA = dict(sheet_name=['BRASIL E UFs', 'Municípios'], skiprows=1, skipfooter=7)
+
+
+# --------------------------------------------------------------------------------------------
+# Normalização da planilha do IBGE
+# --------------------------------------------------------------------------------------------
+def clean_population(serie) -> 'Series':
+    '''
+    Converte a coluna POPULAÇÃO ESTIMADA em inteiros. Valores em texto, com separador de milhar e referência a notas
+    entre () (ex: '7.113.540(4)', '33049 (2)'), são tratados de forma vetorizada
+    :param serie: coluna POPULAÇÃO ESTIMADA
+    :return: Pandas Series (Int64 - valores ausentes como <NA>)
+    '''
+
+    numeros = pd.to_numeric(serie, errors='coerce')
+    textos = serie[numeros.isna() & serie.notna()].astype(str)
+    numeros.update(pd.to_numeric(textos.str.extract(r'^\s*([\d.]+)', expand=False).str.replace('.', '', regex=False),
+                                 errors='coerce'))
+
+    return numeros.round().astype('Int64')
+
+
+def normalize_population(planilhas: dict) -> dict:
+    '''
+    Normaliza as abas da planilha de população estimada do IBGE. As UFs da aba 'BRASIL E UFs' (identificadas apenas
+    pelo nome) recebem o código IBGE da tabela UFS, e a sigla é obtida da aba 'Municípios' pelo código da UF
+    :param planilhas: dicionário de DataFrames retornado pelo pd.read_excel (ver ARGS_PLANILHA)
+    :return: dicionário com os DataFrames 'uf' (NM_UF, POPULACAO, UF, CD_UF) e 'municipios' (ibgeID, UF, CD_UF,
+    NM_MUNIC, POPULACAO)
+    '''
+
+    # ---- Municípios: linhas com código da UF (exclui o rodapé de fontes e notas) ----
+    munic = planilhas['Municípios']
+    munic = munic[munic['COD. UF'].notna() & munic['COD. MUNIC'].notna()]
+    cd_uf = munic['COD. UF'].to_numpy(dtype=np.int64)
+    pop_munic = pd.DataFrame({
+        'ibgeID': cd_uf * 100000 + munic['COD. MUNIC'].to_numpy(dtype=np.int64),
+        'UF': munic['UF'].str.strip().to_numpy(),
+        'CD_UF': cd_uf,
+        'NM_MUNIC': munic['NOME DO MUNICÍPIO'].to_numpy(),
+        'POPULACAO': clean_population(munic['POPULAÇÃO ESTIMADA']).to_numpy(dtype=np.int64),
+    })
+
+    # ---- UFs: junção pelo nome com a tabela UFS (exclui Brasil, Regiões e rodapé) e pelo código com os municípios ----
+    uf = planilhas['BRASIL E UFs']
+    nomes = pd.DataFrame(UFS, columns=['CD_UF', 'SIGLA', 'NM_UF']).drop(columns='SIGLA')
+    pop_uf = pd.DataFrame({
+        'NM_UF': uf.iloc[:, 0].astype(str).str.strip(),
+        'POPULACAO': clean_population(uf['POPULAÇÃO ESTIMADA']),
+    }).merge(nomes, on='NM_UF', how='inner')
+    siglas = pop_munic[['CD_UF', 'UF']].drop_duplicates('CD_UF')
+    pop_uf = pop_uf.merge(siglas, on='CD_UF', how='left')[['NM_UF', 'POPULACAO', 'UF', 'CD_UF']]
+    pop_uf['POPULACAO'] = pop_uf['POPULACAO'].astype(np.int64)
+
+    return {'uf': pop_uf, 'municipios': pop_munic}
+
+
+# --------------------------------------------------------------------------------------------
+# Cache local das tabelas normalizadas
+# --------------------------------------------------------------------------------------------
+def _registros(df) -> 'ndarray':
+    '''
+    Converte um DataFrame em array estruturado, com as colunas de texto em unicode de tamanho fixo
+    '''
+
+    return np.rec.fromarrays([df[coluna].to_numpy(dtype=str if df[coluna].dtype == object else None)
+                              for coluna in df.columns], names=list(df.columns))
+
+
+def load_population(data_url: str, cache_dir: str) -> dict:
+    '''
+    Carrega as tabelas normalizadas de população (ver normalize_population) do cache local, identificado pelo hash da
+    planilha. A planilha só é lida (e o cache gravado) quando muda - a cada nova estimativa anual do IBGE
+    :param data_url: caminho da planilha de população estimada do IBGE
+    :param cache_dir: diretório do cache
+    :return: dicionário com os DataFrames 'uf' e 'municipios'
+    '''
+
+    caminho = os.path.join(cache_dir, 'populacao', f'pop-{sha256_arquivo(data_url)[:16]}.npz')
+
+    if os.path.exists(caminho):
+        with np.load(caminho) as arquivo:
+            return {tabela: pd.DataFrame(arquivo[tabela]) for tabela in arquivo.files}
+
+    tabelas = normalize_population(pd.read_excel(data_url, **ARGS_PLANILHA))
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = caminho + '.tmp.npz'
+    np.savez_compressed(tmp, **{tabela: _registros(df) for tabela, df in tabelas.items()})
+    os.replace(tmp, caminho)
+
+    return tabelas
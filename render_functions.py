@@ -0,0 +1,440 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import time
+import hashlib
+import inspect
+import importlib.util
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+import pandas as pd
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from trace_functions import record_span
+
+
+FORMATOS_HTML = ('html',)
+# Módulos usados pelos builders dos gráficos: alterações no código deles também mudam o hash das entradas (input_hash)
+MODULOS_BUILDERS = ('graph_functions', 'spec_functions', 'geo_functions')
+# Dados dos painéis do fan-out (render_fanout), herdados pelos workers via fork (copy-on-write) em vez de serializados
+# em cada job: (painel, nome do argumento) -> valor
+COMPARTILHADOS = {}
+
+
+# --------------------------------------------------------------------------------------------
+# Bundle compartilhado do plotly.js
+# --------------------------------------------------------------------------------------------
+def write_plotlyjs_asset(destino_dir: str) -> str:
+    '''
+    Grava, uma única vez, o plotly.js em um arquivo versionado e identificado pelo hash do conteúdo, para ser
+    referenciado pelos gráficos html em vez de embutido em cada um deles
+    :param destino_dir: diretório onde o arquivo será gravado
+    :return: caminho do arquivo plotly.js
+    '''
+
+    conteudo = get_plotlyjs().encode('utf-8')
+    nome = f'plotly-{get_plotlyjs_version()}-{hashlib.sha256(conteudo).hexdigest()[:10]}.min.js'
+    caminho = os.path.join(destino_dir, nome)
+
+    if not os.path.exists(caminho):
+        os.makedirs(destino_dir, exist_ok=True)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(conteudo)
+        os.replace(tmp, caminho)
+
+    return caminho
+
+
+def _src_plotlyjs(plotlyjs: str, caminho: str) -> str:
+    '''
+    Retorna o endereço do plotly.js relativo ao arquivo html que o referencia. Sem o arquivo compartilhado
+    (plotlyjs=None), retorna o endereço da CDN do plotly.js, na mesma versão da biblioteca
+    '''
+
+    if plotlyjs is None:
+        return f'https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js'
+
+    return os.path.relpath(plotlyjs, os.path.dirname(caminho) or '.').replace(os.sep, '/')
+
+
+def write_panel_html(divs: list, caminho: str, plotlyjs: str, titulo: str = 'Painel Covid-19'):
+    '''
+    Grava, de forma atômica (ver write_if_changed), uma única página html com vários gráficos, que compartilham o mesmo
+    plotly.js
+    :param divs: lista com os trechos html (div) de cada gráfico - fig.to_html(full_html=False, include_plotlyjs=False)
+    :param caminho: caminho do arquivo html
+    :param plotlyjs: caminho do arquivo plotly.js (ver write_plotlyjs_asset). Sendo None, a página referencia o
+    plotly.js da CDN
+    :param titulo: título da página
+    '''
+
+    html = (
+        '<html>\n<head><meta charset="utf-8" /><title>' + titulo + '</title>\n'
+        '<script src="' + _src_plotlyjs(plotlyjs, caminho) + '"></script></head>\n<body>\n'
+        + '\n'.join(divs) +
+        '\n</body>\n</html>'
+    )
+
+    write_if_changed(caminho, html.encode('utf-8'))
+
+
+# --------------------------------------------------------------------------------------------
+# Manifesto dos artefatos gerados - grava apenas o que mudou
+# --------------------------------------------------------------------------------------------
+def _hash_valor(h, valor):
+    '''
+    Acumula no hash h o conteúdo de um argumento de builder (DataFrame, Series, dict, list ou valor simples)
+    '''
+
+    if isinstance(valor, pd.Series):
+        valor = valor.to_frame()
+
+    if isinstance(valor, pd.DataFrame):
+        h.update(repr(valor.dtypes.to_dict()).encode())
+        # colunas object (ex: registro com tipos mistos) entram no hash pela representação textual
+        _df = valor.astype({col: str for col in valor.columns[valor.dtypes == object]})
+        h.update(pd.util.hash_pandas_object(_df, index=True).values.tobytes())
+    elif isinstance(valor, dict):
+        for chave in sorted(valor, key=str):
+            h.update(repr(chave).encode())
+            _hash_valor(h, valor[chave])
+    elif isinstance(valor, (list, tuple)):
+        for item in valor:
+            _hash_valor(h, item)
+    else:
+        h.update(repr(valor).encode())
+
+
+def _hash_codigo(h, codigo):
+    '''
+    Acumula no hash h um objeto de código: bytecode, nomes referenciados e constantes, incluindo as funções internas,
+    lambdas e compreensões (objetos de código entre as constantes)
+    '''
+
+    h.update(codigo.co_code)
+    h.update(repr((codigo.co_names, codigo.co_varnames)).encode())
+    for constante in codigo.co_consts:
+        if inspect.iscode(constante):
+            _hash_codigo(h, constante)
+        elif isinstance(constante, frozenset):
+            # a ordem de iteração de um frozenset de textos varia entre processos (PYTHONHASHSEED)
+            h.update(repr(sorted(constante, key=repr)).encode())
+        else:
+            h.update(repr(constante).encode())
+
+
+@lru_cache(maxsize=None)
+def source_version(modulos: tuple = MODULOS_BUILDERS) -> str:
+    '''
+    Hash do código-fonte dos módulos informados, calculado uma vez por processo (o código já carregado não muda)
+    :param modulos: nomes dos módulos
+    :return: hash em hexadecimal
+    '''
+
+    h = hashlib.sha256()
+    for modulo in modulos:
+        especificacao = importlib.util.find_spec(modulo)
+        h.update(modulo.encode())
+        if especificacao is not None and especificacao.origin and os.path.isfile(especificacao.origin):
+            with open(especificacao.origin, 'rb') as f:
+                h.update(f.read())
+
+    return h.hexdigest()
+
+
+def code_version(builder, modulos: tuple = MODULOS_BUILDERS) -> str:
+    '''
+    Versão do código de um builder: nome, bytecode e constantes (recursivamente) da função e código-fonte dos módulos
+    auxiliares que ela usa - o bytecode não reflete alterações nas funções chamadas pelo builder
+    :param builder: função que monta a figura (sem decorators - ver inspect.unwrap)
+    :param modulos: nomes dos módulos auxiliares
+    :return: hash em hexadecimal
+    '''
+
+    h = hashlib.sha256(f'{builder.__module__}.{builder.__qualname__}'.encode())
+    _hash_codigo(h, builder.__code__)
+    h.update(source_version(modulos).encode())
+
+    return h.hexdigest()
+
+
+def input_hash(job: dict) -> str:
+    '''
+    Calcula o hash das entradas de um gráfico: versão do código do builder (ver code_version), argumentos e opções de
+    saída
+    :param job: descrição do gráfico (ver chart_job)
+    :return: hash em hexadecimal
+    '''
+
+    h = hashlib.sha256()
+    builder = inspect.unwrap(job['builder'])     # código do builder, não o de eventuais decorators
+    h.update(code_version(builder).encode())
+    _hash_valor(h, [job['formato'], job.get('plotlyjs'), job.get('post_script'), _resolve_kwargs(job['kwargs'])])
+
+    return h.hexdigest()
+
+
+def write_if_changed(caminho: str, conteudo: bytes, hash_anterior: str = None) -> tuple:
+    '''
+    Grava um arquivo de forma atômica (arquivo temporário + rename), apenas se o conteúdo mudou
+    :param caminho: caminho do arquivo
+    :param conteudo: conteúdo a ser gravado
+    :param hash_anterior: hash SHA-256 do conteúdo gravado anteriormente
+    :return: (hash do conteúdo, True se o arquivo foi gravado)
+    '''
+
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    if hash_conteudo == hash_anterior and os.path.exists(caminho):
+        return hash_conteudo, False
+
+    tmp = caminho + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(conteudo)
+    os.replace(tmp, caminho)
+
+    return hash_conteudo, True
+
+
+def _le_manifesto(caminho: str) -> dict:
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _poda_manifesto(registros: dict, caminhos: list) -> dict:
+    '''
+    Remove do manifesto as entradas de gráficos que não são mais gerados: arquivos que já não existem e arquivos nos
+    diretórios dos gráficos desta execução que não estão entre eles. O manifesto é compartilhado com outros conjuntos
+    de gráficos (ex: os painéis por UF, em outros diretórios), cujas entradas são mantidas
+    :param registros: entradas do manifesto (caminho -> hashes)
+    :param caminhos: caminhos dos gráficos desta execução
+    :return: entradas mantidas
+    '''
+
+    caminhos = set(caminhos)
+    diretorios = {os.path.dirname(caminho) for caminho in caminhos}
+
+    return {caminho: registro for caminho, registro in registros.items()
+            if caminho in caminhos or (os.path.dirname(caminho) not in diretorios and os.path.exists(caminho))}
+
+
+# --------------------------------------------------------------------------------------------
+# Funções de execução dos gráficos
+# --------------------------------------------------------------------------------------------
+def chart_job(nome: str, builder, caminho: str, formato: str = None, post_script: str = None, **kwargs) -> dict:
+    '''
+    Monta a descrição declarativa de um gráfico a ser gerado
+    :param nome: nome do gráfico, usado nos logs
+    :param builder: função de graph_functions que gera o Plotly Fig object
+    :param caminho: caminho do arquivo de saída
+    :param formato: formato de saída: html|svg|png etc. Não sendo informado, é obtido da extensão do caminho
+    :param post_script: código javascript executado após a criação do gráfico html ('{plot_id}' é substituído pelo id
+    da div do gráfico)
+    :param kwargs: argumentos passados ao builder (DataFrames de entrada etc)
+    :return: dicionário com a descrição do gráfico
+    '''
+
+    formato = formato or os.path.splitext(caminho)[1].lstrip('.')
+
+    return dict(nome=nome, builder=builder, caminho=caminho, formato=formato, post_script=post_script, kwargs=kwargs)
+
+
+def shared(painel: str, nome: str) -> dict:
+    '''
+    Referência a um argumento de builder guardado em COMPARTILHADOS (ver render_fanout), resolvida pelo worker
+    :param painel: identificador do painel (ex: sigla da UF)
+    :param nome: nome do argumento
+    :return: dicionário de referência, usado no lugar do valor nos kwargs do chart_job
+    '''
+
+    return {'_compartilhado': (painel, nome)}
+
+
+def _resolve_kwargs(kwargs: dict) -> dict:
+    '''
+    Substitui as referências criadas por shared pelos valores guardados em COMPARTILHADOS
+    '''
+
+    return {nome: COMPARTILHADOS[valor['_compartilhado']] if isinstance(valor, dict) and '_compartilhado' in valor
+            else valor for nome, valor in kwargs.items()}
+
+
+def _build_chart(job: dict) -> tuple:
+    '''
+    Executa o builder de um gráfico. Gráficos html são gravados diretamente pelo worker; para os formatos estáticos
+    retorna a figura como dicionário, para ser exportada pelo processo principal com o Kaleido. Builders com cache de
+    figuras (builder.cached - ver memo_functions) retornam a figura já serializada, que não passa novamente pela
+    validação do plotly
+    :param job: descrição do gráfico (ver chart_job)
+    :return: (figura (dict), trecho html ou None, tempo de construção, tempo de gravação, hash do arquivo gravado,
+    True se o arquivo foi alterado)
+    '''
+
+    t0 = time.perf_counter()
+    builder = getattr(job['builder'], 'cached', job['builder'])
+    fig = builder(**_resolve_kwargs(job['kwargs']))
+    if isinstance(fig, str):
+        fig = json.loads(fig)
+    t_build = time.perf_counter() - t0
+
+    if job['formato'] in FORMATOS_HTML:
+        t0 = time.perf_counter()
+        if job.get('pagina'):
+            # trecho do gráfico para a página única do painel
+            return (pio.to_html(fig, full_html=False, include_plotlyjs=False, div_id=job['nome'],
+                                post_script=job.get('post_script'), validate=False), t_build, 0.0, None, False)
+        plotlyjs = _src_plotlyjs(job['plotlyjs'], job['caminho']) if job.get('plotlyjs') else True
+        # div_id fixo para que o mesmo gráfico gere sempre o mesmo html
+        conteudo = pio.to_html(fig, include_plotlyjs=plotlyjs, div_id=job['nome'], post_script=job.get('post_script'),
+                               validate=False).encode('utf-8')
+        hash_saida, alterado = write_if_changed(job['caminho'], conteudo, job.get('hash_saida'))
+        return None, t_build, time.perf_counter() - t0, hash_saida, alterado
+
+    return (fig if isinstance(fig, dict) else fig.to_dict()), t_build, 0.0, None, False
+
+
+def render_charts(jobs: list, logger, max_workers: int = None, processos: bool = True, plotlyjs: str = None,
+                  pagina: str = None, manifesto: str = None, alterados: str = None, executor=None) -> dict:
+    '''
+    Gera os gráficos em paralelo. A construção das figuras e a gravação dos html ocorrem em um pool de workers; as
+    exportações estáticas (svg, png) são feitas no processo principal, reaproveitando um único processo do Kaleido
+    :param jobs: lista de gráficos a serem gerados (ver chart_job)
+    :param logger: biblioteca para registrar os passos e os tempos de cada gráfico
+    :param max_workers: quantidade de workers. Não sendo informado, usa a quantidade de CPUs
+    :param processos: se True usa um pool de processos, senão um pool de threads
+    :param plotlyjs: caminho do plotly.js compartilhado (ver write_plotlyjs_asset). Não sendo informado, o plotly.js é
+    embutido em cada html
+    :param pagina: caminho de uma página html única contendo todos os gráficos html, na ordem dos jobs. Sem o plotlyjs,
+    a página referencia o plotly.js da CDN. Não sendo informado, cada gráfico é gravado no seu próprio arquivo
+    :param manifesto: arquivo json com os hashes das entradas e das saídas de cada gráfico. Sendo informado, os gráficos
+    cujas entradas não mudaram não são gerados novamente, e os arquivos só são gravados quando o conteúdo muda. As
+    entradas de gráficos que deixaram de ser gerados são removidas (ver _poda_manifesto)
+    :param alterados: arquivo texto onde é gravada a lista dos arquivos alterados nesta execução (um por linha), para
+    que a publicação copie apenas o que mudou
+    :param executor: pool de workers já criado, reaproveitado entre chamadas (modo residente). Não sendo informado, é
+    criado um pool (ver max_workers e processos) encerrado ao final
+    :return: dicionário cujo chave é o nome do gráfico e o valor é um dict com os tempos 'build', 'write' e 'total' (s),
+    o indicador 'alterado' e o 'caminho' do arquivo
+    '''
+
+    pool = ProcessPoolExecutor if processos else ThreadPoolExecutor
+    jobs = [dict(job, plotlyjs=plotlyjs, pagina=pagina is not None) for job in jobs]
+    registros = _le_manifesto(manifesto) if manifesto is not None else {}
+    divs = {}
+    tempos = {}
+
+    pendentes = []
+    for job in jobs:
+        if manifesto is None:
+            pendentes.append(job)
+            continue
+        job['hash_entrada'] = input_hash(job)
+        registro = registros.get(job['caminho'], {})
+        na_pagina = job['pagina'] and job['formato'] in FORMATOS_HTML
+        if not na_pagina and registro.get('entrada') == job['hash_entrada'] and os.path.exists(job['caminho']):
+            tempos[job['nome']] = dict(build=0.0, write=0.0, total=0.0, alterado=False, caminho=job['caminho'])
+            record_span(job['nome'], 'grafico', 0.0, caminho=job['caminho'], alterado=False, status='inalterado')
+            logger.info(f'gráfico {job["nome"]} inalterado - entradas iguais às da última execução')
+            continue
+        job['hash_saida'] = registro.get('saida')
+        pendentes.append(job)
+
+    encerrar = executor is None
+    executor = executor or pool(max_workers=max_workers)
+    try:
+        future_jobs = {executor.submit(_build_chart, job): job for job in pendentes}
+
+        for task in as_completed(future_jobs):
+
+            job = future_jobs[task]
+            try:
+                fig, t_build, t_write, hash_saida, alterado = task.result()
+            except Exception as exc:
+                record_span(job['nome'], 'grafico', 0.0, caminho=job['caminho'], status='erro')
+                logger.error(f'{job["nome"]} generated an exception: {exc}')
+                raise
+
+            if isinstance(fig, str):
+                divs[job['nome']] = fig
+            elif fig is not None:
+                t0 = time.perf_counter()
+                conteudo = pio.to_image(fig, format=job['formato'])
+                hash_saida, alterado = write_if_changed(job['caminho'], conteudo, job.get('hash_saida'))
+                t_write = time.perf_counter() - t0
+
+            if hash_saida is not None:
+                registros[job['caminho']] = dict(entrada=job.get('hash_entrada'), saida=hash_saida)
+
+            tempos[job['nome']] = dict(build=t_build, write=t_write, total=t_build + t_write, alterado=alterado,
+                                       caminho=job['caminho'])
+            record_span(job['nome'], 'grafico', t_build + t_write, caminho=job['caminho'], construcao=round(t_build, 6),
+                        gravacao=round(t_write, 6), alterado=alterado, status='ok')
+            logger.info(f'gráfico {job["nome"]} gerado - construção: {t_build:.3f}s, gravação: {t_write:.3f}s'
+                        f'{"" if alterado else " (conteúdo inalterado)"}')
+    finally:
+        if encerrar:
+            executor.shutdown()
+
+    if manifesto is not None:
+        registros = _poda_manifesto(registros, [job['caminho'] for job in jobs])
+        write_if_changed(manifesto, json.dumps(registros, indent=2, sort_keys=True).encode('utf-8'))
+
+    if alterados is not None:
+        with open(alterados, 'w') as f:
+            f.writelines(f'{job["caminho"]}\n' for job in jobs if tempos.get(job['nome'], {}).get('alterado'))
+
+    if pagina is not None:
+        write_panel_html([divs[job['nome']] for job in jobs if job['nome'] in divs], pagina, plotlyjs)
+        logger.info(f'página {pagina} gerada com {len(divs)} gráficos')
+
+    return tempos
+
+
+def render_fanout(paineis: dict, monta_jobs, logger, max_workers: int = None, executor=None, **kwargs) -> dict:
+    '''
+    Gera o mesmo conjunto de gráficos para vários painéis (ex: um por UF) em um único pool de processos. Os dados de
+    todos os painéis são guardados em COMPARTILHADOS antes da criação do pool: com o fork, os workers herdam esses dados
+    sem cópia (copy-on-write) e cada job leva apenas a referência aos seus argumentos (ver shared). Com um pool já
+    criado (modo residente), cujos workers não enxergam os dados atuais, ou onde o fork não está disponível, os
+    argumentos (recortes pequenos de cada painel) são serializados em cada job
+    :param paineis: dicionário cuja chave identifica o painel e o valor é um dict com os argumentos dos builders
+    :param monta_jobs: função (painel, argumentos) -> lista de chart_job. Os argumentos recebidos são referências
+    (ver shared), a serem repassadas aos builders
+    :param logger: biblioteca para registrar os passos e os tempos de cada gráfico
+    :param max_workers: quantidade de workers. Não sendo informado, usa a quantidade de CPUs
+    :param executor: pool de processos já criado, reaproveitado (ver render_charts). Não sendo informado, é criado um
+    pool com fork, encerrado ao final
+    :param kwargs: demais argumentos de render_charts (plotlyjs, manifesto etc)
+    :return: retorno de render_charts, com os gráficos de todos os painéis
+    '''
+
+    COMPARTILHADOS.clear()
+    jobs = []
+    for painel, argumentos in paineis.items():
+        COMPARTILHADOS.update({(painel, nome): valor for nome, valor in argumentos.items()})
+        jobs += monta_jobs(painel, {nome: shared(painel, nome) for nome in argumentos})
+
+    encerrar = executor is None
+    if executor is None and 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        jobs = [dict(job, kwargs=_resolve_kwargs(job['kwargs'])) for job in jobs]
+        executor = executor or ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        return render_charts(jobs, logger, executor=executor, **kwargs)
+    finally:
+        if encerrar:
+            executor.shutdown()
+        COMPARTILHADOS.clear()
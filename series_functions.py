@@ -0,0 +1,225 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import numpy as np
+import pandas as pd
+
+
+# Métricas de estados e municípios carregadas nos painéis
+METRICAS_UF = ['newCases', 'newDeaths', 'totalCases', 'deaths', 'recovered', 'tests', 'vaccinated',
+               'vaccinated_second']
+METRICAS_CITIES = ['newCases', 'newDeaths', 'totalCases', 'deaths', 'totalCases_per_100k_inhabitants']
+# Janela (dias) das médias móveis e do crescimento
+JANELA = 7
+# Base das taxas per capita
+BASE_PER_CAPITA = 100000
+
+
+# --------------------------------------------------------------------------------------------
+# Montagem dos painéis: arrays densos (data x chave) por métrica
+# --------------------------------------------------------------------------------------------
+def build_panel(df, chave: str, metricas: list, campo_data: str = 'date', dtype=np.float64) -> dict:
+    '''
+    Converte um DataFrame no formato longo (uma linha por data e chave) em arrays NumPy densos, um por métrica, com
+    uma linha por dia (eixo contínuo, do primeiro ao último dia) e uma coluna por chave. Combinações inexistentes na
+    origem ficam como NaN
+    :param df: DataFrame no formato longo (ex: cases-brazil-states, cases-brazil-cities-time)
+    :param chave: coluna que identifica a série (ex: 'state', 'ibgeID')
+    :param metricas: lista com as colunas a serem convertidas
+    :param campo_data: nome do campo de data
+    :param dtype: tipo dos arrays
+    :return: dicionário com 'datas' (DatetimeIndex), 'chaves' (Index) e 'metricas' (nome -> array data x chave)
+    '''
+
+    datas = df[campo_data].to_numpy(dtype='datetime64[D]')
+    inicio = datas.min()
+    linhas = (datas - inicio).astype(np.int64)
+
+    # a coluna chave pode ser categórica (ver SCHEMAS) - a fatoração é feita sobre os valores
+    colunas, chaves = pd.factorize(np.asarray(df[chave]), sort=True)
+
+    forma = (int(linhas.max()) + 1, len(chaves))
+    painel = {}
+    for metrica in metricas:
+        arr = np.full(forma, np.nan, dtype=dtype)
+        arr[linhas, colunas] = df[metrica].to_numpy(dtype=dtype, na_value=np.nan)
+        painel[metrica] = arr
+
+    return {
+        'datas': pd.date_range(inicio, periods=forma[0], freq='D'),
+        'chaves': pd.Index(chaves, name=chave),
+        'metricas': painel,
+    }
+
+
+# --------------------------------------------------------------------------------------------
+# Operações vetorizadas ao longo do eixo das datas (axis 0), para todas as chaves de uma vez
+# --------------------------------------------------------------------------------------------
+def diff(arr, periodos: int = 1) -> 'ndarray':
+    '''
+    Diferença entre cada dia e o dia 'periodos' anterior (equivalente a DataFrame.diff)
+    '''
+
+    out = np.full_like(arr, np.nan)
+    out[periodos:] = arr[periodos:] - arr[:-periodos]
+
+    return out
+
+
+def rolling_mean(arr, janela: int = JANELA) -> 'ndarray':
+    '''
+    Média móvel de 'janela' dias, calculada com somas acumuladas. Janelas com algum NaN resultam em NaN (equivalente a
+    DataFrame.rolling(janela).mean())
+    '''
+
+    validos = ~np.isnan(arr)
+    zeros = np.zeros((1, arr.shape[1]))
+    soma = np.concatenate([zeros, np.cumsum(np.where(validos, arr, 0), axis=0)])
+    qtd = np.concatenate([zeros, np.cumsum(validos, axis=0)])
+
+    out = np.full_like(arr, np.nan)
+    completas = qtd[janela:] - qtd[:-janela] == janela
+    out[janela - 1:] = np.where(completas, soma[janela:] - soma[:-janela], np.nan) / janela
+
+    return out
+
+
+def growth(arr, periodos: int = JANELA) -> 'ndarray':
+    '''
+    Crescimento relativo entre cada dia e o dia 'periodos' anterior (equivalente a DataFrame.pct_change). Divisões
+    por zero resultam em NaN
+    '''
+
+    out = np.full_like(arr, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[periodos:] = arr[periodos:] / arr[:-periodos] - 1
+    out[~np.isfinite(out)] = np.nan
+
+    return out
+
+
+def per_capita(arr, populacao, base: int = BASE_PER_CAPITA) -> 'ndarray':
+    '''
+    Taxa por 'base' habitantes
+    :param arr: array data x chave
+    :param populacao: array com a população de cada chave, na ordem das colunas de arr
+    :param base: quantidade de habitantes da taxa
+    '''
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return arr / np.asarray(populacao, dtype=arr.dtype)[np.newaxis, :] * base
+
+
+def ffill(arr) -> 'ndarray':
+    '''
+    Preenche os NaN com o último valor válido anterior de cada chave (equivalente a DataFrame.ffill)
+    '''
+
+    idx = np.where(~np.isnan(arr), np.arange(arr.shape[0])[:, np.newaxis], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+
+    return arr[idx, np.arange(arr.shape[1])]
+
+
+# --------------------------------------------------------------------------------------------
+# Painéis de estados e municípios
+# --------------------------------------------------------------------------------------------
+def _derivadas(painel: dict, populacao) -> dict:
+    '''
+    Acrescenta ao painel as médias móveis, o crescimento semanal, as diferenças diárias e as taxas per capita
+    '''
+
+    m = painel['metricas']
+    m['newCases_7d'] = rolling_mean(m['newCases'])
+    m['newDeaths_7d'] = rolling_mean(m['newDeaths'])
+    m['newCases_growth_7d'] = growth(m['newCases_7d'])
+    m['newDeaths_growth_7d'] = growth(m['newDeaths_7d'])
+    m['totalCases_per_100k'] = per_capita(m['totalCases'], populacao)
+    m['deaths_per_100k'] = per_capita(m['deaths'], populacao)
+    m['newCases_7d_per_100k'] = per_capita(m['newCases_7d'], populacao)
+    painel['populacao'] = pd.Series(populacao, index=painel['chaves'])
+
+    return painel
+
+
+def state_panel(df, df_popuf) -> dict:
+    '''
+    Monta o painel das UFs a partir do conjunto de dados cases-brazil-states, com as métricas de casos, óbitos e
+    vacinação, médias móveis, crescimento semanal e taxas per capita
+    :param df: dataframe com dados sobre a covid do Brasil e das UFs
+    :param df_popuf: dataframe com dados sobre a população estimada por UF
+    :return: dicionário com o painel (ver build_panel) e a 'populacao' de cada UF
+    '''
+
+    painel = build_panel(df[df['state'] != 'TOTAL'], 'state', METRICAS_UF)
+    populacao = df_popuf.set_index('UF')['POPULACAO'].reindex(painel['chaves']).to_numpy(dtype=np.float64)
+    _derivadas(painel, populacao)
+
+    m = painel['metricas']
+    m['newVaccinated'] = diff(m['vaccinated'])
+    m['newVaccinated_second'] = diff(m['vaccinated_second'])
+    m['1_dose_7d'] = rolling_mean(m['newVaccinated'])
+    m['2_dose_7d'] = rolling_mean(m['newVaccinated_second'])
+    m['perc_vac'] = per_capita(m['vaccinated'], populacao, base=100)
+
+    return painel
+
+
+def city_panel(df_cities) -> dict:
+    '''
+    Monta o painel dos municípios a partir do histórico do conjunto de dados cases-brazil-cities-time, com as métricas
+    de casos e óbitos, médias móveis, crescimento semanal e taxas per capita. A população de cada município é obtida da
+    própria origem (totalCases / totalCases_per_100k_inhabitants), no último dia com valor válido
+    :param df_cities: dataframe com o histórico de covid por município
+    :return: dicionário com o painel (ver build_panel) e a 'populacao' de cada município
+    '''
+
+    # apenas os municípios (código IBGE de 7 dígitos) - exclui o TOTAL e os casos sem localização definida na UF
+    painel = build_panel(df_cities[df_cities['ibgeID'] >= 1000000], 'ibgeID', METRICAS_CITIES)
+
+    m = painel['metricas']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estimativa = m['totalCases'] / m.pop('totalCases_per_100k_inhabitants') * BASE_PER_CAPITA
+    estimativa[~np.isfinite(estimativa)] = np.nan
+    populacao = np.round(ffill(estimativa)[-1])
+
+    return _derivadas(painel, populacao)
+
+
+# --------------------------------------------------------------------------------------------
+# Conversão dos painéis para DataFrames, no formato usado pelos builders de graph_functions
+# --------------------------------------------------------------------------------------------
+def panel_frame(painel: dict, chave, metricas: list = None) -> 'DataFrame':
+    '''
+    Série temporal de uma única chave (UF ou município), no mesmo formato de df_br (coluna 'date' e uma coluna por
+    métrica), para gerar as versões por UF/município dos gráficos nacionais
+    :param painel: painel (ver build_panel)
+    :param chave: UF ou ibgeID
+    :param metricas: lista das métricas. Não sendo informada, retorna todas
+    :return: Pandas DataFrame
+    '''
+
+    coluna = painel['chaves'].get_loc(chave)
+    metricas = metricas or list(painel['metricas'])
+    _df = pd.DataFrame({metrica: painel['metricas'][metrica][:, coluna] for metrica in metricas})
+    _df.insert(0, 'date', painel['datas'])
+
+    return _df
+
+
+def latest_frame(painel: dict, metricas: list = None) -> 'DataFrame':
+    '''
+    Valores do último dia de todas as chaves, uma linha por chave (equivalente ao filtro date == max())
+    :param painel: painel (ver build_panel)
+    :param metricas: lista das métricas. Não sendo informada, retorna todas
+    :return: Pandas DataFrame
+    '''
+
+    metricas = metricas or list(painel['metricas'])
+    _df = pd.DataFrame({metrica: painel['metricas'][metrica][-1] for metrica in metricas}, index=painel['chaves'])
+    _df.insert(0, 'date', painel['datas'][-1])
+
+    return _df.reset_index()
@@ -0,0 +1,184 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+import pandas as pd
+
+
+# DataFrames exportados também em Feather (sem compressão), que pode ser aberto com memory map - os mais lidos pelos
+# demais consumidores (notebook, API). Todos são exportados em Parquet
+SNAPSHOTS_QUENTES = ('df_br', 'df_uf')
+# Quantidade de versões mantidas em disco - versões anteriores continuam legíveis por quem já as abriu
+VERSOES_MANTIDAS = 3
+MANIFESTO = 'manifest.json'
+
+
+# --------------------------------------------------------------------------------------------
+# Versão dos snapshots
+# --------------------------------------------------------------------------------------------
+def snapshot_version(frames: dict) -> str:
+    '''
+    Versão de um conjunto de DataFrames: data mais recente do df_br (quando houver) e hash do conteúdo (colunas, tipos,
+    índice e valores) de todos os DataFrames. Mesmos dados resultam na mesma versão
+    :param frames: dicionário nome -> DataFrame
+    :return: versão no formato AAAAMMDD-<hash> (ou apenas o hash)
+    '''
+
+    h = hashlib.sha256()
+    for nome in sorted(frames):
+        df = frames[nome]
+        h.update(nome.encode())
+        h.update(repr([(col, str(tipo)) for col, tipo in df.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+    versao = h.hexdigest()[:12]
+    if 'df_br' in frames and 'date' in frames['df_br'] and len(frames['df_br']):
+        versao = f'{frames["df_br"]["date"].max():%Y%m%d}-{versao}'
+
+    return versao
+
+
+def read_manifest(destino_dir: str) -> dict:
+    '''
+    Lê o manifesto dos snapshots
+    :param destino_dir: diretório dos snapshots
+    :return: manifesto (ver write_snapshots), ou dicionário vazio se ainda não houver snapshots
+    '''
+
+    try:
+        with open(os.path.join(destino_dir, MANIFESTO)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# --------------------------------------------------------------------------------------------
+# Exportação
+# --------------------------------------------------------------------------------------------
+def _descreve(df, caminhos: dict) -> dict:
+    '''
+    Entrada de um DataFrame no manifesto: linhas, colunas com seus tipos e arquivos (caminho relativo e tamanho)
+    '''
+
+    return {
+        'linhas': len(df),
+        'colunas': {str(col): str(tipo) for col, tipo in df.dtypes.items()},
+        'arquivos': {formato: {'caminho': caminho, 'bytes': os.path.getsize(caminho_abs)}
+                     for formato, (caminho, caminho_abs) in caminhos.items()},
+    }
+
+
+def write_snapshots(frames: dict, destino_dir: str, quentes: tuple = SNAPSHOTS_QUENTES,
+                    manter: int = VERSOES_MANTIDAS, logger=None) -> dict:
+    '''
+    Exporta os DataFrames transformados como snapshots colunares versionados: Parquet para todos e Feather sem compressão
+    (memory map) para os mais lidos, em destino_dir/<versão>/, e um manifesto (destino_dir/manifest.json) com a versão
+    atual, os arquivos e o esquema de cada DataFrame. A versão é gravada em um diretório temporário e só então renomeada
+    e registrada no manifesto, de forma que os leitores nunca vejam uma versão incompleta. Se os dados não mudaram
+    (mesma versão), nada é gravado
+    :param frames: dicionário nome -> DataFrame (ex: df_br, df_cities, df_popuf, df_uf)
+    :param destino_dir: diretório dos snapshots
+    :param quentes: nomes dos DataFrames exportados também em Feather
+    :param manter: quantidade de versões mantidas em disco
+    :param logger: biblioteca para registrar os passos da exportação
+    :return: manifesto, ou None se o pyarrow não estiver instalado
+    '''
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.feather as feather
+    except ImportError:
+        if logger is not None:
+            logger.warning('pyarrow não instalado - snapshots não exportados')
+        return None
+
+    versao = snapshot_version(frames)
+    manifesto = read_manifest(destino_dir)
+    if manifesto.get('versao') == versao and os.path.isdir(os.path.join(destino_dir, versao)):
+        if logger is not None:
+            logger.info(f'snapshots inalterados - versão {versao}')
+        return manifesto
+
+    dir_versao = os.path.join(destino_dir, versao)
+    tmp = f'{dir_versao}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    descricoes = {}
+    for nome, df in frames.items():
+        # uma única conversão para Arrow, usada pelos dois formatos (o índice é preservado nos metadados)
+        tabela = pa.Table.from_pandas(df)
+        caminhos = {'parquet': f'{nome}.parquet'}
+        pq.write_table(tabela, os.path.join(tmp, caminhos['parquet']))
+        if nome in quentes:
+            caminhos['feather'] = f'{nome}.feather'
+            feather.write_feather(tabela, os.path.join(tmp, caminhos['feather']), compression='uncompressed')
+        descricoes[nome] = _descreve(df, {formato: (os.path.join(versao, arquivo), os.path.join(tmp, arquivo))
+                                          for formato, arquivo in caminhos.items()})
+
+    shutil.rmtree(dir_versao, ignore_errors=True)
+    os.replace(tmp, dir_versao)
+
+    versoes = [versao] + [v for v in manifesto.get('versoes', []) if v != versao]
+    manifesto = {
+        'versao': versao,
+        'gerado_em': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'frames': descricoes,
+        'versoes': versoes[:manter],
+    }
+    tmp_manifesto = os.path.join(destino_dir, MANIFESTO + '.tmp')
+    with open(tmp_manifesto, 'w') as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(tmp_manifesto, os.path.join(destino_dir, MANIFESTO))
+
+    # versões antigas são removidas apenas depois que o manifesto já aponta para a nova
+    for antiga in versoes[manter:]:
+        shutil.rmtree(os.path.join(destino_dir, antiga), ignore_errors=True)
+
+    if logger is not None:
+        logger.info(f'snapshots exportados - versão {versao}: ' +
+                    ', '.join(f'{nome} ({d["linhas"]} linhas)' for nome, d in descricoes.items()))
+
+    return manifesto
+
+
+# --------------------------------------------------------------------------------------------
+# Leitura pelos demais consumidores
+# --------------------------------------------------------------------------------------------
+def read_snapshot(destino_dir: str, nome: str, versao: str = None, colunas: list = None, tabela: bool = False):
+    '''
+    Abre o snapshot de um DataFrame. O Feather, quando exportado, é aberto com memory map (sem cópia para o pyarrow.Table
+    e sem leitura do arquivo inteiro); senão, é lido o Parquet
+    :param destino_dir: diretório dos snapshots
+    :param nome: nome do DataFrame (ex: 'df_br')
+    :param versao: versão do snapshot (ver manifesto). Não sendo informada, usa a versão atual
+    :param colunas: colunas a serem lidas (None = todas)
+    :param tabela: se True, retorna o pyarrow.Table em vez de converter para DataFrame
+    :return: Pandas DataFrame (ou pyarrow.Table)
+    '''
+
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    manifesto = read_manifest(destino_dir)
+    if versao is None:
+        versao = manifesto['versao']
+    arquivos = manifesto['frames'][nome]['arquivos'] if versao == manifesto.get('versao') else \
+        {'feather': {'caminho': os.path.join(versao, f'{nome}.feather')},
+         'parquet': {'caminho': os.path.join(versao, f'{nome}.parquet')}}
+
+    caminho = os.path.join(destino_dir, arquivos.get('feather', {}).get('caminho', ''))
+    if 'feather' in arquivos and os.path.exists(caminho):
+        dados = feather.read_table(caminho, columns=colunas, memory_map=True)
+    else:
+        dados = pq.read_table(os.path.join(destino_dir, arquivos['parquet']['caminho']), columns=colunas)
+
+    return dados if tabela else dados.to_pandas()
@@ -0,0 +1,197 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import json
+import base64
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:     # opcional: sem o orjson, a serialização usa o encoder do plotly
+    orjson = None
+
+
+# Partes do layout comuns aos gráficos de barras/linhas. A ordem das chaves é a mesma gerada pelo plotly após a
+# validação da figura, para que o json seja idêntico ao de fig.to_json()
+LEGENDA = {'font': {'size': 10}, 'x': 0.01, 'y': 0.9, 'traceorder': 'normal'}
+MARGEM = {'l': 0, 'r': 0, 't': 30, 'b': 0}
+LAYOUT_BASE = {'hovermode': 'x unified', 'separators': ',.', 'plot_bgcolor': '#fafafa'}
+HOVER_VALOR = '%{y:,.0f}'
+
+# Typed arrays em base64 ({'dtype': ..., 'bdata': ...}) só são decodificados a partir do plotly.js 2.28 - com versões
+# anteriores do plotly.js, os arrays continuam serializados como listas de números
+TYPED_ARRAYS = tuple(int(parte) for parte in get_plotlyjs_version().split('.')[:2]) >= (2, 28)
+# Tipos numéricos aceitos pelo plotly.js nos typed arrays (não há inteiros de 64 bits)
+TIPOS_TYPED_ARRAY = ('i1', 'u1', 'i2', 'u2', 'i4', 'u4', 'f4', 'f8')
+
+# Template padrão do plotly (pio.templates.default), montado uma única vez por processo
+_TEMPLATE = {}
+
+
+# --------------------------------------------------------------------------------------------
+# Conversão dos valores
+# --------------------------------------------------------------------------------------------
+def array(valores):
+    '''
+    Converte uma série (Series, Index ou array) para um valor serializável: arrays numéricos são mantidos (o orjson os
+    serializa diretamente), datas viram texto no formato ISO usado pelo plotly e os demais tipos viram listas
+    :param valores: série de valores
+    :return: array numpy numérico ou lista
+    '''
+
+    valores = valores.to_numpy() if isinstance(valores, (pd.Series, pd.Index)) else np.asarray(valores)
+    if np.issubdtype(valores.dtype, np.datetime64):
+        return np.datetime_as_string(valores, unit='s').tolist()
+    if valores.dtype.kind in 'biuf':
+        return np.ascontiguousarray(valores)
+
+    return valores.tolist()
+
+
+def typed_array(valores):
+    '''
+    Codifica um array numérico como typed array do plotly.js: os bytes do array (little-endian) em base64, com o tipo,
+    em vez de uma lista de números em texto. Tipos não aceitos pelo plotly.js (ex: int64) são convertidos para float64.
+    Sem suporte no plotly.js incluído (ver TYPED_ARRAYS), ou para arrays não numéricos, retorna os valores sem alteração
+    :param valores: array numpy
+    :return: dicionário {'dtype', 'bdata'} ou os próprios valores
+    '''
+
+    valores = np.asarray(valores)
+    if not TYPED_ARRAYS or valores.dtype.kind not in 'iuf':
+        return valores
+
+    tipo = valores.dtype.str[1:]
+    if tipo not in TIPOS_TYPED_ARRAY:
+        valores, tipo = valores.astype(np.float64), 'f8'
+    valores = np.ascontiguousarray(valores, dtype=valores.dtype.newbyteorder('<'))
+
+    return {'dtype': tipo, 'bdata': base64.b64encode(valores.tobytes()).decode('ascii')}
+
+
+def _valor(valor):
+    '''
+    Converte um valor de trace ou anotação para um tipo serializável (ver array)
+    '''
+
+    if isinstance(valor, (pd.Series, pd.Index, np.ndarray)):
+        return array(valor)
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+
+    return valor
+
+
+# --------------------------------------------------------------------------------------------
+# Montagem da figura
+# --------------------------------------------------------------------------------------------
+def template() -> dict:
+    '''
+    Template padrão do plotly, incluído no layout de todas as figuras como faz o go.Figure
+    :return: dicionário do template (vazio quando não há template padrão)
+    '''
+
+    if not _TEMPLATE and pio.templates.default:
+        _TEMPLATE.update(pio.templates[pio.templates.default].to_plotly_json())
+
+    return _TEMPLATE
+
+
+def trace(tipo: str, eixo_y: str = None, atualizacao: dict = None, **props) -> dict:
+    '''
+    Monta um trace. As propriedades ficam em ordem alfabética (como no construtor do go.Bar/go.Scatter), seguidas do
+    tipo, dos eixos (subplots) e das propriedades aplicadas depois a todos os traces (fig.update_traces)
+    :param tipo: 'bar' ou 'scatter'
+    :param eixo_y: eixo y do trace em figuras com eixo secundário ('y' ou 'y2'). Não sendo informado, o trace não
+    recebe eixos
+    :param atualizacao: propriedades comuns aos traces da figura, já na ordem gerada pelo plotly
+    :param props: propriedades do trace (x, y, name, line etc)
+    :return: dicionário do trace
+    '''
+
+    spec = {chave: _valor(props[chave]) for chave in sorted(props)}
+    spec['type'] = tipo
+    if eixo_y is not None:
+        spec['xaxis'], spec['yaxis'] = 'x', eixo_y
+    spec.update(atualizacao or {})
+
+    return spec
+
+
+def annotation(**props) -> dict:
+    '''
+    Monta uma anotação do layout, com as propriedades em ordem alfabética
+    '''
+
+    return {chave: _valor(props[chave]) for chave in sorted(props)}
+
+
+def title(texto: str) -> dict:
+    '''
+    Título dos gráficos, alinhado à área do gráfico
+    '''
+
+    return {'pad': {'l': 150}, 'text': texto, 'xref': 'paper'}
+
+
+def vline(x, **props) -> dict:
+    '''
+    Linha vertical do layout (layout.shapes) na posição x do eixo x, de uma extremidade à outra do eixo y - a mesma
+    forma gerada por fig.add_vline
+    :param x: posição da linha no eixo x
+    :param props: demais propriedades da forma (ex: line)
+    :return: dicionário da forma
+    '''
+
+    return dict({chave: _valor(props[chave]) for chave in sorted(props)}, type='line', x0=_valor(x), x1=_valor(x),
+                xref='x', y0=0, y1=1, yref='y domain')
+
+
+def secondary_axes(titulo_y: str, titulo_y2: str, **eixo_x) -> dict:
+    '''
+    Eixos de uma figura com eixo y secundário, equivalentes aos de make_subplots(specs=[[{"secondary_y": True}]])
+    :param titulo_y: título do eixo y principal
+    :param titulo_y2: título do eixo y secundário
+    :param eixo_x: demais propriedades do eixo x (tickformat, type)
+    :return: dicionário com 'xaxis', 'yaxis' e 'yaxis2'
+    '''
+
+    return {
+        'xaxis': dict({'anchor': 'y', 'domain': [0.0, 0.94]}, **eixo_x),
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': titulo_y}},
+        'yaxis2': {'anchor': 'x', 'overlaying': 'y', 'side': 'right', 'title': {'text': titulo_y2}},
+    }
+
+
+def figure(traces: list, layout: dict) -> dict:
+    '''
+    Monta a figura (mesma estrutura de fig.to_dict()) sem criar e validar os objetos do plotly
+    :param traces: lista de traces (ver trace)
+    :param layout: layout da figura, na ordem gerada pelo plotly
+    :return: dicionário com 'data' e 'layout'
+    '''
+
+    modelo = template()
+    return {'data': traces, 'layout': dict({'template': modelo}, **layout) if modelo else layout}
+
+
+def to_json(spec: dict) -> str:
+    '''
+    Serializa a figura com o orjson, quando instalado, ou com o encoder do plotly
+    :param spec: figura (ver figure)
+    :return: json da figura
+    '''
+
+    if orjson is not None:
+        return orjson.dumps(spec, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    return json.dumps(spec, cls=PlotlyJSONEncoder, separators=(',', ':'))
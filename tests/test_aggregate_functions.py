@@ -0,0 +1,53 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import numpy as np
+import pandas as pd
+import pytest
+import aggregate_functions as ag
+
+
+def _df_br(dias: int = 300) -> 'DataFrame':
+    '''
+    Série nacional sintética no formato de df_br (transform_dfbr), com a vacinação a partir do dia 200
+    '''
+
+    n = np.arange(dias)
+    df = pd.DataFrame({'date': pd.date_range('2020-03-01', periods=dias, freq='D')})
+    df['newDeaths'] = n % 17
+    df['newCases'] = n * 3
+    df['vaccinated'] = np.where(n > 200, (n - 200) * 1e6, np.nan)
+    df['vaccinated_second'] = df['vaccinated'] / 2
+    df['newVaccinated'] = df['vaccinated'].diff()
+    df['newVaccinated_second'] = df['vaccinated_second'].diff()
+    return df
+
+
+def _confere(agregados: dict, esperado: dict):
+    for chave in ('diario', 'semanal', 'mensal'):
+        pd.testing.assert_frame_equal(agregados[chave], esperado[chave], check_freq=False)
+    assert agregados['marcos'] == esperado['marcos']
+    assert agregados['hwm'] == esperado['hwm']
+
+
+def test_atualizacao_incremental_igual_ao_calculo_completo():
+    df = _df_br()
+    anterior = ag.build_aggregates(df.iloc[:250])
+    _confere(ag.update_aggregates(df, anterior), ag.build_aggregates(df))
+
+
+def test_revisao_antiga_recalcula_o_historico(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = _df_br()
+    ag.aggregate_store(df.iloc[:280], dir_agregados=str(tmp_path))
+
+    # correção de um dia muito anterior aos 30 dias finais
+    revisado = df.copy()
+    revisado.loc[10, 'newCases'] += 100000
+    agregados = ag.aggregate_store(revisado, dir_agregados=str(tmp_path))
+
+    _confere(agregados, ag.build_aggregates(revisado))
+    _confere(ag.load_aggregates(str(tmp_path)), ag.build_aggregates(revisado))
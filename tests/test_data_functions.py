@@ -0,0 +1,79 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import pandas as pd
+import pytest
+import data_functions as df_func
+
+pytest.importorskip('pyarrow')
+
+
+DATAS = pd.date_range('2020-03-01', periods=400, freq='D')
+UFS = ('AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB', 'PE', 'PI', 'PR', 'RJ',
+       'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO', 'TOTAL')
+
+
+def _states(dias: int) -> 'DataFrame':
+    '''
+    Série sintética no formato do states.csv (ordenada por data), com os primeiros 'dias' dias
+    '''
+
+    linhas = [{'date': f'{data:%Y-%m-%d}', 'state': uf, 'newCases': (i + 1) * (j + 2), 'totalCases': (i + 1) * 100}
+              for i, data in enumerate(DATAS[:dias]) for j, uf in enumerate(UFS)]
+    return pd.DataFrame(linhas)
+
+
+@pytest.fixture
+def construcoes(monkeypatch):
+    '''
+    Conta as construções completas do cache
+    '''
+
+    chamadas = []
+    original = df_func._build_cache
+
+    def _build_cache(*args, **kwargs):
+        chamadas.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(df_func, '_build_cache', _build_cache)
+    return chamadas
+
+
+def _carrega(origem, cache_dir):
+    return df_func.load_incremental(str(origem), 'df_br', str(cache_dir), chunk_size=2000, linhas_por_parte=5000)
+
+
+def _confere(origem, carregado):
+    esperado = df_func.load_data(str(origem), date_f=['date'])
+    pd.testing.assert_frame_equal(carregado.reset_index(drop=True), esperado.reset_index(drop=True))
+
+
+def test_atualizacao_incremental_sem_reconstrucao(tmp_path, construcoes):
+    origem = tmp_path / 'states.csv'
+    for dias in (300, 301, 305, 305, 310):
+        _states(dias).to_csv(origem, index=False)
+        _confere(origem, _carrega(origem, tmp_path / 'cache'))
+
+    assert len(construcoes) == 1
+
+
+def test_reescrita_de_dia_antigo_reconstroi_o_cache(tmp_path, construcoes):
+    origem = tmp_path / 'states.csv'
+    _states(380).to_csv(origem, index=False)
+    _carrega(origem, tmp_path / 'cache')
+    _states(385).to_csv(origem, index=False)
+    _carrega(origem, tmp_path / 'cache')
+    assert len(construcoes) == 1
+
+    # correção de um dia muito anterior à janela final (centenas de KB antes dela), com o mesmo tamanho em bytes
+    df = _states(386)
+    df.loc[df['date'] == f'{DATAS[4]:%Y-%m-%d}', 'newCases'] += 1
+    df.to_csv(origem, index=False)
+    carregado = _carrega(origem, tmp_path / 'cache')
+
+    assert len(construcoes) == 2
+    _confere(origem, carregado)
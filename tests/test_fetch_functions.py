@@ -0,0 +1,242 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import io
+import os
+import sys
+import gzip
+import hashlib
+import logging
+import threading
+import subprocess
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import data_functions as df_func
+import fetch_functions as ff
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Handler(SimpleHTTPRequestHandler):
+    '''
+    Servidor de arquivos com ETag (hash do conteúdo) e If-None-Match, além do Last-Modified/If-Modified-Since já
+    tratados pelo SimpleHTTPRequestHandler. Com 'comprime', responde com Content-Encoding: gzip aos clientes que o
+    aceitam (como faz o GitHub com os arquivos texto). Registra as requisições recebidas
+    '''
+
+    requisicoes = []
+    usa_etag = True
+    comprime = False
+
+    def send_head(self):
+        caminho = self.translate_path(self.path)
+        self.requisicoes.append((self.path, dict(self.headers)))
+        if self.comprime and 'gzip' in self.headers.get('Accept-Encoding', '') and os.path.isfile(caminho):
+            with open(caminho, 'rb') as f:
+                corpo = gzip.compress(f.read())
+            self.send_response(200)
+            self.send_header('Content-Type', self.guess_type(caminho))
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            return io.BytesIO(corpo)
+        if self.usa_etag and os.path.isfile(caminho):
+            with open(caminho, 'rb') as f:
+                etag = '"' + hashlib.sha256(f.read()).hexdigest()[:16] + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return None
+            self._etag = etag
+        return super().send_head()
+
+    def end_headers(self):
+        etag = self.__dict__.pop('_etag', None)
+        if etag:
+            self.send_header('ETag', etag)
+        super().end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    '''
+    Serve o diretório tmp_path/origem em uma thread. Retorna (endereço base, diretório servido, classe do handler)
+    '''
+
+    origem = tmp_path / 'origem'
+    origem.mkdir()
+    handler = type('HandlerTeste', (Handler,), {'requisicoes': [], 'usa_etag': True, 'comprime': False})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=str(origem)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/', origem, handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _escreve(caminho, conteudo: bytes, mtime: int):
+    caminho.write_bytes(conteudo)
+    os.utime(caminho, (mtime, mtime))
+
+
+def test_download_e_304_por_etag(servidor, tmp_path):
+    base, origem, handler = servidor
+    _escreve(origem / 'states.csv', b'date,state\n2021-05-20,SP\n', 1621500000)
+    destino = str(tmp_path / 'download')
+
+    primeira = ff.fetch_url(base + 'states.csv', 'states.csv', destino)
+    assert primeira['status'] == 'baixado'
+    assert primeira['sha256'] == hashlib.sha256(b'date,state\n2021-05-20,SP\n').hexdigest()
+    with open(primeira['caminho'], 'rb') as f:
+        assert f.read() == b'date,state\n2021-05-20,SP\n'
+
+    segunda = ff.fetch_url(base + 'states.csv', 'states.csv', destino)
+    assert segunda == dict(primeira, status='nao_modificado')
+    assert handler.requisicoes[-1][1]['If-None-Match'].startswith('"')
+    assert 'If-Modified-Since' in handler.requisicoes[-1][1]
+
+
+def test_304_por_last_modified(servidor, tmp_path):
+    base, origem, handler = servidor
+    handler.usa_etag = False
+    _escreve(origem / 'gps.csv', b'ibgeID,lat,lon\n', 1621500000)
+    destino = str(tmp_path / 'download')
+
+    primeira = ff.fetch_url(base + 'gps.csv', 'gps.csv', destino)
+    segunda = ff.fetch_url(base + 'gps.csv', 'gps.csv', destino)
+
+    assert (primeira['status'], segunda['status']) == ('baixado', 'nao_modificado')
+    assert 'If-None-Match' not in handler.requisicoes[-1][1]
+    assert segunda['sha256'] == primeira['sha256']
+
+
+def test_download_com_content_encoding_gzip(servidor, tmp_path):
+    '''
+    Resposta comprimida em trânsito (Content-Encoding: gzip): a cópia local e o hash são os do conteúdo descomprimido,
+    recebido em blocos
+    '''
+
+    base, origem, handler = servidor
+    handler.comprime = True
+    linhas = (b'2021-05-%02d,SP,%d\n' % (dia % 28 + 1, dia) for dia in range(50000))
+    conteudo = b'date,state,newCases\n' + b''.join(linhas)
+    _escreve(origem / 'states.csv', conteudo, 1621500000)
+    destino = str(tmp_path / 'download')
+
+    entrada = ff.fetch_url(base + 'states.csv', 'states.csv', destino)
+
+    assert 'gzip' in handler.requisicoes[-1][1]['Accept-Encoding']
+    assert entrada['status'] == 'baixado'
+    assert entrada['sha256'] == hashlib.sha256(conteudo).hexdigest()
+    with open(entrada['caminho'], 'rb') as f:
+        assert f.read() == conteudo
+    assert len(df_func.load_data(entrada['caminho'], date_f=['date'], chunksize=10000)) == 50000
+
+
+def test_download_de_arquivo_gzip(servidor, tmp_path):
+    '''
+    Arquivo .csv.gz (sem Content-Encoding): a cópia local é o próprio gzip, carregado em partes pelo load_data
+    '''
+
+    base, origem, _ = servidor
+    conteudo = b'date,city,deaths\n' + b''.join(b'2021-05-20,C%d,%d\n' % (i, i) for i in range(30000))
+    _escreve(origem / 'cities.csv.gz', gzip.compress(conteudo), 1621500000)
+    destino = str(tmp_path / 'download')
+
+    entrada = ff.fetch_url(base + 'cities.csv.gz', 'cities.csv.gz', destino)
+
+    with gzip.open(entrada['caminho'], 'rb') as f:
+        assert f.read() == conteudo
+    dados = df_func.load_data(entrada['caminho'], date_f=['date'], compression='gzip', chunksize=7000)
+    assert len(dados) == 30000 and dados['deaths'].sum() == sum(range(30000))
+
+
+def test_conteudo_alterado_muda_o_hash(servidor, tmp_path):
+    base, origem, _ = servidor
+    destino = str(tmp_path / 'download')
+    estado = str(tmp_path / 'download' / 'entradas-processadas.json')
+    urls = {'states.csv': base + 'states.csv', 'gps.csv': base + 'gps.csv'}
+    _escreve(origem / 'states.csv', b'date,state\n2021-05-20,SP\n', 1621500000)
+    _escreve(origem / 'gps.csv', b'ibgeID,lat,lon\n', 1621500000)
+
+    entradas = ff.fetch_inputs(urls, destino, logging)
+    assert sorted(ff.inputs_changed(entradas, estado)) == ['gps.csv', 'states.csv']
+    ff.save_inputs_state(entradas, estado)
+
+    # novo conteúdo com o mesmo tamanho e a mesma data de modificação: só o ETag e o SHA-256 mudam
+    _escreve(origem / 'states.csv', b'date,state\n2021-05-21,SP\n', 1621500000)
+    entradas = ff.fetch_inputs(urls, destino, logging)
+
+    assert entradas['states.csv']['status'] == 'baixado'
+    assert entradas['gps.csv']['status'] == 'nao_modificado'
+    assert ff.inputs_changed(entradas, estado) == ['states.csv']
+
+
+def test_mesmo_conteudo_baixado_novamente_nao_e_alteracao(servidor, tmp_path):
+    base, origem, handler = servidor
+    handler.usa_etag = False
+    destino = str(tmp_path / 'download')
+    estado = str(tmp_path / 'estado.json')
+    urls = {'states.csv': base + 'states.csv'}
+    _escreve(origem / 'states.csv', b'date,state\n2021-05-20,SP\n', 1621500000)
+
+    ff.save_inputs_state(ff.fetch_inputs(urls, destino, logging), estado)
+    # republicado com outra data de modificação, mas com o mesmo conteúdo
+    _escreve(origem / 'states.csv', b'date,state\n2021-05-20,SP\n', 1621600000)
+    entradas = ff.fetch_inputs(urls, destino, logging)
+
+    assert entradas['states.csv']['status'] == 'baixado'
+    assert ff.inputs_changed(entradas, estado) == []
+
+
+def test_saida_antecipada_sem_entradas_alteradas(servidor, tmp_path):
+    '''
+    Executa o script principal com as entradas servidas localmente e já processadas: deve terminar sem importar o pandas
+    e sem arquivos a publicar
+    '''
+
+    base, origem, handler = servidor
+    trabalho = tmp_path / 'trabalho'
+    trabalho.mkdir()
+    nomes = ['cases-brazil-states.csv', 'cases-brazil-cities-time.csv.gz', 'populacao_2020.xls', 'gps_cities.csv',
+             'brasil-uf-compressed.json']
+    for nome in nomes:
+        _escreve(origem / nome, nome.encode(), 1621500000)
+    ff.save_inputs_state(ff.fetch_inputs({nome: base + nome for nome in nomes},
+                                         str(trabalho / 'datasets' / 'download'), logging),
+                         str(trabalho / 'datasets' / 'download' / 'entradas-processadas.json'))
+    (trabalho / 'graficos').mkdir()
+    (trabalho / 'graficos' / 'alterados.txt').write_text('graficos/antigo.html\n')
+    n_requisicoes = len(handler.requisicoes)
+
+    # as entradas do script são redirecionadas para o servidor local
+    codigo = f'''
+import runpy, sys
+import fetch_functions
+original = fetch_functions.fetch_inputs
+fetch_functions.fetch_inputs = lambda urls, *args, **kwargs: original(
+    {{nome: {base!r} + nome for nome in urls}}, *args, **kwargs)
+sys.argv = ['graph_updates_covid19.py']
+try:
+    runpy.run_path({os.path.join(RAIZ, 'graph_updates_covid19.py')!r}, run_name='__main__')
+finally:
+    print('pandas importado' if 'pandas' in sys.modules else 'pandas não importado')
+'''
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=str(trabalho), capture_output=True, text=True,
+                           env=dict(os.environ, PYTHONPATH=RAIZ), timeout=60)
+
+    assert saida.returncode == 0, saida.stderr
+    assert saida.stdout.split() == ['OK!', 'pandas', 'não', 'importado']
+    assert (trabalho / 'graficos' / 'alterados.txt').read_text() == ''
+    assert (trabalho / 'graficos' / 'removidos.txt').read_text() == ''
+    assert len(handler.requisicoes) == n_requisicoes + len(nomes)
+    assert 'Nenhuma entrada foi alterada' in (trabalho / 'gera_graficos_covid.log').read_text()
@@ -0,0 +1,52 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import json
+import logging
+import pytest
+import render_functions as rf
+
+
+def grafico(valor):
+    return {'data': [{'type': 'bar', 'y': [valor]}], 'layout': {}}
+
+
+def _render(jobs, manifesto):
+    return rf.render_charts(jobs, logging, processos=False, manifesto=str(manifesto))
+
+
+def test_manifesto_remove_graficos_que_nao_sao_mais_gerados(tmp_path):
+    graficos = tmp_path / 'graficos'
+    (graficos / 'uf').mkdir(parents=True)
+    manifesto = graficos / 'manifesto.json'
+    a, b = str(graficos / 'a.html'), str(graficos / 'b.html')
+    # entradas de outro conjunto de gráficos (outro diretório): mantida se o arquivo existe, removida se não
+    outro, removido = graficos / 'uf' / 'c.html', str(graficos / 'uf' / 'd.html')
+    outro.write_text('<html></html>')
+    registro = {'entrada': 'x', 'saida': 'y'}
+    manifesto.write_text(json.dumps({str(outro): registro, removido: registro}))
+
+    _render([rf.chart_job('a', grafico, a, valor=1), rf.chart_job('b', grafico, b, valor=2)], manifesto)
+    assert set(json.loads(manifesto.read_text())) == {a, b, str(outro)}
+
+    _render([rf.chart_job('a', grafico, a, valor=1)], manifesto)
+    assert set(json.loads(manifesto.read_text())) == {a, str(outro)}
+
+
+def test_pagina_gravada_de_forma_atomica(tmp_path, monkeypatch):
+    pagina = tmp_path / 'painel.html'
+    rf.write_panel_html(['<div>1</div>'], str(pagina), None)
+    anterior = pagina.read_text()
+
+    # gravação interrompida antes da troca do arquivo: a página publicada continua íntegra
+    def _interrompe(*args):
+        raise OSError('interrompido')
+
+    monkeypatch.setattr(rf.os, 'replace', _interrompe)
+    with pytest.raises(OSError):
+        rf.write_panel_html(['<div>2</div>' * 1000], str(pagina), None)
+
+    assert pagina.read_text() == anterior
@@ -0,0 +1,162 @@
+########################################
+# @author: HALISSON SOUZA GOMIDES
+# halisson.gomides@gmail.com
+# ver: 1.0  21/05/2021
+########################################
+
+import os
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Estado do registro das etapas: arquivo JSON lines de destino, identificador da execução e métricas de cada etapa
+TRACE = {'arquivo': None, 'execucao': None, 'metricas': {}}
+_LOCK = threading.Lock()
+# Tamanho (bytes) a partir do qual o arquivo JSON lines é rotacionado - o anterior é mantido como <arquivo>.1
+TAMANHO_MAXIMO_TRACE = 16 * 2 ** 20
+
+
+# --------------------------------------------------------------------------------------------
+# Registro das etapas (spans) em JSON lines
+# --------------------------------------------------------------------------------------------
+def configure_tracing(arquivo: str = None, execucao: str = None, tamanho_maximo: int = TAMANHO_MAXIMO_TRACE):
+    '''
+    Configura o registro das etapas da execução. Se o arquivo já passou de tamanho_maximo, é rotacionado antes: o
+    conteúdo atual passa para <arquivo>.1 (substituindo o anterior) e a execução começa um arquivo novo
+    :param arquivo: arquivo JSON lines onde cada etapa é acrescentada (uma linha por etapa). Não sendo informado, as
+    etapas são mantidas apenas em memória (ver write_prometheus)
+    :param execucao: identificador da execução, repetido em todas as etapas. Não sendo informado, usa a data/hora
+    atual
+    :param tamanho_maximo: tamanho (bytes) a partir do qual o arquivo é rotacionado
+    '''
+
+    if arquivo is not None and os.path.isfile(arquivo) and os.path.getsize(arquivo) >= tamanho_maximo:
+        os.replace(arquivo, arquivo + '.1')
+
+    TRACE['arquivo'] = arquivo
+    TRACE['execucao'] = execucao or datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    TRACE['metricas'] = {}
+
+
+def peak_rss() -> int:
+    '''
+    Pico de memória residente (bytes) do processo até o momento
+    '''
+
+    # ru_maxrss é informado em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def record_span(nome: str, tipo: str, duracao: float, **atributos) -> dict:
+    '''
+    Registra uma etapa já medida
+    :param nome: nome da etapa (ex: nome do conjunto de dados ou do gráfico)
+    :param tipo: tipo da etapa: 'download', 'carga', 'transformacao', 'grafico' etc
+    :param duracao: duração da etapa (s)
+    :param atributos: demais atributos da etapa (ex: linhas, bytes_lidos, status)
+    :return: dicionário com o registro da etapa
+    '''
+
+    registro = dict(execucao=TRACE['execucao'], nome=nome, tipo=tipo, fim=time.time(), duracao=round(duracao, 6),
+                    rss_pico=peak_rss(), pid=os.getpid())
+    registro.update({chave: valor for chave, valor in atributos.items() if valor is not None})
+
+    with _LOCK:
+        TRACE['metricas'][(tipo, nome)] = registro
+        if TRACE['arquivo'] is not None:
+            with open(TRACE['arquivo'], 'a') as f:
+                f.write(json.dumps(registro, default=str) + '\n')
+
+    return registro
+
+
+@contextmanager
+def span(nome: str, tipo: str, **atributos):
+    '''
+    Mede e registra uma etapa. O dicionário retornado pode receber atributos durante a execução da etapa
+    (ex: registro['linhas'] = len(df)). Se a etapa gerar uma exceção, é registrada com status 'erro'
+    :param nome: nome da etapa
+    :param tipo: tipo da etapa (ver record_span)
+    :param atributos: atributos iniciais da etapa
+    '''
+
+    registro = dict(atributos, status='ok')
+    t0 = time.perf_counter()
+    try:
+        yield registro
+    except BaseException:
+        registro['status'] = 'erro'
+        raise
+    finally:
+        record_span(nome, tipo, time.perf_counter() - t0, **registro)
+
+
+def dataset_attributes(resultado, origem: str = None) -> dict:
+    '''
+    Atributos de uma etapa de carga ou transformação: linhas e memória do resultado e tamanho do arquivo de origem
+    :param resultado: resultado da etapa (DataFrame, dict etc)
+    :param origem: caminho do arquivo de origem lido pela etapa
+    :return: dicionário com 'linhas', 'bytes_memoria' e 'bytes_lidos', quando aplicáveis
+    '''
+
+    atributos = {}
+    if hasattr(resultado, '__len__'):
+        atributos['linhas'] = len(resultado)
+    if hasattr(resultado, 'memory_usage'):
+        atributos['bytes_memoria'] = int(resultado.memory_usage(deep=True).sum())
+    if origem is not None and os.path.isfile(origem):
+        atributos['bytes_lidos'] = os.path.getsize(origem)
+
+    return atributos
+
+
+# --------------------------------------------------------------------------------------------
+# Exportação das métricas no formato textfile do Prometheus (node_exporter)
+# --------------------------------------------------------------------------------------------
+def _rotulo(valor) -> str:
+    '''
+    Escapa o valor de um rótulo do Prometheus: barra invertida, aspas duplas e quebras de linha
+    '''
+
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(caminho: str, prefixo: str = 'painel_covid'):
+    '''
+    Grava as métricas das etapas registradas nesta execução no formato texto do Prometheus, para ser lido pelo
+    textfile collector do node_exporter. O arquivo é gravado de forma atômica
+    :param caminho: caminho do arquivo .prom
+    :param prefixo: prefixo do nome das métricas
+    '''
+
+    metricas = {
+        'duracao_segundos': ('gauge', 'Duração da etapa', 'duracao'),
+        'linhas': ('gauge', 'Linhas do resultado da etapa', 'linhas'),
+        'bytes_lidos': ('gauge', 'Tamanho do arquivo de origem lido pela etapa', 'bytes_lidos'),
+        'rss_pico_bytes': ('gauge', 'Pico de memória residente ao final da etapa', 'rss_pico'),
+    }
+
+    with _LOCK:
+        registros = list(TRACE['metricas'].values())
+
+    linhas = []
+    for metrica, (tipo, ajuda, campo) in metricas.items():
+        nome = f'{prefixo}_etapa_{metrica}'
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+        for registro in registros:
+            if campo in registro:
+                rotulos = (f'etapa="{_rotulo(registro["nome"])}",tipo="{_rotulo(registro["tipo"])}",'
+                           f'status="{_rotulo(registro.get("status", "ok"))}"')
+                linhas.append(f'{nome}{{{rotulos}}} {registro[campo]}')
+
+    nome = f'{prefixo}_ultima_execucao_timestamp_segundos'
+    linhas += [f'# HELP {nome} Data/hora do fim da última execução', f'# TYPE {nome} gauge', f'{nome} {time.time()}']
+
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(linhas) + '\n')
+    os.replace(tmp, caminho)